@@ -8,8 +8,40 @@ API_KEY=$(bashio::config 'api_key')
 AUTO_BACKUP=$(bashio::config 'auto_backup_enabled')
 BACKUP_TIME=$(bashio::config 'backup_time')
 RETENTION_DAYS=$(bashio::config 'retention_days')
+# List of objects: passed to Python as compact JSON
+BACKUP_TIERS=$(jq --compact-output '.backup_tiers // []' /data/options.json)
+LOCAL_MAX_BACKUPS=$(bashio::config 'local_max_backups')
+LOCAL_MAX_SIZE_GB=$(bashio::config 'local_max_size_gb')
+RETENTION_ALL_LOCAL_BACKUPS=$(bashio::config 'retention_all_local_backups')
+REMOTE_RETENTION_DAYS=$(bashio::config 'remote_retention_days')
+REMOTE_MAX_BACKUPS=$(bashio::config 'remote_max_backups')
+REMOTE_MAX_SIZE_GB=$(bashio::config 'remote_max_size_gb')
 INSTANCE_NAME=$(bashio::config 'instance_name')
 INSTANCE_ID=$(bashio::config 'instance_id')
+READ_LOCAL_BACKUPS=$(bashio::config 'read_local_backups')
+DOWNLOAD_MODE=$(bashio::config 'download_mode')
+UPLOAD_BUFFERS=$(bashio::config 'upload_buffers')
+UPLOAD_PARALLELISM=$(bashio::config 'upload_parallelism')
+UPLOAD_CHUNK_RETRIES=$(bashio::config 'upload_chunk_retries')
+COMPRESSION=$(bashio::config 'compression')
+COMPRESSION_LEVEL=$(bashio::config 'compression_level')
+COMPRESSION_THREADS=$(bashio::config 'compression_threads')
+ENCRYPTION=$(bashio::config 'encryption')
+ENCRYPTION_KEY=$(bashio::config 'encryption_key')
+CHUNKING=$(bashio::config 'chunking')
+ADAPTIVE_CHUNK_SIZE=$(bashio::config 'adaptive_chunk_size')
+CHUNK_SIZE_MIN=$(bashio::config 'chunk_size_min')
+CHUNK_SIZE_MAX=$(bashio::config 'chunk_size_max')
+INCREMENTAL_BACKUPS=$(bashio::config 'incremental_backups')
+INCREMENTAL_FULL_INTERVAL_DAYS=$(bashio::config 'incremental_full_interval_days')
+UPLOAD_RATE_LIMIT=$(bashio::config 'upload_rate_limit')
+UPLOAD_RATE_SCHEDULE=$(bashio::config 'upload_rate_schedule')
+GITHUB_SYNC_DEBOUNCE=$(bashio::config 'github_sync_debounce')
+FLEET_FILE=$(bashio::config 'fleet_file')
+FLEET_CONCURRENCY=$(bashio::config 'fleet_concurrency')
+ENGINE=$(bashio::config 'engine')
+API_SERVER=$(bashio::config 'api_server')
+API_THREADS=$(bashio::config 'api_threads')
 
 # Export environment variables for Python app
 export API_URL
@@ -17,8 +49,39 @@ export API_KEY
 export AUTO_BACKUP
 export BACKUP_TIME
 export RETENTION_DAYS
+export BACKUP_TIERS
+export LOCAL_MAX_BACKUPS
+export LOCAL_MAX_SIZE_GB
+export RETENTION_ALL_LOCAL_BACKUPS
+export REMOTE_RETENTION_DAYS
+export REMOTE_MAX_BACKUPS
+export REMOTE_MAX_SIZE_GB
 export INSTANCE_NAME
 export INSTANCE_ID
+export READ_LOCAL_BACKUPS
+export DOWNLOAD_MODE
+export UPLOAD_BUFFERS
+export UPLOAD_PARALLELISM
+export UPLOAD_CHUNK_RETRIES
+export COMPRESSION
+export COMPRESSION_LEVEL
+export COMPRESSION_THREADS
+export ENCRYPTION
+export ENCRYPTION_KEY
+export CHUNKING
+export ADAPTIVE_CHUNK_SIZE
+export CHUNK_SIZE_MIN
+export CHUNK_SIZE_MAX
+export INCREMENTAL_BACKUPS
+export INCREMENTAL_FULL_INTERVAL_DAYS
+export UPLOAD_RATE_LIMIT
+export UPLOAD_RATE_SCHEDULE
+export GITHUB_SYNC_DEBOUNCE
+export FLEET_FILE
+export FLEET_CONCURRENCY
+export ENGINE
+export API_SERVER
+export API_THREADS
 export SUPERVISOR_TOKEN="${SUPERVISOR_TOKEN}"
 
 # Start the Python application
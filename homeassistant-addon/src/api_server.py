@@ -0,0 +1,324 @@
+"""Serving the add-on API: waitress in its own process in production, gzip for JSON and text responses"""
+import argparse
+import gzip
+import http.client
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from flask import request
+
+logger = logging.getLogger('homesafe-connector')
+
+API_SERVER_WAITRESS = 'waitress'
+API_SERVER_DEVELOPMENT = 'development'
+
+# Bodies smaller than this gain nothing from compression
+GZIP_MIN_SIZE = 1024
+# Fast levels: the bodies are small JSON, and the saving over level 9 is marginal
+GZIP_LEVEL = 5
+_COMPRESSIBLE = ('application/json', 'text/plain', 'text/html', 'application/javascript')
+# A GET response is reused for this long before the connector process is asked again
+RESPONSE_CACHE_SECONDS = 1.0
+# Cached URLs kept before expired ones are dropped
+MAX_CACHED_RESPONSES = 256
+# Seconds before a crashed API process is started again
+RESTART_DELAY = 5
+_HOP_BY_HOP = ('connection', 'keep-alive', 'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade', 'server', 'date')
+_WAITRESS_OPTIONS = {
+    'ident': 'homesafe-connector',
+    # The add-on API is on a LAN port; large uploads never go through it
+    'max_request_body_size': 1024 * 1024
+}
+
+
+def enable_gzip(app):
+    """gzip responses for clients that send Accept-Encoding: gzip"""
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.mimetype not in _COMPRESSIBLE
+                or 'Content-Encoding' in response.headers
+                or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+            return response
+
+        body = response.get_data()
+        if len(body) < GZIP_MIN_SIZE:
+            return response
+
+        response.set_data(gzip.compress(body, GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        # A strong ETag names the exact bytes, which are now different
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    return app
+
+
+def serve(app, host, port, server=API_SERVER_WAITRESS, threads=4, channel_timeout=30, connection_limit=100):
+    """
+    Serve app until the process exits (blocking).
+
+    With waitress the port is served by a separate API process (ApiProcess),
+    so polling clients never compete with the backup pipeline for the GIL.
+    Falls back to Flask's development server, in this process, when
+    waitress is not installed.
+    """
+    if server == API_SERVER_WAITRESS:
+        try:
+            api_process = ApiProcess(app, host, port, threads=threads, channel_timeout=channel_timeout, connection_limit=connection_limit).start()
+        except ImportError:
+            logger.warning("waitress not installed, falling back to the development server")
+        else:
+            api_process.supervise()
+            return
+
+    app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True)
+
+
+class ApiProcess:
+    """
+    The public API port, served from its own process.
+
+    This process only serves app to the API process, on a loopback port.
+    The API process runs waitress: one I/O thread reads and writes every
+    client connection, keeps it alive between requests and closes it after
+    channel_timeout seconds of inactivity, and threads workers forward the
+    requests. Repeated GETs of one URL are answered from a short-lived
+    cache there (ResponseCacheProxy), so however many clients poll, app
+    answers each URL about once per RESPONSE_CACHE_SECONDS.
+    """
+
+    def __init__(self, app, host, port, threads=4, channel_timeout=30, connection_limit=100,
+                 cache_seconds=RESPONSE_CACHE_SECONDS):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.channel_timeout = channel_timeout
+        self.connection_limit = connection_limit
+        self.cache_seconds = cache_seconds
+        self.process = None
+        self._upstream = None
+        self._stopped = threading.Event()
+
+    @property
+    def upstream_port(self):
+        return self._upstream.effective_port
+
+    def start(self):
+        from waitress import create_server
+
+        # Port 0: the system picks a free loopback port, passed on to the API process
+        self._upstream = create_server(self.app, host='127.0.0.1', port=0, threads=self.threads, **_WAITRESS_OPTIONS)
+        threading.Thread(target=self._upstream.run, name='homesafe-api-upstream', daemon=True).start()
+        self._spawn()
+        return self
+
+    def supervise(self):
+        """Wait on the API process and start it again whenever it exits (blocking)"""
+        while not self._stopped.is_set():
+            code = self.process.wait()
+            if self._stopped.is_set():
+                return
+            logger.error(f"API process exited with code {code}, restarting in {RESTART_DELAY}s")
+            if self._stopped.wait(RESTART_DELAY):
+                return
+            self._spawn()
+
+    def stop(self):
+        self._stopped.set()
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self._upstream:
+            self._upstream.close()
+
+    def _spawn(self):
+        logger.info(f"Serving API with waitress on {self.host}:{self.port} in a separate process ({self.threads} threads)")
+        self.process = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__),
+            '--host', self.host,
+            '--port', str(self.port),
+            '--upstream-port', str(self.upstream_port),
+            '--threads', str(self.threads),
+            '--channel-timeout', str(self.channel_timeout),
+            '--connection-limit', str(self.connection_limit),
+            '--cache-seconds', str(self.cache_seconds)
+        ])
+
+
+class ResponseCacheProxy:
+    """
+    WSGI app of the API process: forwards requests to the connector process.
+
+    GET responses are reused for cache_seconds, and concurrent requests for
+    a URL that is not cached wait for one upstream request. Conditional
+    requests are answered with 304 here when the client's ETag is current.
+    """
+
+    def __init__(self, upstream_port, cache_seconds=RESPONSE_CACHE_SECONDS):
+        self.upstream_port = upstream_port
+        self.cache_seconds = cache_seconds
+        self.upstream_requests = 0
+        # (url, accept_encoding) -> (fetched_at, response)
+        self._cache = {}
+        self._url_locks = {}
+        self._lock = threading.Lock()
+        # One keep-alive upstream connection per worker thread
+        self._local = threading.local()
+
+    def __call__(self, environ, start_response):
+        url = environ.get('PATH_INFO') or '/'
+        if environ.get('QUERY_STRING'):
+            url += f"?{environ['QUERY_STRING']}"
+        headers = {'Accept-Encoding': 'gzip' if 'gzip' in environ.get('HTTP_ACCEPT_ENCODING', '') else 'identity'}
+
+        if environ['REQUEST_METHOD'] == 'GET':
+            response = self._cached_get(url, headers)
+        else:
+            if environ.get('CONTENT_TYPE'):
+                headers['Content-Type'] = environ['CONTENT_TYPE']
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            body = environ['wsgi.input'].read(length) if length else None
+            # Never repeated: the connector may have acted on it already
+            response = self._forward(environ['REQUEST_METHOD'], url, headers, body, attempts=1)
+            # A triggered backup shows up in the next status poll
+            with self._lock:
+                self._cache.clear()
+
+        if response is None:
+            body = b'{"success": false, "error": "Connector not reachable"}'
+            start_response('502 Bad Gateway', [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+            return [body]
+
+        status, response_headers, body = response
+        if status.startswith('200') and _etag_matches(environ.get('HTTP_IF_NONE_MATCH'), response_headers):
+            start_response('304 Not Modified', [
+                (name, value) for name, value in response_headers
+                if name.lower() in ('etag', 'cache-control', 'vary')
+            ])
+            return [b'']
+        start_response(status, response_headers)
+        return [body]
+
+    def _cached_get(self, url, headers):
+        key = (url, headers['Accept-Encoding'])
+        response = self._fresh(key)
+        if response:
+            return response
+
+        with self._lock:
+            url_lock = self._url_locks.setdefault(key, threading.Lock())
+        with url_lock:
+            # Another worker may have fetched it meanwhile
+            response = self._fresh(key)
+            if response:
+                return response
+            response = self._forward('GET', url, headers)
+            if response and response[0].startswith('200'):
+                with self._lock:
+                    if len(self._cache) >= MAX_CACHED_RESPONSES:
+                        self._drop_expired()
+                    self._cache[key] = (time.monotonic(), response)
+            return response
+
+    def _fresh(self, key):
+        entry = self._cache.get(key)
+        if entry and time.monotonic() - entry[0] < self.cache_seconds:
+            return entry[1]
+        return None
+
+    def _drop_expired(self):
+        now = time.monotonic()
+        for key in [key for key, (fetched_at, _) in self._cache.items() if now - fetched_at >= self.cache_seconds]:
+            del self._cache[key]
+            self._url_locks.pop(key, None)
+
+    def _forward(self, method, url, headers, body=None, attempts=2):
+        """(status line, headers, body) of the connector's answer, or None when it cannot be reached"""
+        for attempt in range(1, attempts + 1):
+            connection = getattr(self._local, 'connection', None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection('127.0.0.1', self.upstream_port, timeout=60)
+            try:
+                connection.request(method, url, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                # A kept-alive connection may have been closed by the connector in the meantime
+                connection.close()
+                self._local.connection = None
+                if attempt == attempts:
+                    logger.warning(f"Connector did not answer {method} {url}: {e}")
+                    return None
+                continue
+
+            with self._lock:
+                self.upstream_requests += 1
+            response_headers = [(name, value) for name, value in response.getheaders() if name.lower() not in _HOP_BY_HOP]
+            return f'{response.status} {response.reason}', response_headers, data
+
+
+def _etag_matches(if_none_match, headers):
+    """Weak comparison of If-None-Match with the response's ETag"""
+    if not if_none_match:
+        return False
+    etag = next((value for name, value in headers if name.lower() == 'etag'), None)
+    if not etag:
+        return False
+    candidates = {candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')}
+    return '*' in candidates or etag.removeprefix('W/') in candidates
+
+
+def _exit_with_parent():
+    """End the API process when the connector process is gone"""
+    parent = os.getppid()
+
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(2)
+        os._exit(0)
+
+    threading.Thread(target=watch, name='homesafe-api-parent', daemon=True).start()
+
+
+def _run_api_process():
+    parser = argparse.ArgumentParser(description='HomeSafe add-on API process')
+    parser.add_argument('--host', required=True)
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--upstream-port', type=int, required=True)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--channel-timeout', type=int, default=30)
+    parser.add_argument('--connection-limit', type=int, default=100)
+    parser.add_argument('--cache-seconds', type=float, default=RESPONSE_CACHE_SECONDS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    _exit_with_parent()
+
+    from waitress import serve as waitress_serve
+    waitress_serve(
+        ResponseCacheProxy(args.upstream_port, args.cache_seconds),
+        host=args.host,
+        port=args.port,
+        threads=args.threads,
+        channel_timeout=args.channel_timeout,
+        connection_limit=args.connection_limit,
+        **_WAITRESS_OPTIONS
+    )
+
+
+if __name__ == '__main__':
+    _run_api_process()
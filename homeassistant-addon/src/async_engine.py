@@ -0,0 +1,272 @@
+"""asyncio engine: one event loop thread for Supervisor and HomeSafe calls, polling loops and scheduling"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from threading import Thread
+
+logger = logging.getLogger('homesafe-connector')
+
+ENGINE_THREADS = 'threads'
+ENGINE_ASYNCIO = 'asyncio'
+
+# Open connections across all hosts; further requests wait on the loop instead of holding threads
+MAX_CONNECTIONS = 100
+# Body block size of rate-limited chunk uploads
+_THROTTLE_BLOCK = 256 * 1024
+# Longest sleep between schedule checks, so wall clock changes (DST, NTP) are noticed
+_SCHEDULE_TICK = 60
+
+
+def asyncio_engine_available():
+    try:
+        import aiohttp  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class AsyncEngine:
+    """
+    Runs an asyncio event loop on a background thread.
+
+    Worker threads hand coroutines to it with run(), which enforces the
+    deadline inside the loop: when it expires the coroutine is cancelled and
+    its connection closed before run() raises, so nothing keeps using the
+    caller's buffers afterwards. Periodic jobs are independent tasks, so a
+    slow or stuck job never delays the others.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.jobs = {}
+        self._session = None
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run_loop, name='homesafe-async', daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self):
+        self._thread.join()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule coro on the loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run coro on the loop and wait for its result; raises asyncio.TimeoutError after timeout seconds"""
+        return self.submit(asyncio.wait_for(coro, timeout)).result()
+
+    async def session(self):
+        """aiohttp session shared by every client (created on the loop on first use)"""
+        if self._session is None or self._session.closed:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS, keepalive_timeout=60),
+                # Callers set deadlines per call; only connecting has a fixed limit
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30)
+            )
+        return self._session
+
+    def every(self, name, interval, job, timeout=None, delay=None):
+        """Run job every interval seconds, the first time after delay (default: one interval)"""
+        return self._add(PeriodicJob(name, job, timeout, interval=interval, delay=delay))
+
+    def daily(self, name, at, job, timeout=None):
+        """Run job every day at local time 'HH:MM'"""
+        return self._add(PeriodicJob(name, job, timeout, at=at))
+
+    def weekly(self, name, weekday, at, job, timeout=None):
+        """Run job every week on weekday (0 = Monday) at local time 'HH:MM'"""
+        return self._add(PeriodicJob(name, job, timeout, at=at, weekday=weekday))
+
+    def _add(self, periodic):
+        self.jobs[periodic.name] = periodic
+        self.loop.call_soon_threadsafe(lambda: self.loop.create_task(periodic.run()))
+        return periodic
+
+
+class PeriodicJob:
+    """
+    A job run on an interval, or daily or weekly at a set time, each run under its own deadline.
+
+    job is a coroutine function or a plain function; plain functions run in
+    the default executor and are abandoned, not interrupted, at the deadline.
+    An abandoned run still counts as running until its thread returns, and a
+    run that is due while the previous one is still going is skipped.
+    """
+
+    def __init__(self, name, job, timeout=None, interval=None, delay=None, at=None, weekday=None):
+        self.name = name
+        self.job = job
+        self.timeout = timeout
+        self.interval = interval
+        self.at = at
+        self.weekday = weekday
+        self.running = False
+        # Naive local time like schedule.Job.next_run, so status reporting reads both alike
+        self.next_run = self._next_daily(datetime.now()) if at else datetime.now() + timedelta(
+            seconds=interval if delay is None else delay)
+
+    async def run(self):
+        while True:
+            remaining = (self.next_run - datetime.now()).total_seconds()
+            if remaining > 0:
+                await asyncio.sleep(min(remaining, _SCHEDULE_TICK))
+                continue
+
+            now = datetime.now()
+            if self.at:
+                self.next_run = self._next_daily(now)
+            else:
+                # After a long stall, start counting again from now rather than catching up
+                self.next_run = max(self.next_run + timedelta(seconds=self.interval), now)
+            if self.running:
+                logger.warning(f"Skipping {self.name}: the previous run is still going")
+                continue
+            asyncio.get_running_loop().create_task(self._run_once())
+
+    async def _run_once(self):
+        self.running = True
+        thread_run = None
+        try:
+            if asyncio.iscoroutinefunction(self.job):
+                await asyncio.wait_for(self.job(), self.timeout)
+            else:
+                # Shielded: the deadline stops the wait, the thread itself keeps going
+                thread_run = asyncio.ensure_future(asyncio.to_thread(self.job))
+                await asyncio.wait_for(asyncio.shield(thread_run), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.name} exceeded its {self.timeout}s deadline")
+        except Exception as e:
+            logger.error(f"{self.name} failed: {e}")
+        finally:
+            if thread_run is None or thread_run.done():
+                self.running = False
+            else:
+                thread_run.add_done_callback(self._abandoned_run_finished)
+
+    def _abandoned_run_finished(self, thread_run):
+        self.running = False
+        if thread_run.cancelled():
+            return
+        if thread_run.exception():
+            logger.error(f"{self.name} failed after its deadline: {thread_run.exception()}")
+        else:
+            logger.info(f"{self.name} finished after its deadline")
+
+    def _next_daily(self, now):
+        hour, minute = (int(part) for part in self.at.split(':'))
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        if self.weekday is not None:
+            candidate += timedelta(days=(self.weekday - candidate.weekday()) % 7)
+        return candidate
+
+
+class AsyncSupervisorClient:
+    """Supervisor REST API calls made on the engine's loop"""
+
+    def __init__(self, engine, url, token):
+        self.engine = engine
+        self.url = url
+        self.token = token
+
+    async def _request(self, method, path, timeout, **kwargs):
+        import aiohttp
+        session = await self.engine.session()
+        async with session.request(
+            method,
+            f'{self.url}{path}',
+            headers={'Authorization': f'Bearer {self.token}'},
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            **kwargs
+        ) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def core_info(self):
+        body = await self._request('GET', '/core/info', 30)
+        return body.get('data', {})
+
+    async def installed_addons(self):
+        body = await self._request('GET', '/addons', 30)
+        return [addon['slug'] for addon in body.get('data', {}).get('addons', [])]
+
+    async def start_backup(self, endpoint, payload):
+        """
+        Start a full or partial backup (endpoint) without waiting for it.
+
+        Returns the response data: job_id from a Supervisor that runs the
+        backup in the background, or slug from an older one that finished it
+        within the request.
+        """
+        import aiohttp
+        try:
+            body = await self._request('POST', endpoint, 900, json={**payload, 'background': True})
+        except aiohttp.ClientResponseError as e:
+            if e.status != 400:
+                raise
+            # Older Supervisors reject the unknown background key; they back up within the request
+            logger.info("Supervisor does not accept background backups, retrying without")
+            body = await self._request('POST', endpoint, 900, json=payload)
+        if body.get('result') != 'ok':
+            raise RuntimeError(f"Supervisor refused the backup: {body.get('message', body)}")
+        return body.get('data', {})
+
+    async def job(self, job_id):
+        body = await self._request('GET', f'/jobs/{job_id}', 10)
+        return body.get('data', {})
+
+    async def wait_for_job(self, job_id, poll_interval=5):
+        """Poll a job until it is done and return its data; wrap in a deadline to give up"""
+        import aiohttp
+        while True:
+            await asyncio.sleep(poll_interval)
+            try:
+                job = await self.job(job_id)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Error checking job status (will retry): {e}")
+                continue
+            logger.info(f"Job state: {job.get('state', 'done' if job.get('done') else 'running')}, progress: {job.get('progress', 0)}%")
+            if job.get('done') or job.get('state') in ('completed', 'failed'):
+                return job
+
+
+class AsyncHomeSafeClient:
+    """HomeSafe chunk uploads made on the engine's loop"""
+
+    def __init__(self, engine, api_url, api_key):
+        self.engine = engine
+        self.api_url = api_url
+        self.api_key = api_key
+
+    async def post_chunk(self, params, data, limiter=None):
+        """POST one chunk; returns (status, response text). data must stay valid until this returns"""
+        session = await self.engine.session()
+        headers = {'x-api-key': self.api_key, 'Content-Type': 'application/octet-stream'}
+        if limiter is not None and limiter.enabled:
+            headers['Content-Length'] = str(len(data))
+            data = _throttled_body(data, limiter)
+        async with session.post(
+            f'{self.api_url}/backup-upload',
+            params={'action': 'chunk', **{key: str(value) for key, value in params.items()}},
+            headers=headers,
+            data=data
+        ) as response:
+            return response.status, await response.text()
+
+
+async def _throttled_body(data, limiter):
+    """Yield data in blocks that each pass the (blocking) limiter off the loop"""
+    view = memoryview(data)
+    for start in range(0, len(view), _THROTTLE_BLOCK):
+        block = view[start:start + _THROTTLE_BLOCK]
+        await asyncio.to_thread(limiter.acquire, len(block))
+        yield block.tobytes()
@@ -0,0 +1,202 @@
+"""Single-worker queue that serializes backup runs and tracks their live progress"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from threading import Thread
+
+logger = logging.getLogger('homesafe-connector')
+
+# Finished jobs kept for the status endpoint
+MAX_FINISHED_JOBS = 50
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class BackupJob:
+    """One backup run: its trigger, current phase and transfer progress"""
+
+    def __init__(self, trigger_type):
+        self.id = uuid.uuid4().hex
+        self.trigger_type = trigger_type
+        self.status = STATUS_QUEUED
+        self.phase = STATUS_QUEUED
+        self.coalesced = 0
+        self.bytes_done = 0
+        self.bytes_total = 0
+        # Upload rate limit in effect, bytes/s (0 = unlimited, None before the upload)
+        self.rate_limit = None
+        # Seconds per workflow phase, filled in as phases finish
+        self.timings = {}
+        # Other per-run facts for the run history (e.g. chosen chunk sizes)
+        self.summary = {}
+        self.error = None
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self._transfer_started = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.status = STATUS_RUNNING
+            self.started_at = _now()
+
+    def set_phase(self, phase, bytes_total=None):
+        """Enter a new phase; passing bytes_total (0 if unknown) starts a transfer phase"""
+        with self._lock:
+            self.phase = phase
+            if bytes_total is not None:
+                self.bytes_done = 0
+                self.bytes_total = bytes_total
+                self._transfer_started = time.monotonic()
+            else:
+                # Counters of the last transfer stay visible in later phases
+                self._transfer_started = None
+        logger.debug(f"Backup job {self.id}: {phase}")
+
+    def set_progress(self, bytes_done, bytes_total=None):
+        with self._lock:
+            self.bytes_done = bytes_done
+            if bytes_total is not None:
+                self.bytes_total = bytes_total
+
+    def record_timing(self, phase, seconds):
+        with self._lock:
+            self.timings[phase] = round(self.timings.get(phase, 0) + seconds, 3)
+
+    def finish(self, success):
+        with self._lock:
+            self.status = STATUS_SUCCEEDED if success else STATUS_FAILED
+            self.phase = self.status
+            self.finished_at = _now()
+            self._transfer_started = None
+
+    def to_dict(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._transfer_started if self._transfer_started else 0
+            return {
+                'id': self.id,
+                'trigger': self.trigger_type,
+                'status': self.status,
+                'phase': self.phase,
+                'coalesced_triggers': self.coalesced,
+                'bytes_done': self.bytes_done,
+                'bytes_total': self.bytes_total,
+                'progress': round(self.bytes_done / self.bytes_total * 100, 1) if self.bytes_total else None,
+                'rate_limit_bytes_per_sec': self.rate_limit,
+                'throughput_bytes_per_sec': round(self.bytes_done / elapsed) if elapsed > 0 else None,
+                'timings': dict(self.timings),
+                'summary': dict(self.summary),
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+
+class BackupJobQueue:
+    """
+    Runs backups one at a time on a single worker thread.
+
+    A trigger that arrives while a backup is queued or running is folded into
+    that job instead of starting another snapshot: the job already in flight
+    captures the same system state, so running a second one in parallel would
+    only compete for disk and upload bandwidth.
+    """
+
+    def __init__(self, run_backup, name='homesafe-backup-worker'):
+        # run_backup(job) -> bool
+        self._run_backup = run_backup
+        self.name = name
+        self._jobs = OrderedDict()
+        self._pending = []
+        self._active = None
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._worker, name=self.name, daemon=True)
+        self._thread.start()
+
+    def submit(self, trigger_type):
+        """Queue a backup; returns (job, coalesced)"""
+        with self._condition:
+            existing = self._pending[0] if self._pending else self._active
+            if existing is not None:
+                existing.coalesced += 1
+                logger.info(f"Backup already {existing.status} (job {existing.id}), coalescing {trigger_type} trigger")
+                return existing, True
+
+            job = BackupJob(trigger_type)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._condition.notify_all()
+            logger.info(f"Queued {trigger_type} backup (job {job.id})")
+            return job, False
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """All tracked jobs, newest first"""
+        with self._condition:
+            return list(reversed(self._jobs.values()))
+
+    @property
+    def active_job(self):
+        return self._active
+
+    def is_busy(self):
+        with self._condition:
+            return bool(self._pending) or self._active is not None
+
+    def wait_idle(self, timeout=None):
+        """Block until no job is queued or running; True if the queue drained"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._active is not None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                job = self._pending.pop(0)
+                self._active = job
+                job.start()
+
+            try:
+                success = self._run_backup(job)
+                if not success and job.error is None:
+                    job.error = f"Backup failed during {job.phase}"
+            except Exception as e:
+                logger.error(f"Backup job {job.id} crashed: {e}")
+                job.error = str(e)
+                success = False
+
+            with self._condition:
+                job.finish(success)
+                self._active = None
+                self._prune()
+                self._condition.notify_all()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in (STATUS_SUCCEEDED, STATUS_FAILED)]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
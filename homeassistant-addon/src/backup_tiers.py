@@ -0,0 +1,148 @@
+"""Backup tiers: partial backups of selected content, each on its own schedule"""
+import json
+import logging
+import re
+
+logger = logging.getLogger('homesafe-connector')
+
+SCHEDULE_HOURLY = 'hourly'
+SCHEDULE_DAILY = 'daily'
+SCHEDULE_WEEKLY = 'weekly'
+SCHEDULES = (SCHEDULE_HOURLY, SCHEDULE_DAILY, SCHEDULE_WEEKLY)
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+# Folders a partial backup can include besides Home Assistant and add-ons
+FOLDERS = ('ssl', 'share', 'media', 'addons/local')
+
+# Lower case and no hyphen, so one tier's snapshot name prefix never matches another's
+_NAME = re.compile(r'^[a-z][a-z0-9_]*$')
+_TIME = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+
+
+class BackupTier:
+    """
+    What one tier backs up and when.
+
+    full tiers call /backups/new/full; the others back up only the listed
+    content through /backups/new/partial. all_addons is resolved to the
+    installed add-ons when the snapshot is created.
+    """
+
+    def __init__(self, name, schedule, at=None, weekday='sunday', full=False, homeassistant=False,
+                 exclude_database=False, addons=(), all_addons=False, folders=()):
+        self.name = name
+        self.schedule = schedule
+        # Local time 'HH:MM' of daily and weekly tiers (None = backup_time)
+        self.at = at
+        self.weekday = weekday
+        self.full = full
+        self.homeassistant = homeassistant
+        self.exclude_database = exclude_database
+        self.addons = list(addons)
+        self.all_addons = all_addons
+        self.folders = list(folders)
+
+    @property
+    def endpoint(self):
+        return '/backups/new/full' if self.full else '/backups/new/partial'
+
+    def payload(self, installed_addons=()):
+        """Content fields of the Supervisor request body"""
+        if self.full:
+            return {}
+        payload = {
+            'homeassistant': self.homeassistant,
+            'addons': sorted(installed_addons) if self.all_addons else self.addons,
+            'folders': self.folders
+        }
+        if self.homeassistant and self.exclude_database:
+            payload['homeassistant_exclude_database'] = True
+        return payload
+
+    def describe(self):
+        if self.full:
+            return 'full'
+        parts = []
+        if self.homeassistant:
+            parts.append('Home Assistant' + (' without database' if self.exclude_database else ''))
+        if self.all_addons:
+            parts.append('all add-ons')
+        elif self.addons:
+            parts.append(f"add-ons {', '.join(self.addons)}")
+        parts.extend(self.folders)
+        return ', '.join(parts)
+
+
+def load_tiers(raw):
+    """
+    Parse the backup_tiers option (a JSON list of tier objects).
+
+    [{"name": "core", "schedule": "hourly", "homeassistant": true},
+     {"name": "addons", "schedule": "daily", "time": "02:00", "all_addons": true},
+     {"name": "media", "schedule": "weekly", "weekday": "sunday", "folders": ["media", "share"]}]
+
+    Returns a list of BackupTier ([] when no tiers are configured), or None
+    when the option is invalid.
+    """
+    if not raw or not raw.strip():
+        return []
+    try:
+        entries = json.loads(raw)
+    except ValueError as e:
+        logger.error(f"backup_tiers is not valid JSON: {e}")
+        return None
+    if not isinstance(entries, list):
+        logger.error("backup_tiers must be a list")
+        return None
+
+    tiers = []
+    for position, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict):
+            logger.error(f"Backup tier #{position} is not an object")
+            return None
+
+        name = entry.get('name') or ''
+        if not _NAME.match(name):
+            logger.error(f"Backup tier #{position} needs a name of lower case letters, digits and underscores")
+            return None
+        if any(tier.name == name for tier in tiers):
+            logger.error(f"Backup tier name '{name}' is used more than once")
+            return None
+
+        schedule = entry.get('schedule')
+        if schedule not in SCHEDULES:
+            logger.error(f"Backup tier '{name}' has an invalid schedule (expected {', '.join(SCHEDULES)})")
+            return None
+        at = entry.get('time') or None
+        if at and not _TIME.match(at):
+            logger.error(f"Backup tier '{name}' has an invalid time (expected HH:MM)")
+            return None
+        weekday = (entry.get('weekday') or 'sunday').lower()
+        if weekday not in WEEKDAYS:
+            logger.error(f"Backup tier '{name}' has an invalid weekday")
+            return None
+
+        folders = [folder for folder in entry.get('folders') or [] if folder]
+        unknown = [folder for folder in folders if folder not in FOLDERS]
+        if unknown:
+            logger.error(f"Backup tier '{name}' has unknown folders: {', '.join(unknown)} (expected {', '.join(FOLDERS)})")
+            return None
+
+        tier = BackupTier(
+            name,
+            schedule,
+            at=at,
+            weekday=weekday,
+            full=bool(entry.get('full')),
+            homeassistant=bool(entry.get('homeassistant')),
+            exclude_database=bool(entry.get('exclude_database')),
+            addons=[addon for addon in entry.get('addons') or [] if addon],
+            all_addons=bool(entry.get('all_addons')),
+            folders=folders
+        )
+        if not tier.full and not (tier.homeassistant or tier.addons or tier.all_addons or tier.folders):
+            logger.error(f"Backup tier '{name}' backs up nothing (set full, homeassistant, addons, all_addons or folders)")
+            return None
+        tiers.append(tier)
+
+    return tiers
@@ -0,0 +1,180 @@
+"""Token-bucket upload rate limiting with time-of-day windows"""
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger('homesafe-connector')
+
+MB = 1024 * 1024
+
+_WINDOW = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(\d+(?:\.\d+)?)\s*$')
+
+
+def parse_rate_schedule(text):
+    """
+    Parse "HH:MM-HH:MM=MBps" windows separated by commas.
+
+    Returns [(start_minute, end_minute, bytes_per_sec)]; a window may wrap
+    past midnight and a rate of 0 means unlimited. Invalid entries are
+    logged and skipped.
+    """
+    windows = []
+    for entry in filter(None, (part.strip() for part in (text or '').split(','))):
+        match = _WINDOW.match(entry)
+        if not match:
+            logger.warning(f"Ignoring invalid upload rate window '{entry}' (expected HH:MM-HH:MM=MBps)")
+            continue
+        start_hour, start_minute, end_hour, end_minute, rate = match.groups()
+        start = int(start_hour) * 60 + int(start_minute)
+        end = int(end_hour) * 60 + int(end_minute)
+        if start >= 24 * 60 or end > 24 * 60:
+            logger.warning(f"Ignoring invalid upload rate window '{entry}' (time out of range)")
+            continue
+        windows.append((start, end, float(rate) * MB))
+    return windows
+
+
+class BandwidthLimiter:
+    """
+    Token bucket shared by every uploader worker.
+
+    The rate is looked up from the time windows on every refill, so a window
+    boundary takes effect within the next read even in the middle of a chunk.
+    The bucket holds at most one second of tokens to keep bursts short.
+    """
+
+    def __init__(self, default_rate=0, windows=None, clock=time.monotonic, now=datetime.now):
+        # Bytes per second outside any window; 0 means unlimited
+        self.default_rate = default_rate
+        self.windows = windows or []
+        self.throttled_seconds = 0.0
+        self._clock = clock
+        self._now = now
+        self._tokens = 0.0
+        self._rate = None
+        self._last_refill = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """False when no limit applies at any time of day"""
+        return self.default_rate > 0 or any(rate > 0 for _, _, rate in self.windows)
+
+    def current_rate(self):
+        """Bytes per second allowed right now (0 = unlimited)"""
+        current = self._now()
+        minute = current.hour * 60 + current.minute
+        for start, end, rate in self.windows:
+            if start <= end:
+                inside = start <= minute < end
+            else:
+                inside = minute >= start or minute < end
+            if inside:
+                return rate
+        return self.default_rate
+
+    def acquire(self, amount):
+        """Block until amount bytes may be sent"""
+        while True:
+            with self._lock:
+                rate = self.current_rate()
+                now = self._clock()
+                if rate != self._rate:
+                    if self._rate is not None:
+                        logger.info(f"Upload rate limit now {'unlimited' if not rate else f'{rate / MB:.2f} MB/s'}")
+                    self._rate = rate
+                    self._tokens = min(self._tokens, rate)
+                if not rate:
+                    self._last_refill = now
+                    return
+
+                # Allow one read larger than the bucket instead of stalling forever
+                capacity = max(rate, amount)
+                self._tokens = min(capacity, self._tokens + (now - self._last_refill) * rate)
+                self._last_refill = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / rate
+
+            # Re-check at least once a second so window changes apply promptly
+            wait = min(wait, 1.0)
+            time.sleep(wait)
+            with self._lock:
+                self.throttled_seconds += wait
+
+    def wrap(self, data):
+        """Request body that reads data through the bucket"""
+        return ThrottledBody(data, self)
+
+
+class ThrottledBody:
+    """File-like request body; requests sends it in blocks that each pass the limiter"""
+
+    def __init__(self, data, limiter):
+        self._view = memoryview(data)
+        self._limiter = limiter
+        self._position = 0
+
+    def __len__(self):
+        return len(self._view) - self._position
+
+    def read(self, size=-1):
+        remaining = len(self._view) - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size == 0:
+            return b''
+        self._limiter.acquire(size)
+        block = self._view[self._position:self._position + size]
+        self._position += size
+        return block.tobytes()
+
+
+class SharedBandwidth:
+    """
+    One upload limit split evenly between the instances uploading at once.
+
+    Every instance reads through its own BandwidthShare bucket whose rate is
+    the current limit divided by the number of active instances, so one fast
+    site cannot starve the others and the shares grow as uploads finish.
+    """
+
+    def __init__(self, default_rate=0, windows=None):
+        # Only used for the time-of-day rate lookup, never acquired directly
+        self.limiter = BandwidthLimiter(default_rate, windows)
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def share(self, name):
+        return BandwidthShare(self, name)
+
+    def activate(self, name):
+        with self._lock:
+            self._active.add(name)
+
+    def deactivate(self, name):
+        with self._lock:
+            self._active.discard(name)
+
+    def rate_for(self, name):
+        total = self.limiter.current_rate()
+        if not total:
+            return 0
+        with self._lock:
+            active = len(self._active | {name})
+        return total / active
+
+
+class BandwidthShare(BandwidthLimiter):
+    """Token bucket refilled at one instance's share of a SharedBandwidth"""
+
+    def __init__(self, shared, name):
+        super().__init__(shared.limiter.default_rate, shared.limiter.windows)
+        self.shared = shared
+        self.name = name
+
+    def current_rate(self):
+        return self.shared.rate_for(self.name)
@@ -0,0 +1,135 @@
+"""Adaptive chunk size and timeout controller for the fixed-offset chunk uploader"""
+import logging
+import threading
+
+logger = logging.getLogger('homesafe-connector')
+
+MB = 1024 * 1024
+
+# Chunk size aimed for: long enough to amortize the edge function round-trip,
+# short enough that a failed chunk costs little to resend
+TARGET_CHUNK_SECONDS = 20
+# Weight of the newest chunk in the throughput estimate
+THROUGHPUT_SMOOTHING = 0.3
+# A chunk may take this many times its expected duration before timing out
+TIMEOUT_FACTOR = 4
+MIN_TIMEOUT = 60
+MAX_TIMEOUT = 1800  # The former fixed per-chunk timeout
+
+
+class AdaptiveChunkSizer:
+    """
+    Picks the length of each chunk from measured per-chunk throughput.
+
+    Sizes start at min_size, grow at most 2x per chunk towards
+    TARGET_CHUNK_SECONDS worth of data and are halved after a failed attempt.
+    A replay plan (lengths of chunks already sent in an interrupted upload)
+    is followed first so resumed chunks land exactly on the parts the backend
+    already holds.
+    """
+
+    def __init__(self, min_size, max_size, plan=None):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.plan = plan or []
+        self.throughput = None
+        self.failures = 0
+        self.sizes = []
+        self._size = min(self.plan[-1], self.max_size) if self.plan else min_size
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_journal(cls, journal, min_size, max_size):
+        """Sizer whose first chunks reproduce the boundaries of every chunk sent before"""
+        plan = _replay_plan(journal.sent_spans, max_size) if journal else []
+        if plan is None:
+            logger.warning("Upload journal chunk layout is inconsistent, chunk sizes start over")
+            plan = []
+        return cls(min_size, max_size, plan)
+
+    def next_size(self, chunk_number):
+        """Length of the next chunk to read (chunk numbers start at 1)"""
+        with self._lock:
+            if chunk_number <= len(self.plan):
+                size = self.plan[chunk_number - 1]
+            else:
+                size = self._size
+            self.sizes.append(size)
+            return size
+
+    def record_success(self, length, seconds):
+        with self._lock:
+            if seconds <= 0:
+                return
+            rate = length / seconds
+            if self.throughput is None:
+                self.throughput = rate
+            else:
+                self.throughput = THROUGHPUT_SMOOTHING * rate + (1 - THROUGHPUT_SMOOTHING) * self.throughput
+
+            target = self.throughput * TARGET_CHUNK_SECONDS
+            size = min(target, self._size * 2)
+            self._size = self._clamp(size)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._size = self._clamp(self._size // 2)
+            logger.info(f"Chunk failed, next chunks use {self._size / MB:.0f} MB")
+
+    def timeout(self, length):
+        """Seconds a chunk of this length may take, from the measured throughput"""
+        with self._lock:
+            if not self.throughput:
+                return MAX_TIMEOUT
+            expected = length / self.throughput
+        return int(min(MAX_TIMEOUT, max(MIN_TIMEOUT, expected * TIMEOUT_FACTOR)))
+
+    def summary(self):
+        """Chunk sizes chosen during this upload, for the run history"""
+        with self._lock:
+            sizes = list(self.sizes)
+            return {
+                'chunks': len(sizes),
+                'min_bytes': min(sizes) if sizes else 0,
+                'max_bytes': max(sizes) if sizes else 0,
+                'average_bytes': round(sum(sizes) / len(sizes)) if sizes else 0,
+                'final_bytes': self._size,
+                'failures': self.failures,
+                'throughput_bytes_per_sec': round(self.throughput) if self.throughput else None
+            }
+
+    def _clamp(self, size):
+        # Whole megabytes keep chunk lengths readable in logs and journals
+        size = int(size) // MB * MB
+        return max(self.min_size, min(self.max_size, size))
+
+
+def _replay_plan(spans, max_size):
+    """
+    Chunk lengths, in chunk-number order, implied by the spans of the chunks sent.
+
+    The backend only completes a backup whose parts follow each other without
+    gaps or overlaps, so sent chunks are replayed exactly. Chunks between two
+    sent ones were never sent, so no part exists there and the gap is re-split
+    evenly. Returns None if the spans do not form a sequence.
+    """
+    plan = []
+    previous_number = 0
+    previous_end = 0
+    for number, (offset, length) in sorted(spans.items()):
+        if length > max_size:
+            return None
+        missing = number - previous_number - 1
+        gap = offset - previous_end
+        if missing:
+            if gap < missing or gap > missing * max_size:
+                return None
+            part, remainder = divmod(gap, missing)
+            plan.extend(part + (1 if index < remainder else 0) for index in range(missing))
+        elif gap:
+            return None
+        plan.append(length)
+        previous_number = number
+        previous_end = offset + length
+    return plan
@@ -0,0 +1,165 @@
+"""Change detection for the YAML files mirrored to GitHub"""
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+
+logger = logging.getLogger('homesafe-connector')
+
+YAML_SUFFIXES = ('.yaml', '.yml')
+
+# Directories always mirrored in full besides the top-level YAML files
+ALWAYS_INCLUDED_DIRS = ('packages',)
+
+# !include file.yaml, !include_dir_named dir, !include_dir_merge_list dir, ...
+_INCLUDE = re.compile(r'!include(_dir_(?:list|named|merge_list|merge_named))?\s+["\']?([^\s"\'#]+)')
+
+
+def collect_config_files(config_path):
+    """
+    Relative paths of the YAML files to mirror.
+
+    Top-level *.yaml/*.yml, everything under packages/ and every file or
+    directory pulled in through !include directives (followed recursively).
+    Hidden entries and paths outside config_path are ignored.
+    """
+    config_path = Path(config_path)
+    root = config_path.resolve()
+    found = set()
+    pending = [path for path in config_path.iterdir() if _is_yaml(path)] if config_path.is_dir() else []
+    for directory in ALWAYS_INCLUDED_DIRS:
+        pending.extend(_yaml_files_under(config_path / directory))
+
+    while pending:
+        path = pending.pop()
+        relative = _relative_to(path, root)
+        if relative is None or relative in found:
+            continue
+        found.add(relative)
+
+        for is_dir, target in _includes(path):
+            target = path.parent / target
+            if is_dir:
+                pending.extend(_yaml_files_under(target))
+            elif _is_yaml(target):
+                pending.append(target)
+
+    return sorted(found)
+
+
+def _is_yaml(path):
+    return path.suffix in YAML_SUFFIXES and not path.name.startswith('.') and path.is_file()
+
+
+def _yaml_files_under(directory):
+    if not directory.is_dir():
+        return []
+    files = []
+    for current, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        files.extend(path for path in (Path(current) / name for name in filenames) if _is_yaml(path))
+    return files
+
+
+def _relative_to(path, root):
+    try:
+        return path.resolve().relative_to(root).as_posix()
+    except (ValueError, OSError):
+        logger.debug(f"Skipping {path}: outside the configuration directory")
+        return None
+
+
+def _includes(path):
+    """(is_directory, target) for each !include directive in a YAML file"""
+    try:
+        text = path.read_text(encoding='utf-8', errors='replace')
+    except OSError as e:
+        logger.warning(f"Cannot read {path}: {e}")
+        return []
+    return [(bool(match.group(1)), match.group(2)) for match in _INCLUDE.finditer(text)]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ConfigSyncIndex:
+    """
+    mtime, size and SHA-256 of every file as last pushed to GitHub.
+
+    Files whose mtime and size are unchanged are not even read; a changed
+    mtime with identical content (e.g. an editor re-saving) is recognised by
+    its hash and not synced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.repo = None
+        self.branch = None
+        # relative path -> {'mtime_ns', 'size', 'sha256'}
+        self.files = {}
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as index_file:
+                data = json.load(index_file)
+            self.repo = data.get('repo')
+            self.branch = data.get('branch')
+            self.files = data.get('files', {})
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable GitHub sync index {self.path}: {e}")
+        return self
+
+    def diff(self, config_path, relative_paths):
+        """
+        Compare the current files with the index.
+
+        Returns (changed, removed, entries): relative paths whose content
+        differs, indexed paths that no longer exist, and the index entries
+        describing the current files.
+        """
+        changed = []
+        entries = {}
+        for relative in relative_paths:
+            path = Path(config_path) / relative
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            previous = self.files.get(relative)
+            if previous and previous['mtime_ns'] == stat.st_mtime_ns and previous['size'] == stat.st_size:
+                entries[relative] = previous
+                continue
+
+            try:
+                digest = file_sha256(path)
+            except OSError as e:
+                logger.warning(f"Cannot read {path}: {e}")
+                continue
+            entries[relative] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest}
+            if not previous or previous['sha256'] != digest:
+                changed.append(relative)
+
+        removed = sorted(set(self.files) - set(entries))
+        return changed, removed, entries
+
+    def save(self, repo, branch, entries):
+        self.repo = repo
+        self.branch = branch
+        self.files = entries
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w') as index_file:
+                json.dump({'repo': repo, 'branch': branch, 'files': entries}, index_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # Without the index the next sync simply compares every file again
+            logger.warning(f"Failed to write GitHub sync index: {e}")
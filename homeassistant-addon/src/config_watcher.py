@@ -0,0 +1,183 @@
+"""Background worker that syncs YAML changes to GitHub as they happen"""
+import logging
+import threading
+import time
+from pathlib import Path
+from threading import Thread
+
+from config_sync import YAML_SUFFIXES, collect_config_files
+
+logger = logging.getLogger('homesafe-connector')
+
+# Without inotify the sync itself is the change check; it only stats files when nothing changed
+POLL_INTERVAL = 300
+# A burst of edits never holds a sync back longer than this
+MAX_BATCH_DELAY = 600
+# Wait after a failed sync before trying again without a new change
+RETRY_DELAY = 900
+
+
+class ConfigWatcher:
+    """
+    Watches /config and runs the GitHub sync once edits have settled.
+
+    Every change restarts a debounce timer, so saving several files (or one
+    file several times) within debounce seconds ends up in a single commit.
+    Only the configuration root and the directories holding mirrored files
+    are watched, which keeps the inotify watch count small. Without watchdog
+    (or inotify) the configuration is polled instead.
+    """
+
+    def __init__(self, sync, config_path, debounce=30, on_sync=None):
+        # sync() -> True when synced, False when it failed (retried after RETRY_DELAY)
+        # or None when syncing is turned off (waits for the next change);
+        # incremental, so it is cheap when nothing changed
+        self.sync = sync
+        self.config_path = Path(config_path)
+        self.debounce = debounce
+        # on_sync(success, seconds) after every sync, e.g. for metrics
+        self.on_sync = on_sync
+        self.last_sync = None
+        self.last_result = None
+        self._first_change = None
+        self._last_change = None
+        self._condition = threading.Condition()
+        self._observer = None
+        self._watched = {}
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, name='homesafe-config-watcher', daemon=True)
+        self._thread.start()
+
+    def notify_change(self, path=None):
+        """Record a change (called from the observer thread)"""
+        if path is not None and not str(path).endswith(YAML_SUFFIXES):
+            return
+        with self._condition:
+            now = time.monotonic()
+            if self._first_change is None:
+                self._first_change = now
+            self._last_change = now
+            self._condition.notify_all()
+
+    def _run(self):
+        watching = self._start_observer()
+        if watching:
+            logger.info(f"Watching {self.config_path} for YAML changes (debounce {self.debounce}s)")
+        else:
+            logger.info(f"Polling {self.config_path} for YAML changes every {POLL_INTERVAL}s")
+
+        # Catch up on edits made while the add-on was not running
+        self.notify_change()
+        while True:
+            self._wait_for_quiet(None if watching else POLL_INTERVAL)
+            result = self._sync()
+            if watching:
+                self._update_watches()
+            if result is False:
+                # Try again later even if nothing else changes (e.g. GitHub was unreachable)
+                with self._condition:
+                    self._condition.wait(RETRY_DELAY)
+                    if self._first_change is None:
+                        self.notify_change()
+
+    def _wait_for_quiet(self, poll_interval):
+        """Block until changes have settled for debounce seconds, or until the next poll"""
+        with self._condition:
+            while self._first_change is None:
+                if not self._condition.wait(poll_interval) and poll_interval:
+                    return
+
+            while True:
+                now = time.monotonic()
+                quiet_at = self._last_change + self.debounce
+                deadline = min(quiet_at, self._first_change + MAX_BATCH_DELAY)
+                if now >= deadline:
+                    self._first_change = None
+                    self._last_change = None
+                    return
+                self._condition.wait(deadline - now)
+
+    def _sync(self):
+        started = time.monotonic()
+        try:
+            result = self.sync()
+        except Exception as e:
+            logger.error(f"GitHub sync failed: {e}")
+            result = False
+        if result is None:
+            return None
+        elapsed = time.monotonic() - started
+        self.last_sync = time.time()
+        self.last_result = bool(result)
+        if self.on_sync:
+            self.on_sync(self.last_result, elapsed)
+        return self.last_result
+
+    def _start_observer(self):
+        try:
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.warning("watchdog not installed, falling back to polling for config changes")
+            return False
+
+        try:
+            self._observer = Observer()
+            self._observer.start()
+            self._update_watches()
+            return True
+        except Exception as e:
+            logger.warning(f"Cannot watch {self.config_path} ({e}), falling back to polling")
+            self._stop_observer()
+            return False
+
+    def _stop_observer(self):
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+            except Exception:
+                pass
+            self._observer = None
+
+    def _update_watches(self):
+        """Watch the root plus each top-level directory that holds mirrored files"""
+        try:
+            files = collect_config_files(self.config_path)
+        except OSError as e:
+            logger.warning(f"Cannot list configuration files: {e}")
+            return
+
+        wanted = {self.config_path: False}
+        for relative in files:
+            parts = Path(relative).parts
+            if len(parts) > 1:
+                wanted[self.config_path / parts[0]] = True
+
+        handler = _ChangeHandler(self)
+        for path in set(self._watched) - set(wanted):
+            self._observer.unschedule(self._watched.pop(path))
+        for path, recursive in wanted.items():
+            if path not in self._watched and path.is_dir():
+                self._watched[path] = self._observer.schedule(handler, str(path), recursive=recursive)
+
+
+class _ChangeHandler:
+    """watchdog event handler forwarding YAML file events to the watcher"""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def dispatch(self, event):
+        if event.event_type in ('opened', 'closed_no_write'):
+            return
+        if event.is_directory:
+            # A renamed or removed directory may carry mirrored files with it; other
+            # directory events only echo file events (e.g. the database journal)
+            if event.event_type in ('moved', 'deleted'):
+                self.watcher.notify_change()
+            return
+        self.watcher.notify_change(event.src_path)
+        dest_path = getattr(event, 'dest_path', '')
+        if dest_path:
+            self.watcher.notify_change(dest_path)
@@ -0,0 +1,74 @@
+"""Small persisted facts about past uploads, so routine checks need no remote calls"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger('homesafe-connector')
+
+
+class ConnectorState:
+    """
+    Last uploaded Home Assistant version and backup, plus remote check caches.
+
+    Updated after every successful upload; the version check compares the
+    running version against it and only asks HomeSafe when it is empty.
+    """
+
+    _FIELDS = (
+        'last_ha_version',
+        'last_backup_id',
+        'last_upload_at',
+        # ETag and version from the last remote "latest backup" lookup
+        'remote_etag',
+        'remote_ha_version',
+        # Available core update a pre-update backup was already made for
+        'pre_update_version'
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        for field in self._FIELDS:
+            setattr(self, field, None)
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as state_file:
+                data = json.load(state_file)
+            for field in self._FIELDS:
+                setattr(self, field, data.get(field))
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable connector state {self.path}: {e}")
+        return self
+
+    def update(self, **fields):
+        with self._lock:
+            for field, value in fields.items():
+                if field not in self._FIELDS:
+                    raise AttributeError(f"Unknown connector state field '{field}'")
+                setattr(self, field, value)
+            self._save()
+
+    def record_upload(self, ha_version, backup_id):
+        self.update(
+            last_ha_version=ha_version,
+            last_backup_id=backup_id,
+            last_upload_at=datetime.now(timezone.utc).isoformat()
+        )
+
+    def to_dict(self):
+        with self._lock:
+            return {field: getattr(self, field) for field in self._FIELDS}
+
+    def _save(self):
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w') as state_file:
+                json.dump({field: getattr(self, field) for field in self._FIELDS}, state_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write connector state: {e}")
@@ -0,0 +1,123 @@
+"""Fleet mode: one connector process backing up many Home Assistant instances"""
+import json
+import logging
+import re
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger('homesafe-connector')
+
+_TIME = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+
+
+def load_fleet(path):
+    """
+    Read the instance list from a JSON fleet file.
+
+    {"instances": [{"name": ..., "supervisor_url": ..., "supervisor_token": ...,
+    "instance_id": ..., "websocket_url": ..., "backup_time": "HH:MM"}, ...]}
+
+    name, supervisor_url and supervisor_token are required; instance_id
+    defaults to a slug of the name. Returns a list of dicts, or None when
+    the file is missing or invalid.
+    """
+    try:
+        with open(path, 'r') as fleet_file:
+            data = json.load(fleet_file)
+    except FileNotFoundError:
+        logger.error(f"Fleet file {path} not found")
+        return None
+    except ValueError as e:
+        logger.error(f"Fleet file {path} is not valid JSON: {e}")
+        return None
+
+    entries = data.get('instances') if isinstance(data, dict) else None
+    if not isinstance(entries, list) or not entries:
+        logger.error(f"Fleet file {path} has no 'instances' list")
+        return None
+
+    instances = []
+    seen = set()
+    for position, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict):
+            logger.error(f"Fleet instance #{position} is not an object")
+            return None
+        missing = [key for key in ('name', 'supervisor_url', 'supervisor_token') if not entry.get(key)]
+        if missing:
+            logger.error(f"Fleet instance #{position} is missing {', '.join(missing)}")
+            return None
+
+        instance = {
+            'name': entry['name'],
+            'instance_id': entry.get('instance_id') or _slug(entry['name']),
+            'supervisor_url': entry['supervisor_url'].rstrip('/'),
+            'supervisor_token': entry['supervisor_token'],
+            # Without a WebSocket URL the instance falls back to polling
+            'websocket_url': entry.get('websocket_url'),
+            'backup_time': entry.get('backup_time')
+        }
+        if instance['backup_time'] and not _TIME.match(instance['backup_time']):
+            logger.error(f"Fleet instance '{instance['name']}' has an invalid backup_time (expected HH:MM)")
+            return None
+        # The ID names the instance's data directory and metrics, so it must be unique
+        if instance['instance_id'] in seen:
+            logger.error(f"Fleet instance ID '{instance['instance_id']}' is used more than once")
+            return None
+        seen.add(instance['instance_id'])
+        instances.append(instance)
+
+    return instances
+
+
+def _slug(name):
+    return 'ha-' + (re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or 'instance')
+
+
+class BackupSlots:
+    """
+    Caps how many instances run a backup at the same time.
+
+    Waiting instances get a slot in the order they asked for one, so a site
+    with frequent triggers cannot keep the others waiting. Holding a slot
+    also gives the instance its share of the upload bandwidth.
+    """
+
+    def __init__(self, limit, bandwidth=None):
+        self.limit = max(1, limit)
+        # SharedBandwidth or None
+        self.bandwidth = bandwidth
+        self._running = set()
+        self._waiting = deque()
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self, name):
+        self.acquire(name)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def acquire(self, name):
+        with self._condition:
+            self._waiting.append(name)
+            while self._waiting[0] != name or len(self._running) >= self.limit:
+                self._condition.wait()
+            self._waiting.popleft()
+            self._running.add(name)
+            # The next waiter may fit into another free slot
+            self._condition.notify_all()
+        if self.bandwidth:
+            self.bandwidth.activate(name)
+
+    def release(self, name):
+        if self.bandwidth:
+            self.bandwidth.deactivate(name)
+        with self._condition:
+            self._running.discard(name)
+            self._condition.notify_all()
+
+    def status(self):
+        with self._condition:
+            return {'limit': self.limit, 'running': sorted(self._running), 'waiting': list(self._waiting)}
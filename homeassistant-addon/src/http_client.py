@@ -0,0 +1,50 @@
+"""Pooled HTTP sessions for the Supervisor and HomeSafe APIs"""
+import socket
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Keep idle connections alive through NAT/firewalls during long chunk uploads
+_KEEPALIVE_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+for _name, _value in (('TCP_KEEPIDLE', 60), ('TCP_KEEPINTVL', 20), ('TCP_KEEPCNT', 5)):
+    if hasattr(socket, _name):
+        _KEEPALIVE_OPTIONS.append((socket.IPPROTO_TCP, getattr(socket, _name), _value))
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter that enables TCP keep-alive on pooled connections"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = kwargs.get('socket_options', []) + _KEEPALIVE_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+def create_session(pool_size=4, retries=3, backoff_factor=1):
+    """
+    Create a requests.Session with a connection pool and retry policy.
+
+    Only idempotent requests are retried automatically; POSTs are left to the
+    caller (chunk uploads have their own retry loop).
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+        raise_on_status=False,
+        respect_retry_after_header=True
+    )
+    adapter = KeepAliveAdapter(
+        pool_connections=2,
+        pool_maxsize=pool_size,
+        max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
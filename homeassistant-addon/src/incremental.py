@@ -0,0 +1,188 @@
+"""Incremental backups at the level of the inner archives of a Supervisor snapshot"""
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import time
+import zlib
+
+logger = logging.getLogger('homesafe-connector')
+
+MANIFEST_NAME = 'homesafe-manifest.json'
+
+_COPY_SIZE = 4 * 1024 * 1024
+_BLOCK_SIZE = tarfile.BLOCKSIZE
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+class TarMemberIndex:
+    """
+    Name, size and SHA-256 of every member of the last uploaded snapshot.
+
+    Each member also remembers the HomeSafe backup that holds its content, so
+    a manifest always points straight at the upload containing the bytes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.backup_id = None
+        self.members = {}
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as index_file:
+                data = json.load(index_file)
+            self.backup_id = data.get('backup_id')
+            self.members = data.get('members', {})
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable tar member index {self.path}: {e}")
+        return self
+
+    def update(self, archive, backup_id):
+        """Record a successfully uploaded incremental archive"""
+        uploaded_at = time.time()
+        members = {}
+        for member in archive.members:
+            entry = {'size': member['size'], 'sha256': member['sha256']}
+            if member['backup_id'] is None:
+                entry.update(backup_id=backup_id, uploaded_at=uploaded_at)
+            else:
+                previous = self.members[member['name']]
+                entry.update(backup_id=previous['backup_id'], uploaded_at=previous['uploaded_at'])
+            members[member['name']] = entry
+
+        self.backup_id = backup_id
+        self.members = members
+        self._save()
+
+    def _save(self):
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w') as index_file:
+                json.dump({'backup_id': self.backup_id, 'members': self.members}, index_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write tar member index: {e}")
+
+
+class IncrementalArchive:
+    """Result of filtering a snapshot down to its changed members"""
+
+    def __init__(self, path, members, base_backup_id):
+        self.path = path
+        # Every member of the snapshot in order; backup_id is None when included here
+        self.members = members
+        self.base_backup_id = base_backup_id
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    @property
+    def included(self):
+        return [member for member in self.members if member['backup_id'] is None]
+
+    @property
+    def referenced(self):
+        return [member for member in self.members if member['backup_id'] is not None]
+
+
+def build_incremental_archive(source, output_path, index, max_reference_age):
+    """
+    Stream a snapshot tar and write only its changed members to output_path.
+
+    Members are hashed while they are copied out; an unchanged member is
+    truncated away again, so the snapshot is read once. Every member is still
+    written in full before it is compared, so disk use peaks at the changed
+    members plus the largest unchanged one. Gzipped members are hashed over
+    their decompressed content, as the gzip header carries a timestamp that
+    differs on every backup. A manifest listing every member
+    (included or referenced) is appended as the last entry. The output is
+    deterministic, so rebuilding it for a resumed upload gives the same bytes.
+    """
+    now = time.time()
+    members = []
+
+    with open(output_path, 'wb') as output, tarfile.open(fileobj=source, mode='r|') as snapshot:
+        for member in snapshot:
+            if not member.isfile():
+                continue
+
+            start = output.tell()
+            output.write(member.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+            digest = _copy_member(snapshot.extractfile(member), output)
+            _pad_block(output, member.size)
+
+            previous = index.members.get(member.name)
+            reusable = (
+                previous is not None
+                and previous.get('sha256') == digest
+                and previous.get('size') == member.size
+                # Old references are re-uploaded so retention can drop old backups
+                and now - previous.get('uploaded_at', 0) < max_reference_age
+            )
+            if reusable:
+                output.seek(start)
+                output.truncate()
+
+            members.append({
+                'name': member.name,
+                'size': member.size,
+                'sha256': digest,
+                'backup_id': previous['backup_id'] if reusable else None
+            })
+
+        manifest = json.dumps({
+            'type': 'incremental',
+            'base_backup_id': index.backup_id,
+            'members': members
+        }, indent=2).encode()
+        manifest_info = tarfile.TarInfo(MANIFEST_NAME)
+        manifest_info.size = len(manifest)
+        output.write(manifest_info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+        output.write(manifest)
+        _pad_block(output, len(manifest))
+
+        # End-of-archive marker
+        output.write(b'\0' * (_BLOCK_SIZE * 2))
+
+    return IncrementalArchive(output_path, members, index.backup_id)
+
+
+def _copy_member(member_file, output):
+    digest = hashlib.sha256()
+    decompressor = None
+    first = True
+    while True:
+        block = member_file.read(_COPY_SIZE)
+        if not block:
+            break
+        output.write(block)
+        if first:
+            first = False
+            if block[:2] == _GZIP_MAGIC:
+                decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        if decompressor is None:
+            digest.update(block)
+            continue
+        try:
+            digest.update(decompressor.decompress(block))
+            # Concatenated gzip members continue in a new decompressor
+            while decompressor.eof and decompressor.unused_data:
+                rest = decompressor.unused_data
+                decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+                digest.update(decompressor.decompress(rest))
+        except zlib.error:
+            # Not gzip after all: hash the remaining bytes as they are
+            decompressor = None
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _pad_block(output, size):
+    remainder = size % _BLOCK_SIZE
+    if remainder:
+        output.write(b'\0' * (_BLOCK_SIZE - remainder))
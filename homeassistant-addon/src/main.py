@@ -1,14 +1,47 @@
 #!/usr/bin/env python3
 import os
 import time
+import asyncio
+import hashlib
+import tarfile
 import logging
 import schedule
 import requests
 from datetime import datetime, timezone
 from pathlib import Path
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from threading import Thread
+from threading import Thread, Lock
+from upload_pipeline import UploadPipeline, ChunkUploadError
+from upload_journal import UploadJournal
+from http_client import create_session
+from supervisor_events import SupervisorEventListener
+from stream_transforms import (
+    open_compressed_stream, open_encrypted_stream, select_encryption, new_encryption_salt,
+    CODEC_NONE, ENCRYPTION_NONE
+)
+from chunking import ContentDefinedBoundary, ChunkIndex, CHUNKING_CDC
+from incremental import TarMemberIndex, build_incremental_archive
+from backup_jobs import BackupJob, BackupJobQueue, STATUS_SUCCEEDED
+from metrics import MetricsRegistry, RunHistory, CHUNK_BUCKETS
+from bandwidth import BandwidthLimiter, SharedBandwidth, parse_rate_schedule, MB
+from chunk_sizing import AdaptiveChunkSizer
+from config_sync import ConfigSyncIndex, collect_config_files
+from config_watcher import ConfigWatcher
+from connector_state import ConnectorState
+from fleet import BackupSlots, load_fleet
+from backup_tiers import load_tiers, SCHEDULE_HOURLY, SCHEDULE_WEEKLY, WEEKDAYS
+from async_engine import (
+    AsyncEngine, AsyncSupervisorClient, AsyncHomeSafeClient, asyncio_engine_available,
+    ENGINE_THREADS, ENGINE_ASYNCIO
+)
+from status_cache import CachedResource
+from retention import BackupIndex, RetentionPolicy, delete_in_batches, is_untiered_snapshot, HOMESAFE_PREFIX
+from api_server import enable_gzip, serve, API_SERVER_WAITRESS
+from snapshot_source import (
+    StreamedSnapshot, SpooledSnapshot, LocalSnapshot, spool_download, find_local_backup,
+    DOWNLOAD_MODE_AUTO, DOWNLOAD_MODE_SPOOL
+)
 
 # Setup logging
 logging.basicConfig(
@@ -24,8 +57,92 @@ AUTO_BACKUP = os.getenv('AUTO_BACKUP', 'true').lower() == 'true'
 BACKUP_TIME = os.getenv('BACKUP_TIME', '03:00')
 SUPERVISOR_TOKEN = os.getenv('SUPERVISOR_TOKEN', '')
 SUPERVISOR_URL = 'http://supervisor'
+SUPERVISOR_WS_URL = 'ws://supervisor/core/websocket'
 INSTANCE_NAME = os.getenv('INSTANCE_NAME', 'Home Assistant')
 INSTANCE_ID = os.getenv('INSTANCE_ID', '')
+UPLOAD_BUFFERS = int(os.getenv('UPLOAD_BUFFERS', '3'))
+UPLOAD_PARALLELISM = int(os.getenv('UPLOAD_PARALLELISM', '2'))
+UPLOAD_CHUNK_RETRIES = int(os.getenv('UPLOAD_CHUNK_RETRIES', '3'))
+DATA_DIR = Path(os.getenv('DATA_DIR', '/data'))
+UPLOAD_JOURNAL_FILE = 'upload_journal.json'
+MAX_UPLOAD_RESUME_ATTEMPTS = 5
+COMPRESSION = os.getenv('COMPRESSION', 'none')
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', '3'))
+COMPRESSION_THREADS = int(os.getenv('COMPRESSION_THREADS', '0'))
+ENCRYPTION = os.getenv('ENCRYPTION', ENCRYPTION_NONE)
+ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', '')
+CHUNKING = os.getenv('CHUNKING', 'fixed')
+CHUNK_INDEX_FILE = 'chunk_index.json'
+ADAPTIVE_CHUNK_SIZE = os.getenv('ADAPTIVE_CHUNK_SIZE', 'true').lower() == 'true'
+CHUNK_SIZE_MIN = int(os.getenv('CHUNK_SIZE_MIN', '8')) * 1024 * 1024
+CHUNK_SIZE_MAX = int(os.getenv('CHUNK_SIZE_MAX', '64')) * 1024 * 1024
+INCREMENTAL_BACKUPS = os.getenv('INCREMENTAL_BACKUPS', 'false').lower() == 'true'
+INCREMENTAL_FULL_INTERVAL_DAYS = int(os.getenv('INCREMENTAL_FULL_INTERVAL_DAYS', '30'))
+TAR_INDEX_FILE = 'tar_index.json'
+INCREMENTAL_ARCHIVE_FILE = 'incremental-upload.tar'
+RUN_HISTORY_FILE = 'run_history.json'
+CONNECTOR_STATE_FILE = 'connector_state.json'
+GITHUB_SYNC_DIR = DATA_DIR / 'github-sync'
+GITHUB_SYNC_INDEX_PATH = DATA_DIR / 'github_sync_index.json'
+GITHUB_SYNC_DEBOUNCE = int(os.getenv('GITHUB_SYNC_DEBOUNCE', '30'))
+GITHUB_SETTINGS_RECHECK = 3600  # With GitHub sync turned off, ask HomeSafe again at most hourly
+DOWNLOAD_MODE = os.getenv('DOWNLOAD_MODE', DOWNLOAD_MODE_AUTO)
+READ_LOCAL_BACKUPS = os.getenv('READ_LOCAL_BACKUPS', 'true').lower() == 'true'
+LOCAL_BACKUP_DIR = os.getenv('LOCAL_BACKUP_DIR', '/backup')
+UPLOAD_RATE_LIMIT = float(os.getenv('UPLOAD_RATE_LIMIT', '0'))  # MB/s, 0 = unlimited
+UPLOAD_RATE_SCHEDULE = os.getenv('UPLOAD_RATE_SCHEDULE', '')
+FLEET_FILE = os.getenv('FLEET_FILE', '')  # JSON list of instances; empty = back up this instance only
+FLEET_CONCURRENCY = int(os.getenv('FLEET_CONCURRENCY', '2'))
+FLEET_DATA_DIR = DATA_DIR / 'instances'
+ENGINE = os.getenv('ENGINE', ENGINE_THREADS)
+API_SERVER = os.getenv('API_SERVER', API_SERVER_WAITRESS)
+API_THREADS = int(os.getenv('API_THREADS', '4'))
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '7'))
+LOCAL_MAX_BACKUPS = int(os.getenv('LOCAL_MAX_BACKUPS', '3'))  # 0 = no limit
+LOCAL_MAX_SIZE_GB = float(os.getenv('LOCAL_MAX_SIZE_GB', '0'))  # 0 = no limit
+RETENTION_ALL_LOCAL_BACKUPS = os.getenv('RETENTION_ALL_LOCAL_BACKUPS', 'false').lower() == 'true'
+REMOTE_RETENTION_DAYS = int(os.getenv('REMOTE_RETENTION_DAYS', '0'))  # 0 = keep for the plan's retention
+REMOTE_MAX_BACKUPS = int(os.getenv('REMOTE_MAX_BACKUPS', '0'))
+REMOTE_MAX_SIZE_GB = float(os.getenv('REMOTE_MAX_SIZE_GB', '0'))
+BACKUP_INDEX_FILE = 'backup_index.json'
+BACKUP_TIERS = os.getenv('BACKUP_TIERS', '')  # JSON list of tiers; empty = one daily full backup
+TIERS_DIR = 'tiers'
+# Whole-stream recompression would change every chunk and defeat deduplication
+RECOMPRESS = COMPRESSION != CODEC_NONE and (CHUNKING != CHUNKING_CDC or ENCRYPTION != ENCRYPTION_NONE)
+EVENT_JOB_TIMEOUT = 3600  # Large systems can take a long time to archive
+EVENT_POLL_INTERVAL = 30  # Job status poll alongside the event wait, in case an event is lost
+VERSION_CHECK_TIMEOUT = 300  # Deadline of one scheduled version check (asyncio engine)
+STATUS_CACHE_TTL = 5  # Local state only; keeps tablet polling off the workers
+BACKUP_LIST_CACHE_TTL = 300  # Remote list; also refreshed right after each run
+# Backup fields the card shows; the rest of the row (storage paths, keys) stays off the unauthenticated LAN port
+BACKUP_LIST_FIELDS = ('id', 'filename', 'status', 'size_bytes', 'created_at', 'completed_at', 'ha_version', 'backup_trigger', 'backup_tier')
+RETENTION_INTERVAL = 3600
+RETENTION_TIMEOUT = 900
+
+# Prometheus metrics served on /api/metrics, labelled with the instance ID (one per fleet member)
+METRICS = MetricsRegistry()
+PHASE_DURATION = METRICS.histogram(
+    'homesafe_backup_phase_duration_seconds',
+    'Time spent in each phase of the backup workflow',
+    ['ha_instance', 'phase']
+)
+CHUNK_UPLOAD_DURATION = METRICS.histogram(
+    'homesafe_chunk_upload_duration_seconds',
+    'Latency of a single chunk POST to HomeSafe',
+    ['ha_instance'],
+    buckets=CHUNK_BUCKETS
+)
+BACKUP_RUNS = METRICS.counter('homesafe_backup_runs_total', 'Backup workflow runs by trigger and result', ['ha_instance', 'tier', 'trigger', 'result'])
+UPLOADED_BYTES = METRICS.counter('homesafe_uploaded_bytes_total', 'Bytes sent to HomeSafe in chunk uploads', ['ha_instance'])
+SKIPPED_BYTES = METRICS.counter('homesafe_skipped_bytes_total', 'Bytes not sent because HomeSafe already held them', ['ha_instance'])
+CHUNK_RETRIES = METRICS.counter('homesafe_chunk_retries_total', 'Chunk uploads retried after a failed attempt', ['ha_instance'])
+UPLOAD_THROUGHPUT = METRICS.gauge('homesafe_last_upload_throughput_bytes_per_second', 'Average throughput of the last chunk upload phase', ['ha_instance', 'tier'])
+LAST_SUCCESS = METRICS.gauge('homesafe_last_success_timestamp_seconds', 'Unix time of the last successful backup', ['ha_instance', 'tier'])
+BACKUP_IN_PROGRESS = METRICS.gauge('homesafe_backup_in_progress', '1 while a backup workflow is running', ['ha_instance', 'tier'])
+UPLOAD_RATE_LIMIT_GAUGE = METRICS.gauge('homesafe_upload_rate_limit_bytes_per_second', 'Upload rate limit in effect (0 = unlimited)', ['ha_instance'])
+THROTTLED_SECONDS = METRICS.counter('homesafe_upload_throttled_seconds_total', 'Time uploader workers waited on the bandwidth limiter', ['ha_instance'])
+RETENTION_DELETED = METRICS.counter('homesafe_retention_deleted_backups_total', 'Backups deleted by retention policies', ['ha_instance', 'location'])
+LOCAL_BACKUP_BYTES = METRICS.gauge('homesafe_local_backup_bytes', 'Size of the local Supervisor backups in the index', ['ha_instance'])
 
 # Flask app for API
 app = Flask(__name__)
@@ -33,24 +150,122 @@ CORS(app, resources={
     r"/api/*": {
         "origins": "*",
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "If-None-Match"],
+        "expose_headers": ["ETag"]
     }
 })
-connector_instance = None
+enable_gzip(app)
+
+# instance_id -> HomeSafeConnector; a single entry unless fleet mode is enabled
+connectors = {}
 
 class HomeSafeConnector:
-    def __init__(self):
+    def __init__(self, instance_name=INSTANCE_NAME, instance_id=INSTANCE_ID, supervisor_url=SUPERVISOR_URL,
+                 supervisor_token=SUPERVISOR_TOKEN, websocket_url=SUPERVISOR_WS_URL, data_dir=DATA_DIR,
+                 local_backup_dir=LOCAL_BACKUP_DIR if READ_LOCAL_BACKUPS else None, backup_time=BACKUP_TIME,
+                 bandwidth=None, backup_slots=None, engine=None, tier=None, events=None, snapshot_lock=None):
+        """
+        Defaults describe the add-on's own instance; fleet mode passes one set per remote host.
+        
+        With backup tiers there is one connector per tier of an instance, each
+        with its own data_dir and job queue; the tiers share the instance's
+        event listener and snapshot_lock, since the Supervisor creates one
+        backup at a time.
+        """
         self.api_url = API_URL
         self.api_key = API_KEY
-        self.supervisor_token = SUPERVISOR_TOKEN
-        self.supervisor_url = SUPERVISOR_URL
-        self.instance_name = INSTANCE_NAME
-        self.instance_id = INSTANCE_ID or self._generate_instance_id()
+        self.supervisor_token = supervisor_token
+        self.supervisor_url = supervisor_url
+        self.instance_name = instance_name
+        self.instance_id = instance_id or self._generate_instance_id()
+        # BackupTier, or None for the daily full backup
+        self.tier = tier
+        self.tier_name = tier.name if tier else 'full'
+        self.key = f'{self.instance_id}/{tier.name}' if tier else self.instance_id
+        self.snapshot_prefix = f'{HOMESAFE_PREFIX}{tier.name}-' if tier else HOMESAFE_PREFIX
+        self.snapshot_lock = snapshot_lock or Lock()
+        # Also applies local retention to backups not made by the connector (one connector per instance)
+        self.retains_foreign_backups = tier is None
+        self.backup_time = backup_time
+        # Mapped backup folder read directly instead of downloading (None = always download)
+        self.local_backup_dir = local_backup_dir
+        
+        # Journals, indexes and spool files of this instance
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.upload_journal_path = self.data_dir / UPLOAD_JOURNAL_FILE
+        self.chunk_index_path = self.data_dir / CHUNK_INDEX_FILE
+        self.tar_index_path = self.data_dir / TAR_INDEX_FILE
+        self.incremental_archive_path = self.data_dir / INCREMENTAL_ARCHIVE_FILE
+        # Local backups known to the retention policies, kept current without relisting
+        self.backup_index = BackupIndex(self.data_dir / BACKUP_INDEX_FILE).load()
+        self.local_retention = RetentionPolicy(RETENTION_DAYS, LOCAL_MAX_BACKUPS, int(LOCAL_MAX_SIZE_GB * 1024 * MB))
+        self.remote_retention = RetentionPolicy(REMOTE_RETENTION_DAYS, REMOTE_MAX_BACKUPS, int(REMOTE_MAX_SIZE_GB * 1024 * MB))
+        
+        # Pooled keep-alive sessions: one TLS handshake per connection instead of per request
+        self.supervisor_http = create_session(pool_size=4)
+        self.homesafe_http = create_session(pool_size=UPLOAD_PARALLELISM + 2)
+        self.events = events or SupervisorEventListener(websocket_url, self.supervisor_token)
+        # asyncio engine shared by all instances; None keeps the blocking requests calls
+        self.engine = engine
+        if engine:
+            self.async_supervisor = AsyncSupervisorClient(engine, self.supervisor_url, self.supervisor_token)
+            self.async_homesafe = AsyncHomeSafeClient(engine, self.api_url, self.api_key)
+        
+        # All backup triggers go through one worker so snapshots never run concurrently
+        self.jobs = BackupJobQueue(lambda job: self.perform_backup(job.trigger_type, job), name=f'homesafe-backup-{self.key}')
+        self.active_job = None
+        # Fleet mode: slots shared by all instances cap how many back up at once
+        self.backup_slots = backup_slots
+        self.history = RunHistory(self.data_dir / RUN_HISTORY_FILE)
+        self.state = ConnectorState(self.data_dir / CONNECTOR_STATE_FILE).load()
+        # Daily backup job registered by main(), for the next scheduled time
+        self.backup_schedule = None
+        # Core version a pre-update backup is queued for; recorded once a backup succeeds
+        self.pending_pre_update_version = None
+        # Snapshots served to the Lovelace card, refreshed in the background
+        self.status_cache = CachedResource('status', self._load_status, STATUS_CACHE_TTL)
+        self.backup_list_cache = CachedResource('backups', self._load_backup_list, BACKUP_LIST_CACHE_TTL)
+        self._backup_list = None
+        self._backup_list_etag = None
+        # Core update events trigger the version check instead of waiting for the hourly poll
+        if self.makes_pre_update_backups:
+            self.events.add_callback(self._on_supervisor_event)
+        self.events.add_callback(self._on_backup_event)
+        # Shared by all uploader workers so the limit applies to the whole uplink (a fair share of it in fleet mode)
+        self.bandwidth = bandwidth or BandwidthLimiter(UPLOAD_RATE_LIMIT * MB, parse_rate_schedule(UPLOAD_RATE_SCHEDULE))
         
         if not self.api_key:
             logger.error("API Key not configured! Please configure the add-on.")
             exit(1)
     
+    @property
+    def makes_pre_update_backups(self):
+        """Pre-update backups are made by the tiers that include Home Assistant"""
+        return self.tier is None or self.tier.full or self.tier.homeassistant
+    
+    def _set_job_phase(self, phase, bytes_total=None):
+        """Report the workflow phase of the backup job being run (if any)"""
+        if self.active_job:
+            self.active_job.set_phase(phase, bytes_total)
+    
+    def _set_job_progress(self, bytes_done, bytes_total=None):
+        if self.active_job:
+            self.active_job.set_progress(bytes_done, bytes_total)
+    
+    def _report_rate_limit(self):
+        """Publish the upload rate limit currently in effect (changes with the time windows)"""
+        rate = self.bandwidth.current_rate()
+        UPLOAD_RATE_LIMIT_GAUGE.set(rate, ha_instance=self.instance_id)
+        if self.active_job:
+            self.active_job.rate_limit = rate
+    
+    def _observe_phase(self, phase, seconds):
+        """Record how long a workflow phase took (metrics histogram and job timings)"""
+        PHASE_DURATION.observe(seconds, ha_instance=self.instance_id, phase=phase)
+        if self.active_job:
+            self.active_job.record_timing(phase, seconds)
+    
     def _generate_instance_id(self):
         """Generate a unique instance ID based on hostname"""
         import socket
@@ -66,25 +281,41 @@ class HomeSafeConnector:
         }
     
     def create_snapshot(self):
+        """Create a snapshot of this tier's content (one at a time per instance)"""
+        with self.snapshot_lock:
+            return self._create_snapshot()
+    
+    def _create_snapshot(self):
         """Create a new snapshot using Home Assistant Supervisor API with hybrid fallback"""
-        logger.info("Creating new snapshot...")
+        endpoint = self.tier.endpoint if self.tier else '/backups/new/full'
+        logger.info(f"Creating new snapshot ({self.tier.describe() if self.tier else 'full'})...")
         
         try:
             # Capture start time for fallback method
             backup_start_time = datetime.now(timezone.utc)
             
             # Payload with optional parameters for full backup
+            # With add-on side recompression the inner archives are left uncompressed,
+            # otherwise zstd would only see already gzipped data
             payload = {
-                'name': f'HomeSafe-{backup_start_time.strftime("%Y%m%d-%H%M%S")}',
-                'compressed': True
+                'name': f'{self.snapshot_prefix}{backup_start_time.strftime("%Y%m%d-%H%M%S")}',
+                'compressed': not RECOMPRESS
             }
+            if self.tier:
+                installed_addons = self.get_installed_addons() if self.tier.all_addons else ()
+                if installed_addons is None:
+                    return None
+                payload.update(self.tier.payload(installed_addons))
             expected_name = payload['name']  # Save expected name for fallback
             
-            logger.info(f"Starting backup job at: {self.supervisor_url}/backups/new/full")
+            if self.engine:
+                return self._create_snapshot_async(endpoint, payload, expected_name, backup_start_time)
+            
+            logger.info(f"Starting backup job at: {self.supervisor_url}{endpoint}")
             
             # Start the backup job (may take several minutes for large systems)
-            response = requests.post(
-                f'{self.supervisor_url}/backups/new/full',
+            response = self.supervisor_http.post(
+                f'{self.supervisor_url}{endpoint}',
                 headers=self._get_supervisor_headers(),
                 json=payload,
                 timeout=900  # 15 minutes timeout for large backups
@@ -116,69 +347,11 @@ class HomeSafeConnector:
             logger.info(f"Backup job started with ID: {job_id}")
             logger.info("Waiting for backup to complete (this may take several minutes)...")
             
-            # Poll for job completion with fallback detection
-            max_async_wait = 120  # 2 minutes for async method
-            poll_interval = 5  # Check every 5 seconds
-            elapsed = 0
-            unknown_state_time = 0  # Track time in "unknown" state
-            
-            while elapsed < max_async_wait:
-                time.sleep(poll_interval)
-                elapsed += poll_interval
-                
-                try:
-                    # Check job status
-                    job_url = f"{self.supervisor_url}/jobs/{job_id}"
-                    job_response = requests.get(
-                        job_url,
-                        headers=self._get_supervisor_headers(),
-                        timeout=10
-                    )
-                    
-                    if job_response.ok:
-                        job_status = job_response.json()
-                        
-                        if job_status.get('result') == 'ok':
-                            job_info = job_status.get('data', {})
-                            state = job_info.get('state', 'unknown')
-                            progress = job_info.get('progress', 0)
-                            
-                            logger.info(f"Job state: {state}, progress: {progress}% (waited {elapsed}s)")
-                            
-                            if state == 'completed':
-                                # Job completed - get the backup slug
-                                reference = job_info.get('reference')
-                                if reference:
-                                    logger.info(f"Snapshot created successfully: {reference}")
-                                    return reference
-                                else:
-                                    logger.error(f"Job completed but no reference found: {job_info}")
-                                    return None
-                            
-                            elif state == 'failed':
-                                error = job_info.get('errors', ['Unknown error'])
-                                logger.error(f"Backup job failed: {error}")
-                                return None
-                            
-                            elif state == 'unknown':
-                                # Track time in unknown state
-                                unknown_state_time += poll_interval
-                                if unknown_state_time >= max_async_wait:
-                                    logger.warning(f"Job state stuck at 'unknown' for {unknown_state_time}s")
-                                    logger.info("Switching to fallback method: backup discovery by listing")
-                                    return self._discover_backup_by_listing(expected_name, backup_start_time)
-                            else:
-                                # Reset unknown state counter if we get a different state
-                                unknown_state_time = 0
-                
-                except requests.exceptions.RequestException as poll_error:
-                    logger.warning(f"Error checking job status (will retry): {poll_error}")
-                    continue
-            
-            # If we exit the loop, try fallback
-            logger.warning(f"Async method timeout after {max_async_wait}s")
-            logger.info("Switching to fallback method: backup discovery by listing")
-            return self._discover_backup_by_listing(expected_name, backup_start_time)
+            wait_started = time.monotonic()
+            try:
+                return self._wait_for_backup_job(job_id, expected_name, backup_start_time)
+            finally:
+                self._observe_phase('job_wait', time.monotonic() - wait_started)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to create snapshot: {e}")
@@ -187,6 +360,172 @@ class HomeSafeConnector:
                 logger.error(f"Response text: {e.response.text[:500]}")
             return None
     
+    def _create_snapshot_async(self, endpoint, payload, expected_name, backup_start_time):
+        """Start the backup on the asyncio engine and wait for it under a deadline instead of a blocking POST"""
+        try:
+            job_data = self.engine.run(self.async_supervisor.start_backup(endpoint, payload))
+        except Exception as e:
+            logger.error(f"Failed to create snapshot: {e}")
+            return None
+        
+        job_id = job_data.get('job_id')
+        if not job_id:
+            snapshot_slug = job_data.get('slug')
+            if snapshot_slug:
+                logger.info(f"Snapshot created successfully (synchronous): {snapshot_slug}")
+                return snapshot_slug
+            logger.error(f"Failed to get job_id or slug from response: {job_data}")
+            return None
+        
+        logger.info(f"Backup job started in the background with ID: {job_id}")
+        wait_started = time.monotonic()
+        try:
+            job_info = self._wait_for_job_events(job_id) if self.events.connected else None
+            if not job_info:
+                # Cancelled at the deadline, so no poll outlives the wait
+                job_info = self.engine.run(self.async_supervisor.wait_for_job(job_id), timeout=EVENT_JOB_TIMEOUT)
+        except asyncio.TimeoutError:
+            job_info = None
+        finally:
+            self._observe_phase('job_wait', time.monotonic() - wait_started)
+        
+        if job_info:
+            return self._snapshot_from_finished_job(job_info)
+        logger.warning(f"Backup job not finished after {EVENT_JOB_TIMEOUT}s, looking for the backup by name")
+        return self._discover_backup_by_listing(expected_name, backup_start_time)
+    
+    def _wait_for_backup_job(self, job_id, expected_name, backup_start_time):
+        """Wait for the Supervisor backup job to finish and return the snapshot slug"""
+        # Prefer the completion event pushed by the Supervisor, poll only as a fallback
+        if self.events.connected:
+            job_info = self._wait_for_job_events(job_id)
+            if job_info:
+                return self._snapshot_from_finished_job(job_info)
+            logger.warning("No job completion event received, falling back to polling")
+        
+        # Poll for job completion with fallback detection
+        max_async_wait = 120  # 2 minutes for async method
+        poll_interval = 5  # Check every 5 seconds
+        elapsed = 0
+        unknown_state_time = 0  # Track time in "unknown" state
+        
+        while elapsed < max_async_wait:
+            time.sleep(poll_interval)
+            elapsed += poll_interval
+            
+            try:
+                # Check job status
+                job_url = f"{self.supervisor_url}/jobs/{job_id}"
+                job_response = self.supervisor_http.get(
+                    job_url,
+                    headers=self._get_supervisor_headers(),
+                    timeout=10
+                )
+                
+                if job_response.ok:
+                    job_status = job_response.json()
+                    
+                    if job_status.get('result') == 'ok':
+                        job_info = job_status.get('data', {})
+                        state = job_info.get('state')
+                        if state is None and 'done' in job_info:
+                            # Newer Supervisors report done/errors instead of a state
+                            if job_info['done']:
+                                state = 'failed' if job_info.get('errors') else 'completed'
+                            else:
+                                state = 'running'
+                        state = state or 'unknown'
+                        progress = job_info.get('progress', 0)
+                        
+                        logger.info(f"Job state: {state}, progress: {progress}% (waited {elapsed}s)")
+                        
+                        if state == 'completed':
+                            # Job completed - get the backup slug
+                            reference = job_info.get('reference')
+                            if reference:
+                                logger.info(f"Snapshot created successfully: {reference}")
+                                return reference
+                            else:
+                                logger.error(f"Job completed but no reference found: {job_info}")
+                                return None
+                        
+                        elif state == 'failed':
+                            error = job_info.get('errors', ['Unknown error'])
+                            logger.error(f"Backup job failed: {error}")
+                            return None
+                        
+                        elif state == 'unknown':
+                            # Track time in unknown state
+                            unknown_state_time += poll_interval
+                            if unknown_state_time >= max_async_wait:
+                                logger.warning(f"Job state stuck at 'unknown' for {unknown_state_time}s")
+                                logger.info("Switching to fallback method: backup discovery by listing")
+                                return self._discover_backup_by_listing(expected_name, backup_start_time)
+                        else:
+                            # Reset unknown state counter if we get a different state
+                            unknown_state_time = 0
+            
+            except requests.exceptions.RequestException as poll_error:
+                logger.warning(f"Error checking job status (will retry): {poll_error}")
+                continue
+        
+        # If we exit the loop, try fallback
+        logger.warning(f"Async method timeout after {max_async_wait}s")
+        logger.info("Switching to fallback method: backup discovery by listing")
+        return self._discover_backup_by_listing(expected_name, backup_start_time)
+    
+    def _wait_for_job_events(self, job_id):
+        """
+        Wait for a job's completion event, polling its status every
+        EVENT_POLL_INTERVAL seconds alongside in case the event is lost.
+        Returns the finished job, or None when the event connection drops
+        or the job is not done within EVENT_JOB_TIMEOUT.
+        """
+        deadline = time.monotonic() + EVENT_JOB_TIMEOUT
+        while self.events.connected:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            job_info = self.events.wait_for_job(job_id, timeout=min(EVENT_POLL_INTERVAL, remaining)) or self._fetch_job(job_id)
+            if job_info and (job_info.get('done') or job_info.get('state') in ('completed', 'failed')):
+                return job_info
+        return None
+    
+    def _fetch_job(self, job_id):
+        """Current data of a Supervisor job, or None when it cannot be read"""
+        if self.engine:
+            try:
+                return self.engine.run(self.async_supervisor.job(job_id), timeout=10)
+            except Exception as e:
+                logger.warning(f"Error checking job status (will retry): {e}")
+                return None
+        
+        try:
+            response = self.supervisor_http.get(
+                f'{self.supervisor_url}/jobs/{job_id}',
+                headers=self._get_supervisor_headers(),
+                timeout=10
+            )
+            response.raise_for_status()
+            return response.json().get('data', {})
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Error checking job status (will retry): {e}")
+            return None
+    
+    def _snapshot_from_finished_job(self, job_info):
+        """Get the backup slug from a finished job reported by a Supervisor event"""
+        if job_info.get('errors'):
+            logger.error(f"Backup job failed: {job_info['errors']}")
+            return None
+        
+        reference = job_info.get('reference')
+        if reference:
+            logger.info(f"Snapshot created successfully: {reference}")
+            return reference
+        
+        logger.error(f"Job completed but no reference found: {job_info}")
+        return None
+    
     def _discover_backup_by_listing(self, expected_name, start_time):
         """
         Fallback method: Discover backup by listing all backups
@@ -197,13 +536,14 @@ class HomeSafeConnector:
         logger.info(f"Created after: {start_time.isoformat()}")
         
         max_fallback_wait = 600  # 10 minutes
-        poll_interval = 10  # Check every 10 seconds
+        poll_interval = 10  # Re-list every 10 seconds, sooner when Supervisor events report backup activity
+        started = time.monotonic()
         elapsed = 0
         
         while elapsed < max_fallback_wait:
             try:
                 # List all backups
-                response = requests.get(
+                response = self.supervisor_http.get(
                     f'{self.supervisor_url}/backups',
                     headers=self._get_supervisor_headers(),
                     timeout=30
@@ -222,7 +562,7 @@ class HomeSafeConnector:
                             backup_date_str = backup.get('date', '')
                             
                             # Check if this is our backup
-                            if expected_name in backup_name or backup_name.startswith('HomeSafe-'):
+                            if expected_name in backup_name or backup_name.startswith(self.snapshot_prefix):
                                 # Convert backup date to datetime
                                 try:
                                     # Handle ISO format with or without 'Z'
@@ -237,6 +577,7 @@ class HomeSafeConnector:
                                         logger.info(f"   Slug: {backup_slug}")
                                         logger.info(f"   Date: {backup_date_str}")
                                         logger.info(f"   Size: {backup.get('size', 0)} bytes")
+                                        self._observe_phase('discovery', time.monotonic() - started)
                                         return backup_slug
                                 except (ValueError, AttributeError) as date_error:
                                     logger.warning(f"Could not parse backup date '{backup_date_str}': {date_error}")
@@ -247,16 +588,20 @@ class HomeSafeConnector:
             except requests.exceptions.RequestException as e:
                 logger.warning(f"Error listing backups (will retry): {e}")
             
-            time.sleep(poll_interval)
-            elapsed += poll_interval
+            if not self.events.connected:
+                time.sleep(poll_interval)
+            else:
+                self.events.wait_for_backup_activity(min(poll_interval, max_fallback_wait - elapsed))
+            elapsed = int(time.monotonic() - started)
         
         logger.error(f"Fallback method timeout - no backup found after {max_fallback_wait}s")
+        self._observe_phase('discovery', time.monotonic() - started)
         return None
     
     def get_snapshot_info(self, snapshot_slug):
         """Get information about a specific snapshot"""
         try:
-            response = requests.get(
+            response = self.supervisor_http.get(
                 f'{self.supervisor_url}/backups/{snapshot_slug}/info',
                 headers=self._get_supervisor_headers(),
                 timeout=30
@@ -267,51 +612,73 @@ class HomeSafeConnector:
             logger.error(f"Failed to get snapshot info: {e}")
             return None
     
-    def get_current_ha_version(self):
-        """Get current Home Assistant version"""
+    def get_core_info(self):
+        """Get Home Assistant Core info (version, version_latest, update_available)"""
+        if self.engine:
+            try:
+                return self.engine.run(self.async_supervisor.core_info(), timeout=30)
+            except Exception as e:
+                logger.error(f"Failed to get HA core info: {e}")
+                return None
+        
         try:
-            response = requests.get(
+            response = self.supervisor_http.get(
                 f'{self.supervisor_url}/core/info',
                 headers=self._get_supervisor_headers(),
                 timeout=30
             )
             response.raise_for_status()
-            core_data = response.json().get('data', {})
-            version = core_data.get('version', 'unknown')
-            logger.info(f"Current HA version: {version}")
-            return version
+            return response.json().get('data', {})
         except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to get HA version: {e}")
+            logger.error(f"Failed to get HA core info: {e}")
+            return None
+    
+    def get_installed_addons(self):
+        """Slugs of the installed add-ons, or None when the Supervisor cannot be asked"""
+        if self.engine:
+            try:
+                return self.engine.run(self.async_supervisor.installed_addons(), timeout=30)
+            except Exception as e:
+                logger.error(f"Failed to list installed add-ons: {e}")
+                return None
+        
+        try:
+            response = self.supervisor_http.get(
+                f'{self.supervisor_url}/addons',
+                headers=self._get_supervisor_headers(),
+                timeout=30
+            )
+            response.raise_for_status()
+            return [addon['slug'] for addon in response.json().get('data', {}).get('addons', [])]
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            logger.error(f"Failed to list installed add-ons: {e}")
             return None
     
-    def check_version_changed(self):
+    def get_current_ha_version(self):
+        """Get current Home Assistant version"""
+        core_data = self.get_core_info()
+        if core_data is None:
+            return None
+        version = core_data.get('version', 'unknown')
+        logger.info(f"Current HA version: {version}")
+        return version
+    
+    def check_version_changed(self, current_version=None):
         """Check if HA version changed since last backup"""
         try:
-            current_version = self.get_current_ha_version()
+            current_version = current_version or self.get_current_ha_version()
             if not current_version:
                 logger.warning("Could not determine current HA version")
                 return False
             
-            # Get last backup version from HomeSafe
-            response = requests.get(
-                f'{self.api_url}/backup-list-api-key',
-                headers={'x-api-key': self.api_key},
-                timeout=30
-            )
-            
-            if not response.ok:
-                logger.warning(f"Could not fetch backup list: {response.status_code}")
-                return False
-            
-            backups = response.json().get('backups', [])
+            # Recorded locally on every upload; HomeSafe is only asked when nothing is recorded yet
+            last_version = self.state.last_ha_version or self.get_last_remote_ha_version()
             
-            if not backups:
+            if not last_version:
                 logger.info("No previous backups found, version change check skipped")
                 return False
             
-            last_version = backups[0].get('ha_version')
-            
-            if last_version and last_version != current_version:
+            if last_version != current_version:
                 logger.info(f"🎯 HA version changed: {last_version} -> {current_version}")
                 return True
             
@@ -322,12 +689,70 @@ class HomeSafeConnector:
             logger.error(f"Error checking version change: {e}")
             return False
     
+    def get_last_remote_ha_version(self):
+        """HA version of the latest completed backup on HomeSafe, revalidated with its ETag"""
+        headers = {'x-api-key': self.api_key}
+        if self.state.remote_etag:
+            headers['If-None-Match'] = self.state.remote_etag
+        
+        response = self.homesafe_http.get(
+            f'{self.api_url}/backup-list-api-key',
+            headers=headers,
+            params={'latest': 1},
+            timeout=30
+        )
+        
+        if response.status_code == 304:
+            return self.state.remote_ha_version
+        
+        if not response.ok:
+            logger.warning(f"Could not fetch backup list: {response.status_code}")
+            return None
+        
+        backups = response.json().get('backups', [])
+        version = backups[0].get('ha_version') if backups else None
+        self.state.update(remote_etag=response.headers.get('ETag'), remote_ha_version=version)
+        return version
+    
+    def check_for_core_update(self):
+        """Queue a pre-update backup when a core update is waiting or has just been installed"""
+        core_data = self.get_core_info()
+        if core_data is None:
+            return False
+        
+        # Back up the running version once per available update, before it is installed;
+        # until a backup succeeds every check queues it again
+        latest = core_data.get('version_latest')
+        if core_data.get('update_available') and latest and latest != self.state.pre_update_version:
+            logger.info(f"🎯 Smart Backup: HA update {core_data.get('version')} -> {latest} available, creating pre-update backup...")
+            self.pending_pre_update_version = latest
+            self.jobs.submit('pre_update')
+            return True
+        
+        if self.check_version_changed(core_data.get('version')):
+            logger.info("🎯 Smart Backup: Creating pre-update backup...")
+            self.jobs.submit('pre_update')
+            return True
+        return False
+    
+    def _on_supervisor_event(self, event):
+        """React to core update availability and finished core updates as they are announced"""
+        if event.get('event') == 'job':
+            job = event.get('data', {})
+            relevant = job.get('name') == 'home_assistant_core_update' and job.get('done')
+        else:
+            relevant = event.get('event') == 'supervisor_update' and event.get('update_key') == 'core'
+        
+        if relevant:
+            # Runs Supervisor requests, so keep it off the event listener thread
+            Thread(target=self.check_for_core_update, name='homesafe-version-check', daemon=True).start()
+    
     def download_snapshot(self, snapshot_slug):
         """Download snapshot file from Supervisor (returns stream)"""
         logger.info(f"Downloading snapshot: {snapshot_slug}")
         
         try:
-            response = requests.get(
+            response = self.supervisor_http.get(
                 f'{self.supervisor_url}/backups/{snapshot_slug}/download',
                 headers=self._get_supervisor_headers(),
                 stream=True,
@@ -340,176 +765,659 @@ class HomeSafeConnector:
             logger.error(f"Failed to download snapshot: {e}")
             return None
     
-    def upload_to_homesafe(self, snapshot_slug, snapshot_stream, trigger_type='manual'):
-        """Upload snapshot to HomeSafe using direct upload with chunking"""
-        logger.info(f"Uploading snapshot to HomeSafe: {snapshot_slug} (trigger: {trigger_type})")
+    def open_snapshot(self, snapshot_slug, journal=None):
+        """Open a snapshot for reading: from the mapped /backup folder, streamed from the Supervisor, or spooled to /data first"""
+        spool_path = self.data_dir / f'snapshot-{snapshot_slug}.tar'
+        self._remove_stale_spools(keep=spool_path)
         
-        # Get snapshot info for metadata
-        snapshot_info = self.get_snapshot_info(snapshot_slug)
-        ha_version = snapshot_info.get('homeassistant', 'unknown') if snapshot_info else 'unknown'
+        # The archive already sits on this host; reading it in place skips the HTTP copy
+        if self.local_backup_dir:
+            local_path = find_local_backup(self.local_backup_dir, snapshot_slug)
+            if local_path:
+                try:
+                    snapshot = LocalSnapshot(local_path)
+                except OSError as e:
+                    logger.warning(f"Cannot read {local_path} directly, downloading instead: {e}")
+                else:
+                    logger.info(f"Reading snapshot directly from {local_path} ({snapshot.size} bytes)")
+                    if spool_path.exists():
+                        spool_path.unlink()
+                    return snapshot
+            else:
+                logger.info(f"Snapshot {snapshot_slug} not found in {self.local_backup_dir}, downloading from Supervisor")
         
-        try:
-            # Get file size from Content-Length header (streaming compatible)
-            file_size = int(snapshot_stream.headers.get('Content-Length', 0))
+        # A spool file left by an interrupted upload saves downloading the snapshot again
+        if spool_path.exists():
+            if journal and journal.snapshot_slug == snapshot_slug and spool_path.stat().st_size == journal.file_size:
+                logger.info(f"Resuming from spooled snapshot {spool_path}")
+                return SpooledSnapshot(spool_path)
+            spool_path.unlink()
+        
+        response = self.download_snapshot(snapshot_slug)
+        if not response:
+            return None
+        
+        content_length = int(response.headers.get('Content-Length', 0))
+        encoded = response.headers.get('Content-Encoding', 'identity') != 'identity'
+        
+        spool = DOWNLOAD_MODE == DOWNLOAD_MODE_SPOOL or (
+            DOWNLOAD_MODE == DOWNLOAD_MODE_AUTO and (not content_length or encoded)
+        )
+        if not spool:
+            file_size = content_length
             
             # Fallback: get size from snapshot info if header not available
             if file_size == 0:
                 logger.warning("Content-Length header not available, using snapshot info")
-                file_size = snapshot_info.get('size', 0)
+                snapshot_info = self.get_snapshot_info(snapshot_slug)
+                file_size = snapshot_info.get('size', 0) if snapshot_info else 0
             
-            if file_size == 0:
-                logger.error("Could not determine file size")
-                return False
+            return StreamedSnapshot(response, file_size)
+        
+        # Spooling gives the exact archive size whatever the response headers say
+        logger.info(f"Spooling snapshot to {spool_path} (Content-Length: {content_length or 'missing'}, encoded: {encoded})")
+        self._set_job_phase('spooling', 0 if encoded else content_length)
+        spool_started = time.monotonic()
+        try:
+            spool_download(
+                response,
+                spool_path,
+                expected_size=0 if encoded else content_length,
+                progress=self._set_job_progress
+            )
+        except (requests.exceptions.RequestException, OSError) as e:
+            logger.error(f"Failed to spool snapshot: {e}")
+            return None
+        finally:
+            response.close()
+        self._observe_phase('spool', time.monotonic() - spool_started)
+        
+        return SpooledSnapshot(spool_path)
+    
+    def _remove_stale_spools(self, keep):
+        """Delete spool files of other snapshots (left behind by a crash)"""
+        for stale in self.data_dir.glob('snapshot-*.tar'):
+            if stale != keep:
+                logger.info(f"Removing stale spooled snapshot {stale}")
+                try:
+                    stale.unlink()
+                except OSError as e:
+                    logger.warning(f"Failed to remove {stale}: {e}")
+    
+    def upload_to_homesafe(self, snapshot_slug, snapshot, trigger_type='manual', journal=None):
+        """Upload snapshot to HomeSafe using direct upload with chunking (resumes from journal if given)"""
+        logger.info(f"Uploading snapshot to HomeSafe: {snapshot_slug} (trigger: {trigger_type})")
+        
+        # Get snapshot info for metadata
+        snapshot_info = self.get_snapshot_info(snapshot_slug)
+        ha_version = snapshot_info.get('homeassistant', 'unknown') if snapshot_info else 'unknown'
+        
+        if INCREMENTAL_BACKUPS:
+            return self._upload_incremental(snapshot_slug, snapshot, ha_version, trigger_type, journal)
+        
+        if snapshot.size == 0:
+            logger.error("Could not determine file size")
+            return False
+        
+        backup_id = self._upload_source(snapshot_slug, snapshot.source, snapshot.size, ha_version, trigger_type, journal)
+        return backup_id is not None
+    
+    def _upload_incremental(self, snapshot_slug, snapshot, ha_version, trigger_type='manual', journal=None):
+        """Upload only the inner archives that changed since the last backup, plus a manifest"""
+        index = TarMemberIndex(self.tar_index_path).load()
+        
+        try:
+            logger.info("Indexing snapshot members for incremental upload...")
+            self._set_job_phase('indexing')
+            indexing_started = time.monotonic()
+            archive = build_incremental_archive(
+                snapshot.source,
+                self.incremental_archive_path,
+                index,
+                max_reference_age=INCREMENTAL_FULL_INTERVAL_DAYS * 86400
+            )
+            self._observe_phase('indexing', time.monotonic() - indexing_started)
+        except (OSError, tarfile.TarError) as e:
+            logger.error(f"Failed to build incremental archive: {e}")
+            self._remove_incremental_archive()
+            return False
+        
+        included = archive.included
+        referenced = archive.referenced
+        logger.info(
+            f"Snapshot has {len(archive.members)} members: {len(included)} changed "
+            f"({sum(m['size'] for m in included)} bytes), {len(referenced)} unchanged "
+            f"({sum(m['size'] for m in referenced)} bytes referenced from earlier backups)"
+        )
+        
+        # Without references the archive is a regular full backup plus the manifest
+        backup_metadata = {'backup_type': 'incremental', 'base_backup_id': archive.base_backup_id} if referenced else {'backup_type': 'full'}
+        
+        try:
+            archive_file = SpooledSnapshot(archive.path)
+            try:
+                backup_id = self._upload_source(
+                    snapshot_slug,
+                    archive_file.source,
+                    archive_file.size,
+                    ha_version,
+                    trigger_type,
+                    journal,
+                    backup_metadata=backup_metadata
+                )
+            finally:
+                archive_file.close()
+        finally:
+            # A resumed upload rebuilds the (deterministic) archive from the snapshot
+            self._remove_incremental_archive()
+        
+        if backup_id is None:
+            return False
+        
+        index.update(archive, backup_id)
+        return True
+    
+    def _remove_incremental_archive(self):
+        try:
+            os.remove(self.incremental_archive_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove incremental archive: {e}")
+    
+    def _upload_source(self, snapshot_slug, source, file_size, ha_version, trigger_type='manual', journal=None,
+                       backup_metadata=None):
+        """Upload a readable source of known size in chunks; returns the backup ID or None"""
+        logger.info(f"File size: {file_size} bytes ({file_size / (1024*1024*1024):.2f} GB)")
+        
+        try:
+            # Optional streaming recompression stage (file_size stays the uncompressed size)
+            upload_source, codec = open_compressed_stream(
+                source,
+                COMPRESSION if RECOMPRESS else CODEC_NONE,
+                level=COMPRESSION_LEVEL,
+                threads=COMPRESSION_THREADS
+            )
             
-            logger.info(f"File size: {file_size} bytes ({file_size / (1024*1024*1024):.2f} GB)")
+            # Content-defined chunking splits on the data itself so unchanged parts
+            # of the archive produce the same chunks as in the previous backup.
+            # Encrypted chunks differ in every backup, so there is nothing to deduplicate.
+            dedup = CHUNKING == CHUNKING_CDC and ENCRYPTION == ENCRYPTION_NONE
             
-            # Step 1: Initialize upload
-            logger.info("Step 1/2: Initializing upload...")
-            init_response = requests.post(
-                f'{self.api_url}/backup-upload?action=init',
-                headers={
-                    'x-api-key': self.api_key,
-                    'Content-Type': 'application/json'
-                },
-                json={
-                    'file_size': file_size,
-                    'ha_version': ha_version,
-                    'backup_trigger': trigger_type,
-                    'instance_name': self.instance_name,
-                    'instance_id': self.instance_id
-                },
-                timeout=300
-            )
-            init_response.raise_for_status()
-            init_data = init_response.json()
+            # Fixed-offset chunks either follow measured throughput or stay at 50MB
+            adaptive = ADAPTIVE_CHUNK_SIZE and not dedup
+            chunking = 'adaptive' if adaptive else CHUNKING
+            chunk_size = CHUNK_SIZE_MAX if adaptive else 50 * 1024 * 1024
             
-            if not init_data.get('success'):
-                logger.error(f"Init failed: {init_data.get('error')}")
-                return False
+            # Encryption runs after compression: ciphertext does not compress
+            encryption = select_encryption(ENCRYPTION)
+            if encryption != ENCRYPTION_NONE and not ENCRYPTION_KEY:
+                logger.error("Encryption is enabled but no encryption_key is configured")
+                return None
+            # Transformed streams have a different length than the snapshot: read until end of stream
+            transformed = codec != CODEC_NONE or encryption != ENCRYPTION_NONE
             
-            backup_id = init_data['backup_id']
-            storage_path = init_data['storage_path']
-            logger.info(f"Upload initialized. Backup ID: {backup_id}")
+            if journal and not journal.matches(snapshot_slug, file_size, chunk_size, codec, chunking, encryption):
+                logger.warning("Upload journal does not match this snapshot, starting over")
+                self._notify_upload_failed(journal.backup_id, "Superseded by a new upload")
+                journal.clear()
+                journal = None
             
-            # Step 2: Upload file in chunks to edge function
-            logger.info("Step 2/2: Uploading file (this may take several minutes)...")
-            chunk_size = 50 * 1024 * 1024  # 50MB chunks
-            uploaded_bytes = 0
-            chunk_number = 0
-            
-            while uploaded_bytes < file_size:
-                chunk_data = snapshot_stream.raw.read(chunk_size)
-                if not chunk_data:
-                    break
-                
-                chunk_number += 1
-                chunk_length = len(chunk_data)
-                
-                logger.info(f"Uploading chunk {chunk_number}: {uploaded_bytes + chunk_length}/{file_size} bytes ({((uploaded_bytes + chunk_length) / file_size * 100):.1f}%)")
-                
-                # Upload chunk
-                chunk_response = requests.post(
-                    f'{self.api_url}/backup-upload?action=chunk',
+            if journal:
+                # Step 1: Reuse the backup record of the interrupted upload
+                backup_id = journal.backup_id
+                logger.info(f"Step 1/2: Resuming upload. Backup ID: {backup_id} ({len(journal.acknowledged)} chunks, {journal.acknowledged_bytes} bytes already uploaded)")
+            else:
+                # Step 1: Initialize upload
+                logger.info("Step 1/2: Initializing upload...")
+                init_response = self.homesafe_http.post(
+                    f'{self.api_url}/backup-upload?action=init',
                     headers={
                         'x-api-key': self.api_key,
-                        'Content-Type': 'application/octet-stream',
+                        'Content-Type': 'application/json'
+                    },
+                    json={
+                        'file_size': file_size,
+                        'ha_version': ha_version,
+                        'backup_trigger': trigger_type,
+                        'instance_name': self.instance_name,
+                        'instance_id': self.instance_id,
+                        'codec': codec,
+                        'chunking': chunking,
+                        'encryption': encryption,
+                        'backup_tier': self.tier.name if self.tier else None,
+                        **(backup_metadata or {})
                     },
-                    params={
+                    timeout=300
+                )
+                init_response.raise_for_status()
+                init_data = init_response.json()
+                
+                if not init_data.get('success'):
+                    logger.error(f"Init failed: {init_data.get('error')}")
+                    return None
+                
+                backup_id = init_data['backup_id']
+                logger.info(f"Upload initialized. Backup ID: {backup_id}")
+                
+                journal = UploadJournal(
+                    self.upload_journal_path,
+                    snapshot_slug,
+                    backup_id,
+                    file_size,
+                    chunk_size,
+                    trigger_type=trigger_type,
+                    codec=codec,
+                    chunking=chunking,
+                    encryption=encryption,
+                    encryption_salt=new_encryption_salt().hex() if encryption != ENCRYPTION_NONE else None
+                )
+                journal.save()
+            
+            if encryption != ENCRYPTION_NONE:
+                upload_source = open_encrypted_stream(
+                    upload_source,
+                    encryption,
+                    ENCRYPTION_KEY,
+                    bytes.fromhex(journal.encryption_salt)
+                )
+                if upload_source is None:
+                    self._notify_upload_failed(backup_id, "Snapshot could not be encrypted")
+                    journal.clear()
+                    return None
+            
+            # A resumed upload first replays the chunk boundaries recorded in the journal
+            chunk_sizer = AdaptiveChunkSizer.from_journal(journal, CHUNK_SIZE_MIN, CHUNK_SIZE_MAX) if adaptive else None
+            
+            # Ask the backend which chunks of the previous backup it still holds
+            chunk_index = ChunkIndex(self.chunk_index_path)
+            stored_hashes = self._query_stored_chunks(backup_id, chunk_index.load()) if dedup else set()
+            manifest = {}
+            
+            def skip_chunk(chunk):
+                if dedup:
+                    manifest[chunk.number] = [chunk.digest, chunk.offset, chunk.length]
+                if journal.is_acknowledged(chunk.number, chunk.offset, chunk.length):
+                    return True
+                if dedup:
+                    if chunk.digest in stored_hashes:
+                        return True
+                    # Identical chunks later in the same archive are only sent once
+                    stored_hashes.add(chunk.digest)
+                return False
+            
+            # Step 2: Upload file in chunks to edge function
+            # A reader thread keeps downloading into a bounded buffer pool while
+            # several chunk POSTs are in flight (the backend places chunks by offset)
+            logger.info(f"Step 2/2: Uploading file with {UPLOAD_PARALLELISM} parallel connection(s) (this may take several minutes)...")
+            self._set_job_phase('uploading', 0 if transformed else file_size)
+            pipeline = UploadPipeline(
+                upload_source,
+                chunk_size,
+                buffer_count=UPLOAD_BUFFERS,
+                workers=UPLOAD_PARALLELISM,
+                total_size=0 if transformed else file_size,
+                max_attempts=1 + UPLOAD_CHUNK_RETRIES,
+                skip_chunk=skip_chunk,
+                boundary=ContentDefinedBoundary() if dedup else None,
+                # Every chunk is hashed for the backend to verify; CDC also uses it as the dedup key
+                digest=hashlib.sha256,
+                chunk_sizer=chunk_sizer
+            )
+            
+            def upload_chunk(chunk):
+                # Recorded first: the part may be stored even when the answer never arrives
+                if not dedup:
+                    journal.record_planned(chunk.number, chunk.offset, chunk.length)
+                chunk_started = time.monotonic()
+                status, text = self._post_chunk(
+                    {
                         'backup_id': backup_id,
-                        'chunk_number': chunk_number,
-                        'offset': uploaded_bytes
+                        'chunk_number': chunk.number,
+                        'offset': chunk.offset,
+                        'sha256': chunk.digest,
+                        **({'chunk_hash': chunk.digest} if dedup else {})
                     },
-                    data=chunk_data,
-                    timeout=1800  # 30 minutes per chunk
+                    chunk.data,
+                    # Derived from measured throughput once known, otherwise 30 minutes per chunk
+                    timeout=chunk_sizer.timeout(chunk.length) if chunk_sizer else 1800
                 )
+                CHUNK_UPLOAD_DURATION.observe(time.monotonic() - chunk_started, ha_instance=self.instance_id)
+                
+                if status >= 400:
+                    logger.error(f"Chunk upload failed: {status} - {text}")
+                    raise ChunkUploadError(f"Chunk upload failed: {status}")
                 
-                if not chunk_response.ok:
-                    logger.error(f"Chunk upload failed: {chunk_response.status_code} - {chunk_response.text}")
-                    # Notify backend of failure
-                    requests.post(
-                        f'{self.api_url}/backup-upload?action=fail',
-                        headers={
-                            'x-api-key': self.api_key,
-                            'Content-Type': 'application/json'
-                        },
-                        json={
-                            'backup_id': backup_id,
-                            'error_message': f"Chunk upload failed: {chunk_response.status_code}"
-                        },
-                        timeout=300
-                    )
-                    return False
+                journal.record_chunk(chunk.number, chunk.offset, chunk.length)
+                UPLOADED_BYTES.inc(chunk.length, ha_instance=self.instance_id)
+                self._report_rate_limit()
+                uploaded_bytes = pipeline.bytes_skipped + pipeline.bytes_uploaded + chunk.length
+                self._set_job_progress(uploaded_bytes)
+                if not transformed:
+                    logger.info(f"Uploaded chunk {chunk.number}: {uploaded_bytes}/{file_size} bytes ({(uploaded_bytes / file_size * 100):.1f}%)")
+                else:
+                    logger.info(f"Uploaded chunk {chunk.number}: {uploaded_bytes} {codec}/{encryption} bytes (snapshot size {file_size} bytes)")
+            
+            # action=complete is only sent once every chunk has been acknowledged
+            upload_started = time.monotonic()
+            throttled_before = self.bandwidth.throttled_seconds
+            self._report_rate_limit()
+            uploaded = pipeline.run(upload_chunk)
+            upload_seconds = time.monotonic() - upload_started
+            throttled = self.bandwidth.throttled_seconds - throttled_before
+            THROTTLED_SECONDS.inc(throttled, ha_instance=self.instance_id)
+            if self.active_job and throttled:
+                self.active_job.record_timing('throttled', throttled)
+            # Reads overlap the uploads, so download time is the reader's time blocked on the source
+            self._observe_phase('download', pipeline.read_seconds)
+            self._observe_phase('hash', pipeline.hash_seconds)
+            self._observe_phase('upload', upload_seconds)
+            if chunk_sizer:
+                sizes = chunk_sizer.summary()
+                logger.info(f"Adaptive chunk sizes: {sizes['min_bytes'] / MB:.0f}-{sizes['max_bytes'] / MB:.0f} MB (average {sizes['average_bytes'] / MB:.1f} MB over {sizes['chunks']} chunks, {sizes['failures']} failed attempts)")
+                if self.active_job:
+                    self.active_job.summary['chunk_sizes'] = sizes
+            SKIPPED_BYTES.inc(pipeline.bytes_skipped, ha_instance=self.instance_id)
+            CHUNK_RETRIES.inc(pipeline.chunk_retries, ha_instance=self.instance_id)
+            if upload_seconds > 0:
+                UPLOAD_THROUGHPUT.set(pipeline.bytes_uploaded / upload_seconds, ha_instance=self.instance_id, tier=self.tier_name)
+            
+            if not uploaded:
+                error_message = pipeline.error or 'Not all chunks were acknowledged'
+                if journal.attempts < MAX_UPLOAD_RESUME_ATTEMPTS:
+                    logger.warning(f"Upload interrupted ({error_message}), it will resume from chunk progress on the next run")
+                    return None
                 
-                uploaded_bytes += chunk_length
+                # Notify backend of failure
+                self._notify_upload_failed(backup_id, error_message)
+                journal.clear()
+                return None
             
-            logger.info("All chunks uploaded successfully")
+            if pipeline.chunks_skipped:
+                logger.info(f"All chunks uploaded successfully ({pipeline.chunks_uploaded} sent, {pipeline.chunks_skipped} already stored)")
+            else:
+                logger.info(f"All {pipeline.chunks_uploaded} chunks uploaded successfully")
             
             # Step 3: Mark upload as complete
             logger.info("Finalizing backup...")
-            complete_response = requests.post(
+            self._set_job_phase('finalizing')
+            finalize_started = time.monotonic()
+            complete_response = self.homesafe_http.post(
                 f'{self.api_url}/backup-upload?action=complete',
                 headers={
                     'x-api-key': self.api_key,
                     'Content-Type': 'application/json'
                 },
                 json={
-                    'backup_id': backup_id
+                    'backup_id': backup_id,
+                    'file_size': pipeline.bytes_read,
+                    # SHA-256 of the uploaded stream, for the backend to record and verify against
+                    'sha256': pipeline.file_digest.hexdigest(),
+                    # Ordered [hash, offset, length] list the backend assembles the archive from
+                    **({'manifest': [manifest[number] for number in sorted(manifest)]} if dedup else {})
                 },
                 timeout=300
             )
             complete_response.raise_for_status()
+            self._observe_phase('finalize', time.monotonic() - finalize_started)
+            journal.clear()
             
-            logger.info(f"Backup uploaded successfully! Backup ID: {backup_id}")
-            return True
+            if dedup:
+                chunk_index.save(entry[0] for entry in manifest.values())
+                logger.info(f"Deduplication: {pipeline.chunks_skipped}/{len(manifest)} chunks ({pipeline.bytes_skipped} bytes) were already stored")
+            
+            if codec != CODEC_NONE:
+                logger.info(f"Uploaded {pipeline.bytes_read} {codec} bytes for a {file_size} byte snapshot ({(1 - pipeline.bytes_read / file_size) * 100:.1f}% smaller)")
+            self.state.record_upload(ha_version, backup_id)
+            logger.info(f"Backup uploaded successfully! Backup ID: {backup_id} (SHA-256 {pipeline.file_digest.hexdigest()})")
+            return backup_id
                 
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to upload to HomeSafe: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 logger.error(f"Response: {e.response.text[:500]}")
-            return False
+            return None
+    
+    def _post_chunk(self, params, data, timeout):
+        """POST one chunk through the bandwidth limiter; returns (status, response text)"""
+        if self.engine:
+            # The deadline cancels the request on the loop before the pipeline reuses the buffer
+            try:
+                return self.engine.run(self.async_homesafe.post_chunk(params, data, self.bandwidth), timeout=timeout)
+            except asyncio.TimeoutError:
+                raise ChunkUploadError(f"Chunk upload exceeded its {timeout:.0f}s deadline")
+        
+        response = self.homesafe_http.post(
+            f'{self.api_url}/backup-upload?action=chunk',
+            headers={
+                'x-api-key': self.api_key,
+                'Content-Type': 'application/octet-stream',
+            },
+            params=params,
+            data=self.bandwidth.wrap(data) if self.bandwidth.enabled else data,
+            timeout=timeout
+        )
+        return response.status_code, response.text
+    
+    def _query_stored_chunks(self, backup_id, candidate_hashes):
+        """Ask the backend which of the candidate chunk hashes it already stores (action=have)"""
+        candidates = sorted(candidate_hashes)
+        stored = set()
+        batch_size = 1000
+        
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start + batch_size]
+            try:
+                response = self.homesafe_http.post(
+                    f'{self.api_url}/backup-upload?action=have',
+                    headers={
+                        'x-api-key': self.api_key,
+                        'Content-Type': 'application/json'
+                    },
+                    json={
+                        'backup_id': backup_id,
+                        'hashes': batch
+                    },
+                    timeout=60
+                )
+                response.raise_for_status()
+                stored.update(response.json().get('have', []))
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # Without an answer every chunk is simply uploaded again
+                logger.warning(f"Could not query stored chunks: {e}")
+                break
+        
+        if candidates:
+            logger.info(f"Backend still holds {len(stored)}/{len(candidates)} chunks of the previous backup")
+        return stored
+    
+    def _notify_upload_failed(self, backup_id, error_message):
+        """Tell the backend an upload was abandoned"""
+        try:
+            self.homesafe_http.post(
+                f'{self.api_url}/backup-upload?action=fail',
+                headers={
+                    'x-api-key': self.api_key,
+                    'Content-Type': 'application/json'
+                },
+                json={
+                    'backup_id': backup_id,
+                    'error_message': error_message
+                },
+                timeout=300
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Failed to report upload failure: {e}")
+    
+    def has_pending_upload(self):
+        """Check if an interrupted upload is waiting to be resumed"""
+        return UploadJournal.load(self.upload_journal_path) is not None
+    
+    def _load_pending_upload(self):
+        """Load the journal of an interrupted upload if it can still be resumed"""
+        journal = UploadJournal.load(self.upload_journal_path)
+        if not journal:
+            return None
+        
+        if journal.attempts >= MAX_UPLOAD_RESUME_ATTEMPTS:
+            logger.warning(f"Giving up on interrupted upload of {journal.snapshot_slug} after {journal.attempts} resume attempts")
+            self._notify_upload_failed(journal.backup_id, f"Upload abandoned after {journal.attempts} resume attempts")
+            journal.clear()
+            self.delete_local_snapshot(journal.snapshot_slug)
+            return None
+        
+        if not self.get_snapshot_info(journal.snapshot_slug):
+            logger.warning(f"Local snapshot {journal.snapshot_slug} of interrupted upload is gone, cannot resume")
+            self._notify_upload_failed(journal.backup_id, "Local snapshot no longer available for resume")
+            journal.clear()
+            return None
+        
+        journal.attempts += 1
+        journal.save()
+        return journal
+    
+    def perform_backup(self, trigger_type='manual', job=None):
+        """Complete backup workflow: create, download, and upload (job receives live progress)"""
+        if job is None:
+            job = BackupJob(trigger_type)
+            job.start()
+        self.active_job = job
+        self.status_cache.invalidate()
+        if self.backup_slots:
+            job.set_phase('waiting_for_slot')
+            self.backup_slots.acquire(self.key)
+        BACKUP_IN_PROGRESS.set(1, ha_instance=self.instance_id, tier=self.tier_name)
+        started = time.monotonic()
+        success = False
+        try:
+            success = self._backup_workflow(trigger_type)
+            pre_update_version = self.pending_pre_update_version
+            if success and pre_update_version:
+                # Any backup that succeeds while the update waits is its safety snapshot
+                self.state.update(pre_update_version=pre_update_version)
+                self.pending_pre_update_version = None
+            return success
+        finally:
+            self._observe_phase('total', time.monotonic() - started)
+            if not success and job.error is None:
+                job.error = f"Backup failed during {job.phase}"
+            job.finish(success)
+            self._record_run(job, success)
+            BACKUP_IN_PROGRESS.set(0, ha_instance=self.instance_id, tier=self.tier_name)
+            if self.backup_slots:
+                self.backup_slots.release(self.key)
+            self.active_job = None
+    
+    def _record_run(self, job, success):
+        """Update run counters and append the run to the rolling history"""
+        BACKUP_RUNS.inc(ha_instance=self.instance_id, tier=self.tier_name, trigger=job.trigger_type, result='success' if success else 'failure')
+        if success:
+            LAST_SUCCESS.set(time.time(), ha_instance=self.instance_id, tier=self.tier_name)
+        
+        run = job.to_dict()
+        upload_seconds = job.timings.get('upload')
+        if upload_seconds:
+            run['throughput_bytes_per_sec'] = round(job.bytes_done / upload_seconds)
+        self.history.add(run)
+        self.status_cache.invalidate()
+        self.backup_list_cache.invalidate()
+    
+    def _load_status(self):
+        """Connector state for the card, built from local data only"""
+        runs = self.history.recent()
+        last_success = next((run for run in runs if run.get('status') == STATUS_SUCCEEDED), None)
+        next_run = self.backup_schedule.next_run if self.backup_schedule else None
+        active_job = self.active_job
+        return {
+            'status': 'running',
+            'instance_id': self.instance_id,
+            'instance_name': self.instance_name,
+            'tier': self.tier_name,
+            'schedule': self.tier.schedule if self.tier else 'daily',
+            'auto_backup': AUTO_BACKUP,
+            'backup_time': self.backup_time,
+            'next_backup': next_run.astimezone().isoformat() if next_run else None,
+            'active_job': active_job.to_dict() if active_job else None,
+            'pending_upload': self.has_pending_upload(),
+            'last_run': runs[0] if runs else None,
+            'last_success': last_success,
+            'last_upload_at': self.state.last_upload_at,
+            'last_ha_version': self.state.last_ha_version
+        }
     
+    def _load_backup_list(self):
+        """Recent backups on HomeSafe, revalidated with the ETag of the previous list"""
+        headers = {'x-api-key': self.api_key}
+        if self._backup_list_etag:
+            headers['If-None-Match'] = self._backup_list_etag
+        
+        response = self.homesafe_http.get(f'{self.api_url}/backup-list-api-key', headers=headers, timeout=30)
+        if response.status_code == 304 and self._backup_list is not None:
+            return self._backup_list
+        response.raise_for_status()
+        
+        self._backup_list = [
+            {field: backup.get(field) for field in BACKUP_LIST_FIELDS}
+            for backup in response.json().get('backups', [])
+        ]
+        self._backup_list_etag = response.headers.get('ETag')
+        return self._backup_list
     
-    def perform_backup(self, trigger_type='manual'):
-        """Complete backup workflow: create, download, and upload"""
-        logger.info(f"=== Starting backup workflow (trigger: {trigger_type}) ===")
+    def _backup_workflow(self, trigger_type):
+        logger.info(f"=== Starting backup workflow for {self.instance_name} (trigger: {trigger_type}) ===")
         start_time = time.time()
         
-        # Step 1: Create snapshot
-        snapshot_slug = self.create_snapshot()
-        if not snapshot_slug:
-            logger.error("Backup workflow failed: Could not create snapshot")
-            return False
+        # Step 1: Resume an interrupted upload, or create a new snapshot
+        journal = self._load_pending_upload()
+        if journal:
+            snapshot_slug = journal.snapshot_slug
+            trigger_type = journal.trigger_type
+            self._set_job_phase('resuming')
+            logger.info(f"Resuming interrupted upload of snapshot {snapshot_slug} (attempt {journal.attempts}/{MAX_UPLOAD_RESUME_ATTEMPTS})")
+        else:
+            self._set_job_phase('creating_snapshot')
+            snapshot_started = time.monotonic()
+            snapshot_slug = self.create_snapshot()
+            self._observe_phase('snapshot_create', time.monotonic() - snapshot_started)
+            if not snapshot_slug:
+                logger.error("Backup workflow failed: Could not create snapshot")
+                return False
+            self.backup_index.note_created(snapshot_slug)
         
-        # Step 2: Download snapshot (returns stream)
-        snapshot_stream = self.download_snapshot(snapshot_slug)
-        if not snapshot_stream:
+        # Step 2: Open snapshot (streamed, or spooled to /data first)
+        self._set_job_phase('downloading')
+        snapshot = self.open_snapshot(snapshot_slug, journal)
+        if not snapshot:
             logger.error("Backup workflow failed: Could not download snapshot")
             return False
         
-        logger.info("Snapshot downloaded (streaming mode - minimal memory usage)")
+        logger.info(f"Snapshot opened ({type(snapshot).__name__}, {snapshot.size} bytes)")
         
         # Step 3: Upload to Supabase Storage
-        success = self.upload_to_homesafe(snapshot_slug, snapshot_stream, trigger_type)
+        try:
+            success = self.upload_to_homesafe(snapshot_slug, snapshot, trigger_type, journal)
+        finally:
+            snapshot.close()
+        
+        # A spooled copy is only worth keeping while the upload can still resume
+        if success or not self.has_pending_upload():
+            snapshot.discard()
         
-        # Step 4: Delete local backup immediately after upload (success or failure)
+        # Step 4: Delete local backup immediately after upload, unless the upload can still resume
+        self._set_job_phase('cleanup')
         if success:
             logger.info("Upload successful, deleting local backup to save disk space...")
+            self.delete_local_snapshot(snapshot_slug)
+        elif self.has_pending_upload():
+            logger.warning("Upload failed, keeping local backup so the upload can resume...")
         else:
             logger.warning("Upload failed, deleting local backup to save disk space...")
-        self.delete_local_snapshot(snapshot_slug)
+            self.delete_local_snapshot(snapshot_slug)
         
         elapsed_time = time.time() - start_time
         logger.info(f"=== Backup workflow completed in {elapsed_time:.2f}s - {'SUCCESS' if success else 'FAILED'} ===")
         
-        # Step 5: Sync YAML configs to GitHub if backup was successful
-        if success:
-            try:
-                github_sync = GitHubSync(self.api_key)
-                logger.info("Starting GitHub YAML sync...")
-                github_sync.sync_yaml_configs()
-            except Exception as git_error:
-                logger.warning(f"GitHub sync failed (backup was successful): {git_error}")
-        
+        # GitHub YAML sync runs in its own watcher, not at the end of the backup
         return success
     
     def delete_local_snapshot(self, snapshot_slug):
@@ -517,7 +1425,7 @@ class HomeSafeConnector:
         try:
             # Step 1: Check if backup exists first
             logger.info(f"Checking if backup {snapshot_slug} exists...")
-            check_response = requests.get(
+            check_response = self.supervisor_http.get(
                 f'{self.supervisor_url}/backups/{snapshot_slug}/info',
                 headers=self._get_supervisor_headers(),
                 timeout=30
@@ -526,185 +1434,292 @@ class HomeSafeConnector:
             # If backup doesn't exist (404), just log and return
             if check_response.status_code == 404:
                 logger.info(f"Backup {snapshot_slug} already deleted or not found (skip)")
+                self.backup_index.remove(snapshot_slug)
                 return
             
             check_response.raise_for_status()
             
             # Step 2: If exists, delete it
             logger.info(f"Deleting local snapshot: {snapshot_slug}")
-            response = requests.post(
+            response = self.supervisor_http.post(
                 f'{self.supervisor_url}/backups/{snapshot_slug}/remove',
                 headers=self._get_supervisor_headers(),
                 timeout=30
             )
             response.raise_for_status()
             logger.info(f"Successfully deleted local snapshot: {snapshot_slug}")
+            self.backup_index.remove(snapshot_slug)
             
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
                 logger.info(f"Backup {snapshot_slug} not found (already deleted)")
+                self.backup_index.remove(snapshot_slug)
             else:
                 logger.warning(f"Failed to delete snapshot {snapshot_slug}: {e}")
         except Exception as e:
             logger.warning(f"Failed to delete snapshot {snapshot_slug}: {e}")
     
-    def cleanup_old_snapshots(self):
-        """Remove old local snapshots to save space (keeps 3 most recent)"""
+    def _on_backup_event(self, event):
+        """Keep the backup index current from finished Supervisor backup jobs"""
+        if event.get('event') != 'job':
+            return
+        job = event.get('data', {})
+        if job.get('done') and not job.get('errors') and job.get('reference') and (job.get('name') or '').startswith('backup_manager'):
+            self.backup_index.note_created(job['reference'])
+    
+    def apply_retention(self):
+        """Delete expired local backups and ask HomeSafe to prune expired remote ones"""
+        # Never race the workflow over the snapshot it is creating or uploading
+        if self.jobs.is_busy():
+            logger.info(f"Backup of {self.instance_name} in progress, postponing retention")
+            return False
+        
+        local_ok = self._apply_local_retention()
+        remote_ok = self._apply_remote_retention()
+        return local_ok and remote_ok
+    
+    def _apply_local_retention(self):
         try:
-            response = requests.get(
+            self._refresh_backup_index()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Could not refresh the local backup index: {e}")
+            return False
+        
+        entries = self.backup_index.entries()
+        LOCAL_BACKUP_BYTES.set(sum(entry['size'] for entry in entries), ha_instance=self.instance_id)
+        if not self.local_retention.enabled:
+            return True
+        entries = [entry for entry in entries if self._retains(entry['name'])]
+        # The snapshot of an interrupted upload is still needed to resume it
+        journal = UploadJournal.load(self.upload_journal_path)
+        if journal:
+            entries = [entry for entry in entries if entry['slug'] != journal.snapshot_slug]
+        
+        expired = self.local_retention.expired(entries)
+        if not expired:
+            return True
+        
+        logger.info(f"Retention: deleting {len(expired)} expired local backups ({sum(entry['size'] for entry in expired)} bytes)")
+        removed = delete_in_batches([entry['slug'] for entry in expired], self._remove_backup)
+        self.backup_index.remove(*removed)
+        RETENTION_DELETED.inc(len(removed), ha_instance=self.instance_id, location='local')
+        LOCAL_BACKUP_BYTES.set(sum(entry['size'] for entry in self.backup_index.entries()), ha_instance=self.instance_id)
+        return len(removed) == len(expired)
+    
+    def _retains(self, backup_name):
+        """Whether local retention of this connector covers the backup"""
+        if backup_name.startswith(self.snapshot_prefix):
+            return True
+        if self.tier and self.retains_foreign_backups and is_untiered_snapshot(backup_name):
+            # Full snapshots from before tiers were enabled belong to the first tier
+            return True
+        return RETENTION_ALL_LOCAL_BACKUPS and self.retains_foreign_backups and not backup_name.startswith(HOMESAFE_PREFIX)
+    
+    def _refresh_backup_index(self):
+        """Bring the index up to date: a full listing when due, otherwise only the backups announced since"""
+        # Without the event stream, backups made elsewhere are only seen by listing
+        if not self.events.connected:
+            self.backup_index.mark_stale()
+        
+        if self.backup_index.needs_reconcile():
+            response = self.supervisor_http.get(
                 f'{self.supervisor_url}/backups',
                 headers=self._get_supervisor_headers(),
+                timeout=60
+            )
+            response.raise_for_status()
+            data = response.json().get('data', {})
+            # Supervisors before 2021.x called them snapshots
+            backups = data.get('backups', data.get('snapshots', []))
+            self.backup_index.reconcile(backups)
+            logger.info(f"Backup index rebuilt: {len(backups)} local backups")
+            return
+        
+        for snapshot_slug in self.backup_index.pending():
+            response = self.supervisor_http.get(
+                f'{self.supervisor_url}/backups/{snapshot_slug}/info',
+                headers=self._get_supervisor_headers(),
                 timeout=30
             )
+            if response.status_code == 404:
+                self.backup_index.remove(snapshot_slug)
+                continue
             response.raise_for_status()
-            
-            snapshots = response.json().get('data', {}).get('snapshots', [])
-            
-            # Keep only the 3 most recent snapshots locally
-            if len(snapshots) > 3:
-                snapshots_to_delete = sorted(
-                    snapshots,
-                    key=lambda x: x.get('date', ''),
-                    reverse=True
-                )[3:]
-                
-                for snapshot in snapshots_to_delete:
-                    slug = snapshot.get('slug')
-                    logger.info(f"Deleting old local snapshot (cleanup): {slug}")
-                    requests.post(
-                        f'{self.supervisor_url}/backups/{slug}/remove',
-                        headers=self._get_supervisor_headers(),
-                        timeout=30
-                    )
-        except Exception as e:
-                logger.warning(f"Failed to cleanup old snapshots: {e}")
+            self.backup_index.add(response.json().get('data', {}))
+    
+    def _remove_backup(self, snapshot_slug):
+        """Remove one indexed backup (no existence check: a missing backup counts as removed)"""
+        try:
+            response = self.supervisor_http.post(
+                f'{self.supervisor_url}/backups/{snapshot_slug}/remove',
+                headers=self._get_supervisor_headers(),
+                timeout=60
+            )
+            if response.status_code == 404:
+                logger.info(f"Backup {snapshot_slug} already deleted")
+                return True
+            response.raise_for_status()
+            logger.info(f"Deleted expired local backup: {snapshot_slug}")
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Failed to delete expired backup {snapshot_slug}: {e}")
+            return False
+    
+    def _apply_remote_retention(self):
+        """HomeSafe deletes this instance's (or tier's) expired backups in one batch (action=prune)"""
+        if not self.remote_retention.enabled:
+            return True
+        
+        try:
+            response = self.homesafe_http.post(
+                f'{self.api_url}/backup-upload?action=prune',
+                headers={
+                    'x-api-key': self.api_key,
+                    'Content-Type': 'application/json'
+                },
+                json={
+                    'instance_id': self.instance_id,
+                    'backup_tier': self.tier.name if self.tier else None,
+                    **self.remote_retention.to_dict()
+                },
+                timeout=120
+            )
+            response.raise_for_status()
+            result = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Remote retention failed: {e}")
+            return False
+        
+        deleted = result.get('deleted', 0)
+        if deleted:
+            logger.info(f"Retention: HomeSafe deleted {deleted} expired backups ({result.get('freed_bytes', 0)} bytes)")
+            RETENTION_DELETED.inc(deleted, ha_instance=self.instance_id, location='remote')
+            self.backup_list_cache.invalidate()
+        return True
 
 class GitHubSync:
     """Sync Home Assistant YAML configurations to GitHub"""
     
-    def __init__(self, api_key):
+    def __init__(self, api_key, session=None):
         self.api_key = api_key
+        self.homesafe_http = session or create_session()
         self.api_url = API_URL
         self.ha_config_path = Path('/config')
         self.supervisor_url = SUPERVISOR_URL
         self.supervisor_token = SUPERVISOR_TOKEN
+        # While GitHub sync is off, the settings are not fetched again before this time
+        self._disabled_until = 0
     
     def get_user_github_settings(self):
-        """Fetch user's GitHub settings from HomeSafe API"""
-        try:
-            response = requests.get(
-                f'{self.api_url}/github-sync-config',
-                headers={'x-api-key': self.api_key},
-                timeout=30
-            )
-            
-            if response.ok:
-                data = response.json()
-                settings = data.get('settings')
-                
-                if settings and settings.get('github_enabled'):
-                    return {
-                        'token': settings.get('github_token'),
-                        'repo': settings.get('github_repo'),
-                        'branch': settings.get('github_branch', 'main')
-                    }
-            
-            return None
-        except Exception as e:
-            logger.error(f"Failed to fetch GitHub settings: {e}")
-            return None
+        """Fetch user's GitHub settings from HomeSafe API (None when sync is off; raises when unreachable)"""
+        response = self.homesafe_http.get(
+            f'{self.api_url}/github-sync-config',
+            headers={'x-api-key': self.api_key},
+            timeout=30
+        )
+        response.raise_for_status()
+        settings = response.json().get('settings')
+        
+        if settings and settings.get('github_enabled'):
+            return {
+                'token': settings.get('github_token'),
+                'repo': settings.get('github_repo'),
+                'branch': settings.get('github_branch', 'main')
+            }
+        return None
     
     def sync_yaml_configs(self):
-        """Sync all YAML configuration files to GitHub"""
+        """
+        Commit and push the YAML files that changed since the last sync.
+        
+        Returns True when synced, False when the sync failed and should be
+        retried, and None when GitHub sync is not configured or disabled.
+        """
+        if not self.ha_config_path.is_dir():
+            logger.warning(f"{self.ha_config_path} is not mounted, GitHub sync skipped")
+            return None
+        
         try:
+            index = ConfigSyncIndex(GITHUB_SYNC_INDEX_PATH).load()
+            config_files = collect_config_files(self.ha_config_path)
+            
+            if not config_files:
+                # Nothing to push until a YAML file appears
+                logger.warning(f"No YAML files found in {self.ha_config_path}")
+                return None
+            
+            changed, removed, entries = index.diff(self.ha_config_path, config_files)
+            
+            if time.monotonic() < self._disabled_until:
+                return None
             settings = self.get_user_github_settings()
             
             if not settings:
+                self._disabled_until = time.monotonic() + GITHUB_SETTINGS_RECHECK
                 logger.info("GitHub sync not configured or disabled")
-                return False
+                return None
             
-            logger.info("Starting GitHub YAML sync...")
+            # A new target repository or branch needs every file, changed or not
+            retarget = (index.repo, index.branch) != (settings['repo'], settings['branch'])
+            if not changed and not removed and not retarget:
+                # Nothing to push: skip the fetch and push entirely
+                logger.info(f"GitHub sync: no changes in {len(config_files)} YAML files")
+                if entries != index.files:
+                    index.save(index.repo, index.branch, entries)
+                return True
             
             # Import git here to avoid errors if not installed
             try:
-                from git import Repo, Actor
+                from git import Actor
             except ImportError:
                 logger.error("GitPython not installed! Cannot sync to GitHub.")
                 return False
             
-            # Create temp directory for git repo
-            temp_dir = Path('/tmp/ha-config-sync')
-            if temp_dir.exists():
-                import shutil
-                shutil.rmtree(temp_dir)
-            temp_dir.mkdir(parents=True)
-            
-            # Clone or init repo
-            repo_url = f"https://{settings['token']}@github.com/{settings['repo']}.git"
-            
-            try:
-                logger.info(f"Cloning repository: {settings['repo']}")
-                repo = Repo.clone_from(
-                    repo_url,
-                    temp_dir,
-                    branch=settings['branch'],
-                    depth=1
-                )
-            except Exception as clone_error:
-                logger.warning(f"Clone failed, initializing new repo: {clone_error}")
-                repo = Repo.init(temp_dir)
-                origin = repo.create_remote('origin', repo_url)
-                
-                # Try to fetch existing branch
-                try:
-                    origin.fetch()
-                    repo.git.checkout(settings['branch'])
-                except:
-                    # Create new branch
-                    repo.git.checkout('-b', settings['branch'])
-            
-            # Copy YAML files
-            yaml_files = list(self.ha_config_path.glob('*.yaml')) + \
-                        list(self.ha_config_path.glob('*.yml'))
-            
-            if not yaml_files:
-                logger.warning("No YAML files found in /config")
-                return False
+            if retarget:
+                # A different target repository starts from a fresh clone with every file
+                logger.info(f"GitHub sync target is now {settings['repo']} ({settings['branch']}), syncing all files")
+                self._remove_working_copy()
+                index.files = {}
+                changed, removed, entries = index.diff(self.ha_config_path, config_files)
             
-            logger.info(f"Found {len(yaml_files)} YAML files to sync")
+            logger.info(f"Starting GitHub YAML sync ({len(changed)} changed, {len(removed)} removed)...")
+            git_env = self._git_credentials_env(settings)
+            repo = self._open_working_copy(settings, git_env)
             
-            for yaml_file in yaml_files:
-                dest = temp_dir / yaml_file.name
+            import shutil
+            for relative in changed:
+                dest = GITHUB_SYNC_DIR / relative
                 try:
-                    import shutil
-                    shutil.copy2(yaml_file, dest)
-                    logger.debug(f"Copied: {yaml_file.name}")
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(self.ha_config_path / relative, dest)
+                    logger.debug(f"Copied: {relative}")
                 except Exception as copy_error:
-                    logger.warning(f"Failed to copy {yaml_file.name}: {copy_error}")
+                    logger.warning(f"Failed to copy {relative}: {copy_error}")
+                    entries.pop(relative, None)
+            for relative in removed:
+                try:
+                    (GITHUB_SYNC_DIR / relative).unlink()
+                    logger.debug(f"Removed: {relative}")
+                except FileNotFoundError:
+                    pass
             
-            # Check if there are changes
-            if not repo.is_dirty(untracked_files=True):
+            # Files already identical in the repository (e.g. after a re-clone) leave nothing to commit
+            if repo.is_dirty(untracked_files=True):
+                repo.git.add(A=True)
+                
+                author = Actor("HomeSafe Backup", "backup@homesafe.app")
+                commit_message = f"Auto-sync YAML configs - {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC"
+                repo.index.commit(commit_message, author=author, committer=author)
+                logger.info(f"Created commit: {commit_message}")
+                
+                with repo.git.custom_environment(**git_env):
+                    repo.remote('origin').push(settings['branch'])
+                logger.info(f"✅ Pushed to GitHub: {settings['repo']} (branch: {settings['branch']})")
+            else:
                 logger.info("No changes to commit")
-                return True
-            
-            # Add all files
-            repo.git.add(A=True)
-            
-            # Commit
-            author = Actor("HomeSafe Backup", "backup@homesafe.app")
-            commit_message = f"Auto-sync YAML configs - {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC"
-            repo.index.commit(commit_message, author=author, committer=author)
-            logger.info(f"Created commit: {commit_message}")
-            
-            # Push
-            origin = repo.remote('origin')
-            origin.push(settings['branch'])
-            logger.info(f"✅ Pushed to GitHub: {settings['repo']} (branch: {settings['branch']})")
-            
-            # Cleanup
-            import shutil
-            shutil.rmtree(temp_dir)
             
+            # Only recorded once pushed, so a failed push is retried on the next sync
+            index.save(settings['repo'], settings['branch'], entries)
             return True
             
         except Exception as e:
@@ -713,81 +1728,389 @@ class GitHubSync:
             import traceback
             logger.error(traceback.format_exc())
             return False
+    
+    def _git_credentials_env(self, settings):
+        """
+        Environment that hands the token to git through a credential helper
+        for each command, so it is never written to the working copy's
+        .git/config. Only the environment variable name is in the helper.
+        """
+        return {
+            'HOMESAFE_GITHUB_TOKEN': settings['token'],
+            'GIT_TERMINAL_PROMPT': '0',
+            # The empty value drops credential helpers configured elsewhere
+            'GIT_CONFIG_COUNT': '2',
+            'GIT_CONFIG_KEY_0': 'credential.helper',
+            'GIT_CONFIG_VALUE_0': '',
+            'GIT_CONFIG_KEY_1': 'credential.helper',
+            'GIT_CONFIG_VALUE_1': '!f() { test "$1" = get && echo username=x-access-token && echo "password=$HOMESAFE_GITHUB_TOKEN"; }; f'
+        }
+    
+    def _open_working_copy(self, settings, git_env):
+        """Persistent clone under /data, fast-forwarded to the remote branch"""
+        from git import Repo, InvalidGitRepositoryError, NoSuchPathError, GitCommandError
+        
+        repo_url = f"https://github.com/{settings['repo']}.git"
+        branch = settings['branch']
+        
+        try:
+            repo = Repo(GITHUB_SYNC_DIR)
+        except (InvalidGitRepositoryError, NoSuchPathError):
+            repo = None
+        
+        if repo is None:
+            self._remove_working_copy()
+            try:
+                logger.info(f"Cloning repository: {settings['repo']}")
+                return Repo.clone_from(repo_url, GITHUB_SYNC_DIR, branch=branch, depth=1, env=git_env)
+            except Exception as clone_error:
+                logger.warning(f"Clone failed, initializing new repo: {clone_error}")
+                self._remove_working_copy()
+                repo = Repo.init(GITHUB_SYNC_DIR)
+                repo.create_remote('origin', repo_url)
+        
+        # Clones made by earlier versions had the token in the remote URL
+        origin = repo.remote('origin')
+        origin.set_url(repo_url)
+        
+        try:
+            with repo.git.custom_environment(**git_env):
+                origin.fetch(branch)
+        except GitCommandError:
+            # Branch does not exist on the remote yet: the first push creates it
+            if not repo.head.is_valid() or repo.active_branch.name != branch:
+                repo.git.checkout('-B', branch)
+            return repo
+        
+        remote_head = f'origin/{branch}'
+        if not repo.head.is_valid() or repo.active_branch.name != branch:
+            repo.git.checkout('-B', branch, remote_head)
+        try:
+            repo.git.merge('--ff-only', remote_head)
+        except GitCommandError:
+            # Only a commit whose push failed can diverge; its files are copied again anyway
+            logger.warning("GitHub working copy diverged from the remote, resetting it")
+            repo.git.reset('--hard', remote_head)
+        return repo
+    
+    def _remove_working_copy(self):
+        if GITHUB_SYNC_DIR.exists():
+            import shutil
+            shutil.rmtree(GITHUB_SYNC_DIR)
 
 # Flask API Endpoints
+def request_connector():
+    """Connector named by ?instance=<instance_id>&tier=<tier>, each defaulting to the first one"""
+    instance_id = request.args.get('instance')
+    tier = request.args.get('tier')
+    return next((
+        connector for connector in connectors.values()
+        if (not instance_id or connector.instance_id == instance_id) and (not tier or connector.tier_name == tier)
+    ), None)
+
+def connector_not_found():
+    if (request.args.get('instance') or request.args.get('tier')) and connectors:
+        return jsonify({'success': False, 'error': 'Unknown instance or tier'}), 404
+    return jsonify({'success': False, 'error': 'Connector not initialized'}), 500
+
 @app.route('/api/backup/trigger', methods=['POST'])
 def trigger_backup():
     """Trigger a manual backup"""
     try:
-        if not connector_instance:
-            return jsonify({'success': False, 'error': 'Connector not initialized'}), 500
+        connector = request_connector()
+        if not connector:
+            return connector_not_found()
         
-        # Run backup in background thread
-        def run_backup():
-            connector_instance.perform_backup('manual')
+        # Queue the backup; a trigger during a running backup joins that job
+        job, coalesced = connector.jobs.submit('manual')
         
-        Thread(target=run_backup, daemon=True).start()
-        
-        return jsonify({'success': True, 'message': 'Backup started'})
+        return jsonify({
+            'success': True,
+            'message': 'Backup already in progress' if coalesced else 'Backup started',
+            'job_id': job.id,
+            'coalesced': coalesced,
+            'job': job.to_dict()
+        })
     
     except Exception as e:
         logger.error(f"Error triggering backup: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/backup/jobs', methods=['GET'])
+def list_backup_jobs():
+    """List queued, running and recently finished backup jobs"""
+    connector = request_connector()
+    if not connector:
+        return connector_not_found()
+    
+    return jsonify({
+        'success': True,
+        'jobs': [job.to_dict() for job in connector.jobs.jobs()]
+    })
+
+@app.route('/api/backup/jobs/<job_id>', methods=['GET'])
+def get_backup_job(job_id):
+    """Report live phase, bytes and throughput of a backup job"""
+    if not connectors:
+        return jsonify({'success': False, 'error': 'Connector not initialized'}), 500
+    
+    # Job IDs are unique across instances, so no ?instance= is needed
+    job = next((job for job in (c.jobs.get(job_id) for c in connectors.values()) if job), None)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Phase timings, chunk latencies and transfer counters in Prometheus text format"""
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics/history', methods=['GET'])
+def get_run_history():
+    """Summaries of recent backup runs (phase timings, bytes, result)"""
+    connector = request_connector()
+    if not connector:
+        return connector_not_found()
+    
+    return jsonify({'success': True, 'runs': connector.history.recent()})
+
+def cached_response(resource, key):
+    """Serve a cached snapshot with a weak ETag, answering 304 when the client's copy is current"""
+    snapshot = resource.get()
+    if snapshot is None:
+        return jsonify({'success': False, 'error': resource.error or 'Not available yet'}), 503
+    
+    response = jsonify({
+        'success': True,
+        key: snapshot.payload,
+        'updated_at': snapshot.changed_at,
+        'stale': resource.error is not None
+    })
+    response.set_etag(snapshot.etag, weak=True)
+    # Browsers revalidate every time, which costs a 304 and no upstream call
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
-    """Get addon status"""
-    try:
-        return jsonify({
-            'success': True,
-            'status': 'running',
-            'auto_backup': AUTO_BACKUP,
-            'backup_time': BACKUP_TIME
+    """Connector status: schedule, active job and last run results (cached)"""
+    connector = request_connector()
+    if not connector:
+        return connector_not_found()
+    
+    return cached_response(connector.status_cache, 'status')
+
+@app.route('/api/backups', methods=['GET'])
+def get_backups():
+    """Recent backups stored on HomeSafe (cached)"""
+    connector = request_connector()
+    if not connector:
+        return connector_not_found()
+    
+    return cached_response(connector.backup_list_cache, 'backups')
+
+@app.route('/api/fleet', methods=['GET'])
+def get_fleet():
+    """Every instance with its cached status, plus the shared backup slots in fleet mode"""
+    instances = []
+    for connector in connectors.values():
+        snapshot = connector.status_cache.get()
+        instances.append(snapshot.payload if snapshot else {
+            'instance_id': connector.instance_id,
+            'instance_name': connector.instance_name
         })
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    slots = next((c.backup_slots for c in connectors.values() if c.backup_slots), None)
+    return jsonify({
+        'success': True,
+        'fleet': bool(FLEET_FILE),
+        'instances': instances,
+        'slots': slots.status() if slots else None
+    })
 
 def run_flask():
     """Run Flask API in background"""
-    app.run(host='0.0.0.0', port=8099, debug=False, use_reloader=False)
+    serve(app, '0.0.0.0', 8099, server=API_SERVER, threads=API_THREADS)
 
-def main():
-    global connector_instance
+def create_engine():
+    """The asyncio engine when enabled and aiohttp is installed, else None (blocking calls)"""
+    if ENGINE != ENGINE_ASYNCIO:
+        return None
+    if not asyncio_engine_available():
+        logger.warning("aiohttp not installed, falling back to the threaded engine")
+        return None
+    logger.info("Using the asyncio engine for Supervisor and HomeSafe calls and scheduling")
+    return AsyncEngine().start()
+
+def create_connectors(engine=None):
+    """The add-on's own instance, or every instance of the fleet file; with backup tiers one connector per tier of each"""
+    tiers = load_tiers(BACKUP_TIERS)
+    if tiers is None:
+        logger.error("Invalid backup_tiers, exiting")
+        exit(1)
+    
+    if not FLEET_FILE:
+        # The tiers upload through one limiter, so together they stay within the limit
+        bandwidth = BandwidthLimiter(UPLOAD_RATE_LIMIT * MB, parse_rate_schedule(UPLOAD_RATE_SCHEDULE))
+        return create_instance_connectors(tiers, lambda key: bandwidth, engine=engine)
+    
+    instances = load_fleet(FLEET_FILE)
+    if not instances:
+        logger.error("Fleet mode enabled but no valid instances loaded, exiting")
+        exit(1)
+    
+    # Concurrent backups share the upload limit evenly and are capped fleet-wide
+    bandwidth = SharedBandwidth(UPLOAD_RATE_LIMIT * MB, parse_rate_schedule(UPLOAD_RATE_SCHEDULE))
+    slots = BackupSlots(FLEET_CONCURRENCY, bandwidth)
+    logger.info(f"Fleet mode: {len(instances)} instances, at most {slots.limit} backing up at once")
+    fleet_connectors = []
+    for instance in instances:
+        fleet_connectors.extend(create_instance_connectors(
+            tiers,
+            bandwidth.share,
+            instance_name=instance['name'],
+            instance_id=instance['instance_id'],
+            supervisor_url=instance['supervisor_url'],
+            supervisor_token=instance['supervisor_token'],
+            websocket_url=instance['websocket_url'],
+            data_dir=FLEET_DATA_DIR / instance['instance_id'],
+            # Remote hosts' backup folders are not mapped into this container
+            local_backup_dir=None,
+            backup_time=instance['backup_time'] or BACKUP_TIME,
+            backup_slots=slots,
+            engine=engine
+        ))
+    return fleet_connectors
+
+def create_instance_connectors(tiers, bandwidth, **options):
+    """
+    The connectors of one instance: a single full-backup connector, or one
+    per backup tier with its own data directory, sharing the instance's
+    event listener and snapshot lock. bandwidth(key) returns the upload
+    limiter of the connector with that key.
+    """
+    instance_id = options.get('instance_id')
+    if not tiers:
+        return [HomeSafeConnector(bandwidth=bandwidth(instance_id), **options)]
+    
+    events = SupervisorEventListener(options.get('websocket_url', SUPERVISOR_WS_URL), options.get('supervisor_token', SUPERVISOR_TOKEN))
+    snapshot_lock = Lock()
+    tiers_dir = Path(options.pop('data_dir', DATA_DIR)) / TIERS_DIR
+    tier_connectors = [
+        HomeSafeConnector(
+            data_dir=tiers_dir / tier.name,
+            bandwidth=bandwidth(f'{instance_id}/{tier.name}'),
+            tier=tier,
+            events=events,
+            snapshot_lock=snapshot_lock,
+            **options
+        )
+        for tier in tiers
+    ]
+    # Backups not made by the connector are retained by the first tier only
+    tier_connectors[0].retains_foreign_backups = True
+    return tier_connectors
+
+def schedule_connector(connector):
+    """Backups (daily, or on the tier's schedule), hourly version check, resume check and retention of one connector"""
+    engine = connector.engine
+    
+    def every(name, seconds, job, timeout):
+        # On the asyncio engine each run is its own task with a deadline, so one stuck job delays no other
+        if engine:
+            return engine.every(f'{connector.key}:{name}', seconds, job, timeout=timeout)
+        return schedule.every(seconds).seconds.do(job)
+    
+    # Schedule automatic backups if enabled
+    if AUTO_BACKUP:
+        def submit_scheduled():
+            connector.jobs.submit('scheduled')
+        
+        tier = connector.tier
+        at = (tier.at if tier else None) or connector.backup_time
+        if tier and tier.schedule == SCHEDULE_HOURLY:
+            connector.backup_schedule = every('backup', 3600, submit_scheduled, 60)
+            when = 'hourly'
+        elif tier and tier.schedule == SCHEDULE_WEEKLY:
+            if engine:
+                connector.backup_schedule = engine.weekly(f'{connector.key}:backup', WEEKDAYS.index(tier.weekday), at, submit_scheduled, timeout=60)
+            else:
+                connector.backup_schedule = getattr(schedule.every(), tier.weekday).at(at).do(submit_scheduled)
+            when = f'every {tier.weekday} at {at}'
+        elif engine:
+            connector.backup_schedule = engine.daily(f'{connector.key}:backup', at, submit_scheduled, timeout=60)
+            when = f'daily at {at}'
+        else:
+            connector.backup_schedule = schedule.every().day.at(at).do(submit_scheduled)
+            when = f'daily at {at}'
+        logger.info(f"Scheduled {when} backup of {connector.instance_name}" + (f" ({tier.name}: {tier.describe()})" if tier else ''))
+    
+    # Hourly version check (Smart Scheduling); Supervisor core update events trigger it immediately
+    if connector.makes_pre_update_backups:
+        every('version_check', 3600, connector.check_for_core_update, VERSION_CHECK_TIMEOUT)
+    
+    # Retry interrupted uploads without waiting for the next scheduled backup
+    def resume_interrupted_upload():
+        """Resume an upload left behind by a failed chunk or a restart"""
+        if connector.has_pending_upload() and not connector.jobs.is_busy():
+            logger.info(f"Found interrupted upload of {connector.instance_name}, resuming...")
+            connector.jobs.submit('manual')
+    
+    every('resume_check', 15 * 60, resume_interrupted_upload, 60)
     
+    # Local and remote retention; the backup index makes a run cheap when nothing expired
+    every('retention', RETENTION_INTERVAL, connector.apply_retention, RETENTION_TIMEOUT)
+
+def main():
     logger.info("HomeSafe Connector started")
     logger.info(f"API URL: {API_URL}")
     logger.info(f"Auto backup: {AUTO_BACKUP}")
     logger.info(f"Backup time: {BACKUP_TIME}")
     
-    connector = HomeSafeConnector()
-    connector_instance = connector
+    engine = create_engine()
+    for connector in create_connectors(engine):
+        connectors[connector.key] = connector
+        connector.events.start()
+        connector.jobs.start()
+    
+    # YAML changes are pushed to GitHub shortly after they are saved, independently of backups.
+    # Only the add-on's own /config can be watched, so fleet mode leaves it out.
+    if not FLEET_FILE:
+        connector = next(iter(connectors.values()))
+        github_sync = GitHubSync(connector.api_key, connector.homesafe_http)
+        if github_sync.ha_config_path.is_dir():
+            config_watcher = ConfigWatcher(
+                github_sync.sync_yaml_configs,
+                github_sync.ha_config_path,
+                debounce=GITHUB_SYNC_DEBOUNCE,
+                on_sync=lambda success, seconds: PHASE_DURATION.observe(seconds, ha_instance=connector.instance_id, phase='github_sync')
+            )
+            config_watcher.start()
+        else:
+            logger.warning(f"{github_sync.ha_config_path} is not mounted, GitHub YAML sync is off")
     
     # Start Flask API in background thread
     flask_thread = Thread(target=run_flask, daemon=True)
     flask_thread.start()
     logger.info("Flask API started on port 8099")
     
-    # Schedule automatic backups if enabled
-    if AUTO_BACKUP:
-        schedule.every().day.at(BACKUP_TIME).do(lambda: connector.perform_backup('scheduled'))
-        logger.info(f"Scheduled daily backup at {BACKUP_TIME}")
-    
-    # Schedule version check every hour (Smart Scheduling)
-    def check_and_backup_on_version_change():
-        """Check if HA version changed and create backup if so"""
-        if connector.check_version_changed():
-            logger.info("🎯 Smart Backup: Creating pre-update backup...")
-            connector.perform_backup('pre_update')
-    
-    schedule.every(1).hours.do(check_and_backup_on_version_change)
+    for connector in connectors.values():
+        schedule_connector(connector)
     logger.info("Scheduled hourly HA version check (Smart Scheduling)")
     
-    # Perform initial backup on startup
-    logger.info("Performing initial backup...")
-    connector.perform_backup('manual')
+    # Perform initial backup on startup (fleet backups wait for a free slot);
+    # tiers only back up at startup until their first upload, then keep to their schedule
+    logger.info("Queueing initial backup...")
+    for connector in connectors.values():
+        if connector.tier is None or not connector.state.last_upload_at:
+            connector.jobs.submit('manual')
     
     # Main loop
     logger.info("Entering main loop...")
+    if engine:
+        # Scheduling runs on the engine's event loop
+        engine.join()
     while True:
         schedule.run_pending()
         time.sleep(60)  # Check every minute
@@ -0,0 +1,216 @@
+"""Retention of Supervisor backups: an incremental local index, age/count/size policies and batched deletes"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+logger = logging.getLogger('homesafe-connector')
+
+# Name prefix of the snapshots created by the connector
+HOMESAFE_PREFIX = 'HomeSafe-'
+# Snapshots of the single full-backup connector, named before any tier existed
+_UNTIERED_SNAPSHOT = re.compile(rf'^{HOMESAFE_PREFIX}\d{{8}}-\d{{6}}$')
+# A full /backups listing at most this often; in between the index is kept current incrementally
+RECONCILE_INTERVAL = 24 * 3600
+# Concurrent removals of one retention run
+DELETE_WORKERS = 4
+
+_MB = 1024 * 1024
+
+
+def is_untiered_snapshot(name):
+    """Whether the snapshot was made without backup tiers (HomeSafe-<date>-<time>)"""
+    return bool(_UNTIERED_SNAPSHOT.match(name))
+
+
+class BackupIndex:
+    """
+    Local Supervisor backups by slug (name, date, size), persisted between runs.
+
+    The connector adds the snapshots it creates, Supervisor backup job
+    events add the ones made elsewhere and removals drop them, so a
+    retention run only lists every backup on first use, after it may have
+    missed events and once per RECONCILE_INTERVAL to notice backups
+    removed outside the connector. Slugs that are known to exist but not
+    yet described are kept in pending until their info is fetched.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reconciled_at = None
+        self._entries = {}
+        self._pending = set()
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as index_file:
+                data = json.load(index_file)
+            self._entries = {entry['slug']: entry for entry in data.get('backups', [])}
+            self._pending = set(data.get('pending', []))
+            self.reconciled_at = data.get('reconciled_at')
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable backup index {self.path}: {e}")
+            self._entries = {}
+            self._pending = set()
+            self.reconciled_at = None
+        return self
+
+    def needs_reconcile(self):
+        with self._lock:
+            return (self._stale
+                    or self.reconciled_at is None
+                    or time.time() - self.reconciled_at >= RECONCILE_INTERVAL)
+
+    def mark_stale(self):
+        """Changes may have been missed; the next run lists every backup again"""
+        with self._lock:
+            self._stale = True
+
+    def reconcile(self, backups):
+        """Replace the index with a full /backups listing"""
+        with self._lock:
+            self._entries = {}
+            for backup in backups:
+                entry = _entry(backup)
+                if entry:
+                    self._entries[entry['slug']] = entry
+            self._pending.clear()
+            self._stale = False
+            self.reconciled_at = time.time()
+            self._save()
+
+    def note_created(self, slug):
+        """A backup exists but its info has not been fetched yet"""
+        with self._lock:
+            if slug not in self._entries and slug not in self._pending:
+                self._pending.add(slug)
+                self._save()
+
+    def pending(self):
+        with self._lock:
+            return sorted(self._pending)
+
+    def add(self, backup):
+        entry = _entry(backup)
+        if not entry:
+            return
+        with self._lock:
+            self._entries[entry['slug']] = entry
+            self._pending.discard(entry['slug'])
+            self._save()
+
+    def remove(self, *slugs):
+        with self._lock:
+            changed = False
+            for slug in slugs:
+                changed |= self._entries.pop(slug, None) is not None
+                if slug in self._pending:
+                    self._pending.discard(slug)
+                    changed = True
+            if changed:
+                self._save()
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries.values())
+
+    def _save(self):
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w') as index_file:
+                json.dump({
+                    'reconciled_at': self.reconciled_at,
+                    'pending': sorted(self._pending),
+                    'backups': list(self._entries.values())
+                }, index_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write backup index: {e}")
+
+
+def _entry(backup):
+    """Index entry from a /backups listing item or /backups/<slug>/info data"""
+    slug = backup.get('slug')
+    date = _parse_date(backup.get('date'))
+    if not slug or date is None:
+        return None
+    # Newer Supervisors report exact bytes; older ones only size in MB
+    size = backup.get('size_bytes')
+    if size is None:
+        size = round(float(backup.get('size') or 0) * _MB)
+    return {
+        'slug': slug,
+        'name': backup.get('name') or '',
+        'date': date.isoformat(),
+        'size': int(size)
+    }
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        date = datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    except (TypeError, ValueError):
+        return None
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+class RetentionPolicy:
+    """
+    Age, count and size limits (0 = no limit).
+
+    Backups are kept newest first while all limits hold; once one does not
+    fit, it and every older backup expire. The newest backup is always kept.
+    """
+
+    def __init__(self, max_age_days=0, max_count=0, max_size_bytes=0):
+        self.max_age_days = max_age_days
+        self.max_count = max_count
+        self.max_size_bytes = max_size_bytes
+
+    @property
+    def enabled(self):
+        return bool(self.max_age_days or self.max_count or self.max_size_bytes)
+
+    def to_dict(self):
+        return {
+            'max_age_days': self.max_age_days,
+            'max_count': self.max_count,
+            'max_size_bytes': self.max_size_bytes
+        }
+
+    def expired(self, entries, now=None):
+        """Index entries to delete, oldest first"""
+        if not self.enabled:
+            return []
+        now = now or datetime.now(timezone.utc)
+        newest_first = sorted(entries, key=lambda entry: entry['date'], reverse=True)
+
+        kept_size = 0
+        for position, entry in enumerate(newest_first):
+            kept_size += entry['size']
+            age_days = (now - datetime.fromisoformat(entry['date'])).total_seconds() / 86400
+            fits = ((not self.max_age_days or age_days <= self.max_age_days)
+                    and (not self.max_count or position < self.max_count)
+                    and (not self.max_size_bytes or kept_size <= self.max_size_bytes))
+            if not fits and position > 0:
+                return list(reversed(newest_first[position:]))
+        return []
+
+
+def delete_in_batches(slugs, remove, workers=DELETE_WORKERS):
+    """Call remove(slug) for every slug, a few at a time; returns the slugs removed"""
+    if not slugs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(slugs)), thread_name_prefix='homesafe-retention') as pool:
+        results = list(pool.map(remove, slugs))
+    return [slug for slug, removed in zip(slugs, results) if removed]
@@ -0,0 +1,179 @@
+"""Ways of reading a snapshot archive: streamed over HTTP, spooled to a local file or read from /backup"""
+import errno
+import json
+import logging
+import mmap
+import os
+import tarfile
+import time
+
+logger = logging.getLogger('homesafe-connector')
+
+DOWNLOAD_MODE_AUTO = 'auto'
+DOWNLOAD_MODE_STREAM = 'stream'
+DOWNLOAD_MODE_SPOOL = 'spool'
+
+# Large sequential writes keep SD cards and eMMC from doing read-modify-write cycles
+_WRITE_SIZE = 8 * 1024 * 1024
+
+
+class StreamedSnapshot:
+    """Snapshot read straight from the Supervisor download response"""
+
+    def __init__(self, response, size):
+        self.response = response
+        self.size = size
+        # Decode any Content-Encoding instead of passing the raw wire bytes on
+        response.raw.decode_content = True
+        self.source = response.raw
+
+    def close(self):
+        # Hands the Supervisor connection back to the pool
+        self.response.close()
+
+    def discard(self):
+        pass
+
+
+class SpooledSnapshot:
+    """
+    Snapshot held in a local file and read through a read-only memory map.
+
+    Chunks are slices of the map, so nothing is copied into upload buffers,
+    retries re-read pages from the file and the file can outlive a failed
+    upload to be resumed without downloading again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._file = open(path, 'rb')
+        # Empty files cannot be mapped
+        self.source = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else self._file
+        if self.size:
+            _advise_sequential(self.source)
+
+    def close(self):
+        if self.source is not self._file:
+            try:
+                self.source.close()
+            except BufferError:
+                # A chunk view is still referenced somewhere; the map closes when it is collected
+                logger.debug("Spool map still in use, leaving it to be released later")
+        self._file.close()
+
+    def discard(self):
+        """Delete the spool file once it is no longer needed for a resume"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove spooled snapshot {self.path}: {e}")
+
+
+class LocalSnapshot(SpooledSnapshot):
+    """
+    Snapshot read in place from the Supervisor's backup folder.
+
+    Same memory-mapped reads as a spool file, but the archive belongs to the
+    Supervisor, so it is never deleted here.
+    """
+
+    def discard(self):
+        pass
+
+
+def find_local_backup(directory, slug):
+    """
+    Path of the archive for slug in the mapped backup folder, or None.
+
+    Archives are normally named <slug>.tar; otherwise each archive's
+    backup.json (the first member) is checked, newest archive first.
+    """
+    if not os.path.isdir(directory):
+        return None
+
+    path = os.path.join(directory, f'{slug}.tar')
+    if os.path.isfile(path):
+        return path
+
+    try:
+        candidates = [entry for entry in os.scandir(directory) if entry.name.endswith('.tar') and entry.is_file()]
+    except OSError as e:
+        logger.warning(f"Cannot list backup folder {directory}: {e}")
+        return None
+    candidates.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in candidates:
+        if _archive_slug(entry.path) == slug:
+            return entry.path
+    return None
+
+
+def _archive_slug(path):
+    try:
+        with tarfile.open(path, mode='r|') as archive:
+            for member in archive:
+                if member.name.lstrip('./') == 'backup.json':
+                    return json.load(archive.extractfile(member)).get('slug')
+                # backup.json comes first; anything else means an unexpected layout
+                return None
+    except (OSError, tarfile.TarError, ValueError, AttributeError) as e:
+        logger.debug(f"Could not read backup metadata from {path}: {e}")
+    return None
+
+
+def spool_download(response, path, expected_size=0, progress=None):
+    """
+    Write a download response to path and return the number of bytes written.
+
+    The file is preallocated when the size is known up front, content
+    encoding is decoded, and progress(bytes_written) is called after each
+    write. A partial file is removed on failure.
+    """
+    started = time.monotonic()
+    written = 0
+    try:
+        with open(path, 'wb') as spool_file:
+            if expected_size:
+                _preallocate(spool_file.fileno(), expected_size)
+
+            for block in response.iter_content(chunk_size=_WRITE_SIZE):
+                spool_file.write(block)
+                written += len(block)
+                if progress:
+                    progress(written)
+
+            # Drop any preallocated space beyond the real end of the archive
+            spool_file.truncate(written)
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+
+    elapsed = time.monotonic() - started
+    rate = written / elapsed / (1024 * 1024) if elapsed > 0 else 0
+    logger.info(f"Spooled {written} bytes to {path} in {elapsed:.1f}s ({rate:.1f} MB/s)")
+    return written
+
+
+def _preallocate(fd, size):
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except AttributeError:
+        pass
+    except OSError as e:
+        # Better to fail before downloading gigabytes than halfway through
+        if e.errno == errno.ENOSPC:
+            raise
+        # Not every filesystem supports it; the writes then simply extend the file
+        logger.debug(f"Could not preallocate spool file: {e}")
+
+
+def _advise_sequential(mapped):
+    try:
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    except (AttributeError, OSError):
+        pass
@@ -0,0 +1,88 @@
+"""TTL-cached snapshots of connector state served to the Lovelace card"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from threading import Thread
+
+logger = logging.getLogger('homesafe-connector')
+
+
+class CachedSnapshot:
+    """One loaded value with its ETag and the time its content last changed"""
+    __slots__ = ('payload', 'etag', 'changed_at')
+
+    def __init__(self, payload, etag, changed_at):
+        self.payload = payload
+        self.etag = etag
+        self.changed_at = changed_at
+
+
+class CachedResource:
+    """
+    A value loaded by loader() and kept for ttl seconds.
+
+    Once a value exists readers never wait on upstream: a read of a stale
+    value starts a single background refresh and returns the previous value,
+    so any number of dashboards cost at most one load per TTL, and nothing
+    at all while nobody is looking. A failed load keeps the previous value.
+    """
+
+    def __init__(self, name, loader, ttl):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.error = None
+        self._snapshot = None
+        self._loaded_at = None
+        self._refreshing = False
+        self._condition = threading.Condition()
+
+    def get(self, wait=10):
+        """Current snapshot (waiting up to wait seconds for the very first load) or None"""
+        with self._condition:
+            if self._is_stale():
+                self._start_refresh()
+            if self._snapshot is None and self._refreshing:
+                self._condition.wait(wait)
+            return self._snapshot
+
+    def invalidate(self):
+        """Mark the value stale so the next read reloads it"""
+        with self._condition:
+            self._loaded_at = None
+
+    def _is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+
+    def _start_refresh(self):
+        if not self._refreshing:
+            self._refreshing = True
+            Thread(target=self._refresh, name=f'homesafe-cache-{self.name}', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            payload = self.loader()
+            error = None
+        except Exception as e:
+            logger.warning(f"Failed to refresh cached {self.name}: {e}")
+            payload = None
+            error = str(e)
+
+        with self._condition:
+            if error is None:
+                etag = _etag(payload)
+                if self._snapshot is None or self._snapshot.etag != etag:
+                    self._snapshot = CachedSnapshot(payload, etag, datetime.now(timezone.utc).isoformat())
+            self.error = error
+            # Failures also wait a full TTL, so an unreachable upstream is not hammered
+            self._loaded_at = time.monotonic()
+            self._refreshing = False
+            self._condition.notify_all()
+
+
+def _etag(payload):
+    body = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(body).hexdigest()[:32]
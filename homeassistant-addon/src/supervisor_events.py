@@ -0,0 +1,167 @@
+"""Supervisor event notifications over the Home Assistant WebSocket API"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from threading import Thread
+
+logger = logging.getLogger('homesafe-connector')
+
+# Job states kept for waiters that subscribe after the job already finished
+MAX_TRACKED_JOBS = 100
+
+
+class SupervisorEventListener:
+    """
+    Keeps a WebSocket `supervisor/subscribe` subscription open in the background.
+
+    Core does not put Supervisor job events on its event bus; they are only
+    forwarded to clients that send the supervisor/subscribe command.
+
+    Job updates are remembered by job UUID so callers can block until a job is
+    done instead of sleeping between polls. When the connection is down every
+    wait returns immediately and callers fall back to polling.
+    """
+
+    def __init__(self, url, token):
+        self.url = url
+        self.token = token
+        self.connected = False
+        self._jobs = OrderedDict()
+        self._event_count = 0
+        self._callbacks = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """Start the listener thread (no-op without a URL, if websocket-client is missing or when already started)"""
+        if self._thread is not None:
+            return True
+        if not self.url:
+            return False
+        try:
+            import websocket  # noqa: F401
+        except ImportError:
+            logger.warning("websocket-client not installed, using polling for backup completion")
+            return False
+
+        self._thread = Thread(target=self._run, name='homesafe-events', daemon=True)
+        self._thread.start()
+        return True
+
+    def add_callback(self, callback):
+        """Call callback(event) for every supervisor_event (runs on the listener thread)"""
+        self._callbacks.append(callback)
+
+    def wait_for_job(self, job_id, timeout):
+        """Block until the job is reported done; returns the job data or None"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                job = self._jobs.get(job_id)
+                if job and job.get('done'):
+                    return job
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.connected:
+                    return None
+                self._condition.wait(remaining)
+
+    def wait_for_backup_activity(self, timeout):
+        """Block until a backup-related job changes; True if one did"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            seen = self._event_count
+            while self._event_count == seen:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.connected:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def _run(self):
+        import websocket
+
+        backoff = 5
+        while True:
+            ws = None
+            try:
+                ws = websocket.create_connection(self.url, timeout=30)
+                self._authenticate(ws)
+                ws.send(json.dumps({'id': 1, 'type': 'supervisor/subscribe'}))
+                self._wait_for_subscription(ws)
+                ws.settimeout(60)
+                self._set_connected(True)
+                logger.info("Subscribed to Supervisor events")
+                backoff = 5
+
+                while True:
+                    try:
+                        raw_message = ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        # Quiet period: ping so a half-open connection gets noticed
+                        ws.ping()
+                        continue
+                    message = json.loads(raw_message)
+                    if message.get('type') == 'event':
+                        # The payload is {"event": "job", "data": {...}} (or another Supervisor event)
+                        self._handle_event(message.get('event') or {})
+
+            except Exception as e:
+                if self.connected:
+                    logger.warning(f"Supervisor event connection lost: {e}")
+                else:
+                    logger.debug(f"Supervisor event connection failed: {e}")
+            finally:
+                self._set_connected(False)
+                if ws is not None:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 300)
+
+    def _authenticate(self, ws):
+        message = json.loads(ws.recv())
+        if message.get('type') == 'auth_required':
+            ws.send(json.dumps({'type': 'auth', 'access_token': self.token}))
+            message = json.loads(ws.recv())
+        if message.get('type') != 'auth_ok':
+            raise ConnectionError(f"WebSocket authentication failed: {message.get('type')}")
+
+    def _wait_for_subscription(self, ws):
+        """Only a successful result means events will arrive; anything else is a connection failure"""
+        while True:
+            message = json.loads(ws.recv())
+            if message.get('id') == 1 and message.get('type') == 'result':
+                if not message.get('success'):
+                    raise ConnectionError(f"Supervisor event subscription refused: {message.get('error')}")
+                return
+
+    def _set_connected(self, connected):
+        with self._condition:
+            self.connected = connected
+            self._condition.notify_all()
+
+    def _handle_event(self, event):
+        if event.get('event') == 'job':
+            job = event.get('data', {})
+            job_id = job.get('uuid')
+            if job_id:
+                with self._condition:
+                    self._jobs[job_id] = job
+                    self._jobs.move_to_end(job_id)
+                    while len(self._jobs) > MAX_TRACKED_JOBS:
+                        self._jobs.popitem(last=False)
+                    if 'backup' in (job.get('name') or ''):
+                        self._event_count += 1
+                    self._condition.notify_all()
+
+        for callback in self._callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.warning(f"Supervisor event callback failed: {e}")
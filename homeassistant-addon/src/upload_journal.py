@@ -0,0 +1,158 @@
+"""On-disk journal of an in-progress HomeSafe upload, used to resume after a crash or failed chunk"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger('homesafe-connector')
+
+
+class UploadJournal:
+    """
+    Tracks which chunks of a snapshot were sent and which the backend has acknowledged.
+
+    The journal is rewritten atomically before every chunk is sent and after
+    it is acknowledged, so a restart at any point loses at most the chunks
+    that were in flight, and a resumed upload knows where every part the
+    backend may hold starts and ends.
+    """
+
+    def __init__(self, path, snapshot_slug, backup_id, file_size, chunk_size,
+                 trigger_type='manual', codec='none', chunking='fixed', encryption='none', encryption_salt=None,
+                 attempts=0, acknowledged=None, planned=None, created_at=None):
+        self.path = path
+        self.snapshot_slug = snapshot_slug
+        self.backup_id = backup_id
+        self.file_size = file_size
+        self.chunk_size = chunk_size
+        self.trigger_type = trigger_type
+        self.codec = codec
+        self.chunking = chunking
+        self.encryption = encryption
+        # Hex KDF salt; a resumed encrypted upload must reproduce the same ciphertext
+        self.encryption_salt = encryption_salt
+        self.attempts = attempts
+        # chunk_number -> (offset, length)
+        self.acknowledged = acknowledged or {}
+        # chunk_number -> (offset, length) of every chunk sent, acknowledged or not
+        self.planned = planned or {}
+        self.created_at = created_at or datetime.now(timezone.utc).isoformat()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """Load the journal from disk, or None when there is no pending upload"""
+        try:
+            with open(path, 'r') as journal_file:
+                data = json.load(journal_file)
+            return cls(
+                path,
+                data['snapshot_slug'],
+                data['backup_id'],
+                data['file_size'],
+                data['chunk_size'],
+                trigger_type=data.get('trigger_type', 'manual'),
+                codec=data.get('codec', 'none'),
+                chunking=data.get('chunking', 'fixed'),
+                encryption=data.get('encryption', 'none'),
+                encryption_salt=data.get('encryption_salt'),
+                attempts=data.get('attempts', 0),
+                acknowledged={
+                    int(number): tuple(span)
+                    for number, span in data.get('acknowledged', {}).items()
+                },
+                planned={
+                    int(number): tuple(span)
+                    for number, span in data.get('planned', {}).items()
+                },
+                created_at=data.get('created_at')
+            )
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable upload journal {path}: {e}")
+            return None
+
+    @property
+    def acknowledged_bytes(self):
+        return sum(length for _, length in self.acknowledged.values())
+
+    def matches(self, snapshot_slug, file_size, chunk_size, codec='none', chunking='fixed', encryption='none'):
+        """True if this journal describes the same snapshot split the same way"""
+        return (
+            self.snapshot_slug == snapshot_slug
+            and self.file_size == file_size
+            and self.chunk_size == chunk_size
+            and self.codec == codec
+            and self.chunking == chunking
+            and self.encryption == encryption
+        )
+
+    def is_acknowledged(self, chunk_number, offset, length):
+        return self.acknowledged.get(chunk_number) == (offset, length)
+
+    @property
+    def sent_spans(self):
+        """chunk_number -> (offset, length) of every chunk the backend may hold"""
+        return {**self.planned, **self.acknowledged}
+
+    def record_planned(self, chunk_number, offset, length):
+        """Remember a chunk before it is sent: the backend may store it even if no answer arrives"""
+        with self._lock:
+            if self.planned.get(chunk_number) == (offset, length):
+                return
+            self.planned[chunk_number] = (offset, length)
+            self._write()
+
+    def record_chunk(self, chunk_number, offset, length):
+        """Remember an acknowledged chunk (called from uploader threads)"""
+        with self._lock:
+            self.acknowledged[chunk_number] = (offset, length)
+            self._write()
+
+    def save(self):
+        with self._lock:
+            self._write()
+
+    def clear(self):
+        """Drop the journal once the upload is completed or abandoned"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove upload journal: {e}")
+
+    def _write(self):
+        data = {
+            'snapshot_slug': self.snapshot_slug,
+            'backup_id': self.backup_id,
+            'file_size': self.file_size,
+            'chunk_size': self.chunk_size,
+            'trigger_type': self.trigger_type,
+            'codec': self.codec,
+            'chunking': self.chunking,
+            'encryption': self.encryption,
+            'encryption_salt': self.encryption_salt,
+            'attempts': self.attempts,
+            'created_at': self.created_at,
+            'acknowledged': {
+                str(number): list(span)
+                for number, span in sorted(self.acknowledged.items())
+            },
+            'planned': {
+                str(number): list(span)
+                for number, span in sorted(self.planned.items())
+            }
+        }
+        tmp_path = f'{self.path}.tmp'
+        try:
+            with open(tmp_path, 'w') as journal_file:
+                json.dump(data, journal_file)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # A missing journal only costs a full re-upload, never the backup itself
+            logger.warning(f"Failed to write upload journal: {e}")
@@ -0,0 +1,452 @@
+"""Pipelined snapshot upload: overlaps the Supervisor download with HomeSafe chunk POSTs"""
+import logging
+import mmap
+import queue
+import threading
+import time
+from threading import Thread
+
+logger = logging.getLogger('homesafe-connector')
+
+# Sentinel telling an uploader worker that the reader has finished
+_END_OF_STREAM = object()
+
+
+class ChunkUploadError(Exception):
+    """Raised by an upload callback when a chunk could not be delivered"""
+
+
+# Read granularity while looking for a content-defined boundary
+_BOUNDARY_READ_STEP = 1024 * 1024
+# Chunk and whole-file hashes are fed the same block while it is still in CPU cache
+_HASH_BLOCK = 1024 * 1024
+
+
+class Chunk:
+    """A slice of the snapshot held in one of the pipeline's reusable buffers"""
+    __slots__ = ('number', 'offset', 'length', 'buffer', 'digest')
+
+    def __init__(self, number, offset, length, buffer, digest=None):
+        self.number = number
+        self.offset = offset
+        self.length = length
+        self.buffer = buffer
+        self.digest = digest
+
+    @property
+    def data(self):
+        """Zero-copy view of the chunk bytes"""
+        return memoryview(self.buffer)[:self.length]
+
+
+class UploadPipeline:
+    """
+    Producer/consumer pipeline for chunked uploads.
+
+    A reader thread fills a fixed pool of reusable buffers from the snapshot
+    stream while uploader workers drain them. A buffer only returns to the pool
+    once its chunk has been uploaded, so memory stays capped at
+    buffer_count * chunk_size whatever the snapshot size.
+
+    With a digest, a hasher thread between the reader and the uploaders
+    computes each chunk's hash and the whole-stream hash in one pass, so
+    hashing overlaps both reading and uploading.
+    """
+
+    def __init__(self, source, chunk_size, buffer_count=3, workers=1, total_size=0, max_attempts=1,
+                 skip_chunk=None, boundary=None, digest=None, chunk_sizer=None):
+        self.source = source
+        # Fixed chunk size, or the maximum chunk size when boundaries or sizes vary
+        if boundary:
+            self.chunk_size = boundary.max_size
+        elif chunk_sizer:
+            self.chunk_size = chunk_sizer.max_size
+        else:
+            self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        # skip_chunk(chunk) -> True for chunks the backend already holds
+        self.skip_chunk = skip_chunk
+        # Content-defined chunking: boundary.find(view, start, end) picks the cut points
+        self.boundary = boundary
+        # Hash constructor (e.g. hashlib.sha256) used to fill Chunk.digest and file_digest
+        self.digest = digest
+        # Hash of every byte read, in stream order, including skipped chunks
+        self.file_digest = digest() if digest else None
+        # Picks each fixed-offset chunk length and learns from upload latency
+        self.chunk_sizer = chunk_sizer
+        self._carry = b''
+        # One buffer per worker plus one for the reader, otherwise the stages cannot overlap
+        self.buffer_count = max(buffer_count, self.workers + 1)
+        # Length of the stream when known (0: read to end of stream); a shorter stream fails the run
+        self.total_size = total_size
+
+        # A memory-mapped source is sliced into chunks directly instead of copied
+        self._mapped = memoryview(source) if isinstance(source, mmap.mmap) else None
+        if self._mapped is not None:
+            self.total_size = len(self._mapped)
+        # Caps chunks in flight from a mapped source, like the buffer pool does otherwise
+        self._slots = threading.Semaphore(self.buffer_count)
+
+        # Buffers are allocated on first use so small snapshots never pay for the full pool
+        self._free_buffers = queue.Queue()
+        self._allocated_buffers = 0
+        # Unbounded on purpose: the buffer pool already limits how many chunks exist
+        self._hash_queue = queue.Queue()
+        self._ready_chunks = queue.Queue()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        self.error = None
+        self.bytes_read = 0
+        self.chunks_read = 0
+        self.bytes_uploaded = 0
+        self.chunks_uploaded = 0
+        self.bytes_skipped = 0
+        self.chunks_skipped = 0
+        self.chunk_retries = 0
+        # Time the reader spent blocked on the source vs. waiting for a free buffer
+        self.read_seconds = 0.0
+        self.buffer_wait_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.acknowledged = set()
+
+    def run(self, upload_chunk):
+        """
+        Stream the whole source through upload_chunk(chunk).
+
+        The callback runs on a worker thread and must raise on failure.
+        Chunks are retried up to max_attempts times while their buffer is still
+        held. Returns True when every chunk read was uploaded.
+        """
+        reader = self._read_loop if self._mapped is None else self._map_loop
+        threads = [Thread(target=reader, name='homesafe-reader', daemon=True)]
+        if self.digest:
+            threads.append(Thread(target=self._hash_loop, name='homesafe-hasher', daemon=True))
+        for index in range(self.workers):
+            threads.append(Thread(
+                target=self._upload_loop,
+                args=(upload_chunk,),
+                name=f'homesafe-uploader-{index + 1}',
+                daemon=True
+            ))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._mapped is not None:
+            self._mapped.release()
+        return self.error is None and self.all_acknowledged()
+
+    def all_acknowledged(self):
+        """True when every chunk handed out by the reader was confirmed by the backend"""
+        with self._lock:
+            return len(self.acknowledged) == self.chunks_read
+
+    def abort(self, error):
+        """Stop reading and discard chunks not yet uploaded (first error wins)"""
+        with self._lock:
+            if self.error is None:
+                self.error = error
+        self._stop.set()
+
+    def _read_loop(self):
+        chunk_number = 0
+        offset = 0
+
+        try:
+            while not self._stop.is_set():
+                if self.total_size and offset >= self.total_size:
+                    break
+
+                length = self._expected_length(chunk_number + 1, offset)
+                if self._seek_past_skipped(chunk_number + 1, offset, length):
+                    chunk_number += 1
+                    offset += length
+                    self.bytes_read = offset
+                    self.chunks_read = chunk_number
+                    continue
+
+                buffer = self._next_free_buffer()
+                if buffer is None:
+                    break
+
+                if self.boundary:
+                    length = self._fill_content_defined(buffer)
+                else:
+                    length = self._read_into(memoryview(buffer), 0, length)
+                if length == 0:
+                    self._free_buffers.put(buffer)
+                    break
+
+                chunk_number += 1
+                self._dispatch(Chunk(chunk_number, offset, length, buffer))
+                offset += length
+                self.bytes_read = offset
+                self.chunks_read = chunk_number
+
+            # A stream of known size that ends early was cut off (e.g. a dropped download), not finished
+            if not self._stop.is_set() and self.total_size and offset != self.total_size:
+                raise EOFError(f"stream ended after {offset} of {self.total_size} bytes")
+
+        except Exception as e:
+            logger.error(f"Failed to read snapshot stream: {e}")
+            self.abort(f"Snapshot read failed: {e}")
+
+        finally:
+            self._end_of_stream()
+
+    def _map_loop(self):
+        """Reader for memory-mapped sources: chunks are zero-copy slices of the map"""
+        view = self._mapped
+        chunk_number = 0
+        offset = 0
+
+        try:
+            while not self._stop.is_set() and offset < len(view):
+                if self.boundary:
+                    length = self._mapped_boundary(view, offset)
+                else:
+                    length = self._expected_length(chunk_number + 1, offset)
+
+                if not self._acquire_slot():
+                    break
+                chunk_number += 1
+                self._dispatch(Chunk(chunk_number, offset, length, view[offset:offset + length]))
+                offset += length
+                self.bytes_read = offset
+                self.chunks_read = chunk_number
+
+        except Exception as e:
+            logger.error(f"Failed to read snapshot map: {e}")
+            self.abort(f"Snapshot read failed: {e}")
+
+        finally:
+            self._end_of_stream()
+
+    def _dispatch(self, chunk):
+        """Hand a chunk just read to the hasher, or straight to the uploaders"""
+        if self.digest:
+            self._hash_queue.put(chunk)
+        else:
+            self._route(chunk)
+
+    def _route(self, chunk):
+        """Queue a chunk for upload unless the backend already holds it"""
+        if self.skip_chunk and self.skip_chunk(chunk):
+            # Already held by the backend: reading it only advanced the stream
+            self._release(chunk)
+            self._mark_skipped(chunk.number, chunk.length)
+        else:
+            self._ready_chunks.put(chunk)
+
+    def _end_of_stream(self):
+        if self.digest:
+            self._hash_queue.put(_END_OF_STREAM)
+        else:
+            self._stop_uploaders()
+
+    def _stop_uploaders(self):
+        for _ in range(self.workers):
+            self._ready_chunks.put(_END_OF_STREAM)
+
+    def _hash_loop(self):
+        """Hash chunks in stream order; the whole-stream hash needs them in sequence"""
+        try:
+            while True:
+                chunk = self._hash_queue.get()
+                if chunk is _END_OF_STREAM:
+                    return
+                if self._stop.is_set():
+                    self._release(chunk)
+                    continue
+
+                try:
+                    self._hash(chunk)
+                    self._route(chunk)
+                except Exception as e:
+                    logger.error(f"Failed to hash chunk {chunk.number}: {e}")
+                    self.abort(f"Hashing failed: {e}")
+                    self._release(chunk)
+        finally:
+            self._stop_uploaders()
+
+    def _hash(self, chunk):
+        started = time.monotonic()
+        chunk_hash = self.digest()
+        data = chunk.data
+        for start in range(0, chunk.length, _HASH_BLOCK):
+            block = data[start:start + _HASH_BLOCK]
+            chunk_hash.update(block)
+            self.file_digest.update(block)
+        chunk.digest = chunk_hash.hexdigest()
+        self.hash_seconds += time.monotonic() - started
+
+    def _mapped_boundary(self, view, offset):
+        """Length of the next content-defined chunk of a mapped source"""
+        end = min(offset + self.boundary.max_size, len(view))
+        start = offset + self.boundary.min_size
+        if start >= end:
+            return end - offset
+        cut = self.boundary.find(view, start, end)
+        return (cut if cut != -1 else end) - offset
+
+    def _acquire_slot(self):
+        while not self._stop.is_set():
+            if self._slots.acquire(timeout=0.5):
+                return True
+        return False
+
+    def _release(self, chunk):
+        """Return what a finished chunk held: its pool buffer or its map slot"""
+        if self._mapped is not None:
+            chunk.buffer.release()
+            self._slots.release()
+        else:
+            self._free_buffers.put(chunk.buffer)
+
+    def _expected_length(self, chunk_number, offset):
+        """Length of a fixed-offset chunk (short only at end of stream)"""
+        length = self.chunk_sizer.next_size(chunk_number) if self.chunk_sizer else self.chunk_size
+        if self.total_size:
+            length = min(length, self.total_size - offset)
+        return length
+
+    def _seek_past_skipped(self, chunk_number, offset, length):
+        """Skip an acknowledged chunk without reading it when the source is seekable"""
+        # Only fixed-size chunks without digests can be skipped before reading them
+        if self.boundary or self.digest:
+            return False
+        if not (self.skip_chunk and self.total_size and _is_seekable(self.source)):
+            return False
+
+        if not self.skip_chunk(Chunk(chunk_number, offset, length, None)):
+            return False
+
+        self.source.seek(offset + length)
+        self._mark_skipped(chunk_number, length)
+        return True
+
+    def _mark_skipped(self, chunk_number, length):
+        with self._lock:
+            self.bytes_skipped += length
+            self.chunks_skipped += 1
+            self.acknowledged.add(chunk_number)
+
+    def _next_free_buffer(self):
+        """Wait for an uploader to hand a buffer back, unless the pipeline is stopping"""
+        try:
+            return self._free_buffers.get_nowait()
+        except queue.Empty:
+            pass
+
+        if self._allocated_buffers < self.buffer_count:
+            self._allocated_buffers += 1
+            return bytearray(self.chunk_size)
+
+        started = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return self._free_buffers.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+            return None
+        finally:
+            self.buffer_wait_seconds += time.monotonic() - started
+
+    def _fill_content_defined(self, buffer):
+        """
+        Fill buffer up to the next content-defined boundary.
+
+        Data is read in small steps and scanned as it arrives, so at most one
+        step past the boundary is carried over into the next chunk.
+        """
+        view = memoryview(buffer)
+        filled = len(self._carry)
+        view[:filled] = self._carry
+        self._carry = b''
+
+        min_size = self.boundary.min_size
+        search_from = min_size
+        end_of_stream = False
+
+        while True:
+            if filled > search_from:
+                cut = self.boundary.find(view, search_from, filled)
+                if cut != -1:
+                    break
+                # A cut can straddle two reads
+                search_from = max(min_size, filled - self.boundary.overlap)
+
+            if end_of_stream or filled >= self.chunk_size:
+                cut = filled
+                break
+
+            target = min(max(filled + _BOUNDARY_READ_STEP, min_size), self.chunk_size)
+            read = self._read_into(view, filled, target)
+            end_of_stream = read < target - filled
+            filled += read
+
+        # Bytes past the boundary start the next chunk; copied so this buffer can be reused
+        self._carry = bytes(view[cut:filled])
+        return cut
+
+    def _read_into(self, view, start, end):
+        started = time.monotonic()
+        filled = start
+        while filled < end:
+            read = self.source.readinto(view[filled:end])
+            if not read:
+                break
+            filled += read
+        self.read_seconds += time.monotonic() - started
+        return filled - start
+
+    def _upload_loop(self, upload_chunk):
+        while True:
+            chunk = self._ready_chunks.get()
+            if chunk is _END_OF_STREAM:
+                return
+
+            try:
+                if not self._stop.is_set():
+                    self._upload_with_retries(upload_chunk, chunk)
+                    with self._lock:
+                        self.bytes_uploaded += chunk.length
+                        self.chunks_uploaded += 1
+                        self.acknowledged.add(chunk.number)
+            except Exception as e:
+                self.abort(str(e))
+            finally:
+                self._release(chunk)
+
+    def _upload_with_retries(self, upload_chunk, chunk):
+        for attempt in range(1, self.max_attempts + 1):
+            started = time.monotonic()
+            try:
+                upload_chunk(chunk)
+                if self.chunk_sizer:
+                    self.chunk_sizer.record_success(chunk.length, time.monotonic() - started)
+                return
+            except Exception as e:
+                if self.chunk_sizer:
+                    self.chunk_sizer.record_failure()
+                if attempt == self.max_attempts or self._stop.is_set():
+                    raise
+                delay = min(2 ** attempt, 60)
+                with self._lock:
+                    self.chunk_retries += 1
+                logger.warning(f"Chunk {chunk.number} attempt {attempt}/{self.max_attempts} failed ({e}), retrying in {delay}s")
+                # Wake up early if another worker aborted the upload meanwhile
+                if self._stop.wait(delay):
+                    raise
+
+
+def _is_seekable(source):
+    try:
+        return source.seekable()
+    except (AttributeError, OSError):
+        return False
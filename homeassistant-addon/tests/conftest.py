@@ -0,0 +1,55 @@
+"""Shared setup: main.py reads its options from the environment when it is imported"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault('API_KEY', 'test-api-key')
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='homesafe-tests-'))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import main  # noqa: E402
+from chunking import CHUNKING_FIXED  # noqa: E402
+from dedup_server import DedupServer  # noqa: E402
+
+# Plain fixed-size chunks unless a test asks for more
+DEFAULT_OPTIONS = {
+    'CHUNKING': CHUNKING_FIXED,
+    'ENCRYPTION': main.ENCRYPTION_NONE,
+    'RECOMPRESS': False,
+    'INCREMENTAL_BACKUPS': False
+}
+
+
+@pytest.fixture
+def server():
+    server = DedupServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def connector_options():
+    """Module constants of main.py to change; override in a test module or parametrize"""
+    return {}
+
+
+@pytest.fixture
+def main_options(connector_options, monkeypatch):
+    options = {**DEFAULT_OPTIONS, **connector_options}
+    for name, value in options.items():
+        monkeypatch.setattr(main, name, value)
+    return options
+
+
+@pytest.fixture
+def connector(server, main_options, tmp_path, monkeypatch):
+    """A connector uploading to the stand-in server, registered for the add-on API"""
+    connector = main.HomeSafeConnector(instance_id='test-instance', websocket_url=None, data_dir=tmp_path)
+    connector.api_url = server.url
+    monkeypatch.setattr(main, 'connectors', {connector.key: connector})
+    return connector
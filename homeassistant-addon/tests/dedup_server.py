@@ -0,0 +1,197 @@
+"""
+Local stand-in for the HomeSafe backup-upload function, kept in memory.
+
+Implements the actions the add-on uses (init, chunk, have, complete, fail)
+and the backup list
+the way the edge function does: deduplicated chunks are stored once under
+their hash, a backup is the ordered manifest sent with complete, and
+deleting a backup removes only the chunks no other backup references.
+Other chunks are kept as parts by offset, which complete requires to cover
+the whole archive.
+"""
+import hashlib
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class DedupServer:
+    def __init__(self):
+        self.backups = {}
+        # chunk hash -> bytes, shared by every backup of the user
+        self.chunks = {}
+        self.uploaded_bytes = 0
+        # Chunks removed right after action=have reported them, as a concurrent prune would
+        self.drop_after_have = set()
+        # Part offsets answered late, so parallel uploads finish out of order
+        self.slow_offsets = set()
+        self.stored_offsets = []
+        # chunk_number -> True to store the chunk before answering 500 (a lost answer), False to fail late without storing it
+        self.fail_chunks = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def assemble(self, backup_id):
+        """The archive a restore of the backup gets, as backup-download streams it"""
+        backup = self.backups[backup_id]
+        if backup['manifest'] is not None:
+            return b''.join(self.chunks[chunk_hash] for chunk_hash, _, _ in backup['manifest'])
+        return b''.join(backup['parts'][offset] for offset in sorted(backup['parts']))
+
+    def delete(self, backup_id):
+        """Delete a backup as backup-delete does; returns the number of chunks removed"""
+        with self._lock:
+            backup = self.backups.pop(backup_id)
+            released = {chunk_hash for chunk_hash, _, _ in backup['manifest'] or []}
+            still_referenced = {
+                chunk_hash
+                for other in self.backups.values() if other['status'] == 'completed'
+                for chunk_hash, _, _ in other['manifest'] or []
+            }
+            orphaned = released - still_referenced
+            for chunk_hash in orphaned:
+                del self.chunks[chunk_hash]
+            return len(orphaned)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.headers.get('x-api-key') is None:
+                    return self._json({'error': 'Missing API key'}, 401)
+                if urlparse(self.path).path.endswith('/backup-list-api-key'):
+                    # Whole rows, as the function's select('*') returns them
+                    return self._json({'success': True, 'backups': [
+                        {'id': backup_id, 'user_id': 'user', 'storage_path': f'user/{backup_id}.tar', 'status': backup['status'],
+                         'size_bytes': backup['init']['file_size'], **backup['init']}
+                        for backup_id, backup in server.backups.items()
+                    ]})
+                self._json({'error': 'Not found'}, 404)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                action = query.get('action')
+                if self.headers.get('x-api-key') is None:
+                    return self._json({'error': 'Missing API key'}, 401)
+                if url.path.endswith('/backup-upload') and action in ('init', 'chunk', 'have', 'complete', 'fail'):
+                    return getattr(self, f'_{action}')(query, body)
+                self._json({'error': 'Invalid action'}, 400)
+
+            def _init(self, query, body):
+                backup_id = f'backup-{next(server._ids)}'
+                with server._lock:
+                    server.backups[backup_id] = {'status': 'uploading', 'manifest': None, 'parts': {}, 'init': json.loads(body)}
+                self._json({'success': True, 'backup_id': backup_id, 'storage_path': f'user/{backup_id}.tar'})
+
+            def _chunk(self, query, body):
+                backup = server.backups.get(query.get('backup_id'))
+                if backup is None:
+                    return self._json({'error': 'Backup not found'}, 404)
+                expected = query.get('sha256') or query.get('chunk_hash')
+                if expected and hashlib.sha256(body).hexdigest() != expected:
+                    return self._json({'error': 'Chunk hash mismatch'}, 422)
+                offset = int(query['offset'])
+                if offset in server.slow_offsets:
+                    time.sleep(0.5)
+                with server._lock:
+                    store_then_fail = server.fail_chunks.pop(int(query.get('chunk_number', 0)), None)
+                if store_then_fail is False:
+                    time.sleep(0.5)
+                    return self._json({'error': 'Internal error'}, 500)
+                with server._lock:
+                    server.uploaded_bytes += len(body)
+                    if query.get('chunk_hash'):
+                        server.chunks[query['chunk_hash']] = body
+                    else:
+                        backup['parts'][offset] = body
+                        server.stored_offsets.append(offset)
+                if store_then_fail:
+                    return self._json({'error': 'Internal error'}, 500)
+                self._json({'success': True})
+
+            def _have(self, query, body):
+                hashes = json.loads(body)['hashes']
+                with server._lock:
+                    have = [chunk_hash for chunk_hash in hashes if chunk_hash in server.chunks]
+                    for chunk_hash in server.drop_after_have & set(have):
+                        del server.chunks[chunk_hash]
+                    server.drop_after_have.clear()
+                self._json({'success': True, 'have': have})
+
+            def _complete(self, query, body):
+                data = json.loads(body)
+                backup = server.backups.get(data.get('backup_id'))
+                if backup is None:
+                    return self._json({'error': 'Backup not found'}, 404)
+                manifest = data.get('manifest')
+                init = backup['init']
+                completed_size = data.get('file_size') or init['file_size']
+                # Archives sent as they are keep the size announced at init
+                transformed = init.get('codec', 'none') != 'none' or init.get('encryption', 'none') != 'none'
+                if not transformed and completed_size != init['file_size']:
+                    return self._json({'error': 'Size mismatch', 'received_bytes': completed_size, 'expected_bytes': init['file_size']}, 409)
+                with server._lock:
+                    if manifest is not None:
+                        covered = 0
+                        for _, offset, length in manifest:
+                            if offset != covered:
+                                break
+                            covered += length
+                        if covered != completed_size:
+                            return self._json({'error': 'Upload incomplete', 'received_bytes': covered}, 409)
+                        missing = sorted({entry[0] for entry in manifest} - set(server.chunks))
+                        if missing:
+                            return self._json({'error': 'Chunks no longer stored', 'missing': missing}, 409)
+                        backup['manifest'] = [tuple(entry) for entry in manifest]
+                    else:
+                        covered = 0
+                        for offset in sorted(backup['parts']):
+                            if offset != covered:
+                                break
+                            covered += len(backup['parts'][offset])
+                        if covered != completed_size:
+                            return self._json({'error': 'Upload incomplete', 'received_bytes': covered}, 409)
+                    backup['status'] = 'completed'
+                    backup['sha256'] = data.get('sha256')
+                self._json({'success': True, 'message': 'Upload completed'})
+
+            def _fail(self, query, body):
+                backup = server.backups.get(json.loads(body).get('backup_id'))
+                if backup is not None:
+                    backup['status'] = 'failed'
+                self._json({'success': True, 'message': 'Upload marked as failed'})
+
+            def _json(self, data, status=200):
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
@@ -0,0 +1,129 @@
+"""
+Load test of the add-on API while a backup uploads.
+
+Polling clients hammer /api/metrics/history (gzipped) on waitress, in its
+own API process, and on the Flask development server, first idle and then
+during a CDC + zstd + encrypted backup against the mock Supervisor and the
+stand-in upload function. Prints requests per second and p50/p99 latency for each.
+
+    python tests/load_api_server.py [--clients 16] [--seconds 4] [--size-mb 256]
+"""
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# main.py reads its options when it is imported
+os.environ.update(
+    API_KEY='load-test',
+    DATA_DIR=tempfile.mkdtemp(prefix='homesafe-load-'),
+    AUTO_BACKUP='false',
+    CHUNKING='cdc',
+    COMPRESSION='zstd',
+    ENCRYPTION='chacha20-poly1305',
+    ENCRYPTION_KEY='load-test-passphrase',
+    UPLOAD_PARALLELISM='4'
+)
+
+import requests  # noqa: E402
+
+import main  # noqa: E402
+from api_server import API_SERVER_DEVELOPMENT, API_SERVER_WAITRESS, serve  # noqa: E402
+from dedup_server import DedupServer  # noqa: E402
+from mock_supervisor import MockSupervisor, Tracker  # noqa: E402
+
+PATH = '/api/metrics/history'
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_api(server):
+    port = free_port()
+    threading.Thread(target=serve, args=(main.app, '127.0.0.1', port), kwargs={'server': server, 'threads': main.API_THREADS}, daemon=True).start()
+    for _ in range(50):
+        try:
+            requests.get(f'http://127.0.0.1:{port}{PATH}', timeout=1)
+            return port
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f'{server} server did not start')
+
+
+def poll(port, seconds, latencies):
+    session = requests.Session()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        started = time.monotonic()
+        response = session.get(f'http://127.0.0.1:{port}{PATH}', headers={'Accept-Encoding': 'gzip'}, timeout=30)
+        response.raise_for_status()
+        latencies.append(time.monotonic() - started)
+
+
+def measure(port, clients, seconds):
+    latencies = []
+    threads = [threading.Thread(target=poll, args=(port, seconds, latencies)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return {
+        'rps': len(latencies) / seconds,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[int(len(latencies) * 0.99)] * 1000
+    }
+
+
+def report(server, label, result):
+    print(f"{server:<12} {label:<14} {result['rps']:7.0f} req/s   p50 {result['p50']:7.1f} ms   p99 {result['p99']:7.1f} ms")
+
+
+def main_load_test():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=4)
+    parser.add_argument('--size-mb', type=int, default=256)
+    args = parser.parse_args()
+
+    upload_server = DedupServer().start()
+    supervisor = MockSupervisor(Tracker(), backup_size=args.size_mb * 1024 * 1024).start()
+    connector = main.HomeSafeConnector(instance_id='load-test', websocket_url=None)
+    connector.api_url = upload_server.url
+    connector.supervisor_url = supervisor.url
+    main.connectors[connector.key] = connector
+    # A realistic history body, large enough to be gzipped
+    for position in range(30):
+        connector.history.add({'status': 'succeeded', 'trigger_type': 'scheduled', 'timings': {'upload': position}, 'summary': {'chunk_sizes': list(range(50))}})
+
+    for server in (API_SERVER_WAITRESS, API_SERVER_DEVELOPMENT):
+        port = start_api(server)
+        report(server, 'idle', measure(port, args.clients, args.seconds))
+
+        backup = threading.Thread(target=connector.perform_backup, args=('manual',))
+        backup.start()
+        # Past snapshot creation, into the upload
+        time.sleep(1)
+        result = measure(port, args.clients, args.seconds)
+        busy = backup.is_alive()
+        backup.join()
+        report(server, 'during backup', result)
+        if not busy:
+            print(f'{"":<12} the backup finished before the measurement ended, raise --size-mb')
+
+    supervisor.stop()
+    upload_server.stop()
+
+
+if __name__ == '__main__':
+    main_load_test()
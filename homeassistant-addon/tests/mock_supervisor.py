@@ -0,0 +1,129 @@
+"""
+Local stand-in for the Home Assistant Supervisor API, kept in memory.
+
+Implements the calls a backup makes (new full backup, info, download,
+remove, core info). Backups are created synchronously after a short delay,
+as older Supervisors do. A Tracker shared by several instances records how
+many of them hold a backup at the same time, from the moment it is created
+until the add-on removes it after the upload.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+class Tracker:
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def finished(self):
+        with self._lock:
+            self.active -= 1
+
+
+class MockSupervisor:
+    def __init__(self, tracker, backup_size=256 * 1024, create_delay=0.3):
+        self.tracker = tracker
+        self.backup_size = backup_size
+        self.create_delay = create_delay
+        # slug -> archive bytes
+        self.backups = {}
+        self.removed = []
+        # Slugs in the order their archives were downloaded
+        self.downloads = []
+        self._slugs = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def archive(self, slug):
+        """Random archive bytes, made in blocks (randbytes is limited to 256 MB)"""
+        rng = random.Random(slug)
+        blocks = [rng.randbytes(min(BLOCK_SIZE, self.backup_size - start)) for start in range(0, self.backup_size, BLOCK_SIZE)]
+        return b''.join(blocks)
+
+    def _handler(self):
+        supervisor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                if self.path == '/core/info':
+                    return self._json({'version': '2025.10.0', 'version_latest': '2025.10.0', 'update_available': False})
+                if parts[0] == 'backups' and len(parts) == 3:
+                    archive = supervisor.backups.get(parts[1])
+                    if archive is None:
+                        return self._json(None, 404)
+                    if parts[2] == 'info':
+                        return self._json({'slug': parts[1], 'homeassistant': '2025.10.0', 'size': len(archive) / 1024 / 1024})
+                    if parts[2] == 'download':
+                        supervisor.downloads.append(parts[1])
+                        self.send_response(200)
+                        self.send_header('Content-Type', 'application/x-tar')
+                        self.send_header('Content-Length', str(len(archive)))
+                        self.end_headers()
+                        self.wfile.write(archive)
+                        return
+                self._json(None, 404)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                parts = self.path.strip('/').split('/')
+                if self.path == '/backups/new/full':
+                    supervisor.tracker.started()
+                    time.sleep(supervisor.create_delay)
+                    slug = f'{next(supervisor._slugs):08x}'
+                    archive = supervisor.archive(slug)
+                    with supervisor._lock:
+                        supervisor.backups[slug] = archive
+                    return self._json({'slug': slug})
+                if parts[0] == 'backups' and len(parts) == 3 and parts[2] == 'remove':
+                    with supervisor._lock:
+                        if supervisor.backups.pop(parts[1], None) is None:
+                            return self._json(None, 404)
+                        supervisor.removed.append(parts[1])
+                    supervisor.tracker.finished()
+                    return self._json({})
+                self._json(None, 404)
+
+            def _json(self, data, status=200):
+                if status == 200:
+                    payload = json.dumps({'result': 'ok', 'data': data}).encode()
+                else:
+                    payload = json.dumps({'result': 'error', 'message': 'Not found'}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
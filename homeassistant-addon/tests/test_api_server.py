@@ -0,0 +1,138 @@
+"""The add-on API served from its own process: gzip responses, cached polling, and answers while a backup uploads"""
+import gzip
+import socket
+import threading
+import time
+
+import pytest
+import requests
+from flask import Flask, jsonify, request
+
+import main
+from api_server import ApiProcess
+from mock_supervisor import MockSupervisor, Tracker
+
+MB = 1024 * 1024
+PATH = '/api/metrics/history'
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def supervisor():
+    supervisor = MockSupervisor(Tracker(), backup_size=64 * MB).start()
+    yield supervisor
+    supervisor.stop()
+
+
+@pytest.fixture
+def connector(connector, supervisor):
+    connector.supervisor_url = supervisor.url
+    for position in range(30):
+        connector.history.add({'status': 'succeeded', 'trigger_type': 'scheduled', 'timings': {'upload': position}})
+    return connector
+
+
+def start_api_process(app):
+    api_process = ApiProcess(app, '127.0.0.1', free_port()).start()
+    for _ in range(100):
+        try:
+            requests.get(f'http://127.0.0.1:{api_process.port}/', timeout=1)
+            return api_process
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    api_process.stop()
+    pytest.fail('API process did not start')
+
+
+@pytest.fixture(scope='module')
+def port():
+    api_process = start_api_process(main.app)
+    yield api_process.port
+    api_process.stop()
+
+
+def get(port, accept_encoding):
+    return requests.get(f'http://127.0.0.1:{port}{PATH}', headers={'Accept-Encoding': accept_encoding}, stream=True, timeout=10)
+
+
+def test_history_is_gzipped_for_clients_that_accept_it(connector, port):
+    compressed = get(port, 'gzip')
+    plain = get(port, 'identity')
+
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert compressed.headers['Server'] == 'homesafe-connector'
+    body = gzip.decompress(compressed.raw.read())
+    assert 'Content-Encoding' not in plain.headers
+    assert body == plain.raw.read()
+    assert len(body) > int(compressed.headers['Content-Length'])
+
+
+def test_api_answers_polling_clients_during_a_backup(connector, port):
+    statuses = []
+    latencies = []
+
+    def poll():
+        session = requests.Session()
+        while backup.is_alive():
+            started = time.monotonic()
+            statuses.append(session.get(f'http://127.0.0.1:{port}{PATH}', headers={'Accept-Encoding': 'gzip'}, timeout=10).status_code)
+            latencies.append(time.monotonic() - started)
+
+    backup = threading.Thread(target=connector.perform_backup, args=('manual',))
+    backup.start()
+    clients = [threading.Thread(target=poll) for _ in range(8)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    assert connector.history.recent()[0]['status'] == main.STATUS_SUCCEEDED
+    assert statuses and set(statuses) == {200}
+    assert max(latencies) < 5
+
+
+def test_polling_clients_share_one_answer_of_the_connector():
+    app = Flask('counting')
+    calls = []
+
+    @app.route('/api/status')
+    def status():
+        calls.append(request.args.get('instance'))
+        time.sleep(0.2)
+        response = jsonify({'success': True, 'calls': len(calls)})
+        response.set_etag(f'status-{len(calls)}', weak=True)
+        return response
+
+    @app.route('/api/backup/trigger', methods=['POST'])
+    def trigger():
+        return jsonify({'success': True, 'trigger': request.get_json()['trigger']}), 202
+
+    api_process = start_api_process(app)
+    url = f'http://127.0.0.1:{api_process.port}/api/status'
+    try:
+        calls.clear()
+        answers = []
+        clients = [threading.Thread(target=lambda: answers.append(requests.get(url, timeout=10))) for _ in range(16)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+
+        assert [answer.status_code for answer in answers] == [200] * 16
+        assert len(calls) == 1
+        etag = answers[0].headers['ETag']
+        assert requests.get(url, headers={'If-None-Match': etag}, timeout=10).status_code == 304
+
+        # Another instance is another URL; a POST is forwarded and drops the cached answers
+        assert requests.get(f'{url}?instance=other', timeout=10).json()['calls'] == 2
+        triggered = requests.post(f'http://127.0.0.1:{api_process.port}/api/backup/trigger', json={'trigger': 'manual'}, timeout=10)
+        assert triggered.status_code == 202 and triggered.json()['trigger'] == 'manual'
+        assert requests.get(url, timeout=10).json()['calls'] == 3
+    finally:
+        api_process.stop()
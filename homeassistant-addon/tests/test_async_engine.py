@@ -0,0 +1,62 @@
+"""Periodic jobs on the asyncio engine: deadlines and overlapping runs"""
+import threading
+import time
+
+import pytest
+
+from async_engine import AsyncEngine, PeriodicJob
+
+
+@pytest.fixture
+def engine():
+    engine = AsyncEngine().start()
+    yield engine
+    engine.loop.call_soon_threadsafe(engine.loop.stop)
+    engine.join()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_job_past_its_deadline_stays_running_until_its_thread_returns(engine):
+    release = threading.Event()
+    periodic = PeriodicJob('slow job', lambda: release.wait(10), timeout=0.1, interval=60)
+
+    engine.run(periodic._run_once())
+
+    # The wait gave up at the deadline, the thread did not
+    assert periodic.running
+    release.set()
+    wait_until(lambda: not periodic.running)
+
+
+def test_due_runs_are_skipped_while_an_abandoned_run_is_going(engine):
+    release = threading.Event()
+    calls = []
+
+    def job():
+        calls.append(time.monotonic())
+        release.wait(10)
+
+    periodic = engine.every('slow job', 0.05, job, timeout=0.05, delay=0)
+    time.sleep(0.5)
+
+    # Several deadlines and due runs later, the first run is still the only one
+    assert len(calls) == 1 and periodic.running
+    release.set()
+    wait_until(lambda: len(calls) > 1)
+
+
+def test_failed_job_is_not_running(engine):
+    def job():
+        raise RuntimeError('Supervisor unreachable')
+
+    periodic = PeriodicJob('failing job', job, timeout=1, interval=60)
+
+    engine.run(periodic._run_once())
+
+    assert not periodic.running
@@ -0,0 +1,68 @@
+"""The backup job queue: one backup at a time, with triggers folded into the job in flight"""
+import threading
+
+import pytest
+
+from backup_jobs import STATUS_FAILED, STATUS_RUNNING, STATUS_SUCCEEDED, BackupJobQueue
+
+
+@pytest.fixture
+def backups():
+    """A queue whose backups run until released"""
+    release = threading.Event()
+    started = threading.Event()
+    runs = []
+
+    def run_backup(job):
+        runs.append(job)
+        started.set()
+        return release.wait(10)
+
+    queue = BackupJobQueue(run_backup)
+    queue.start()
+    return queue, runs, started, release
+
+
+def test_triggers_coalesce_into_the_running_job(backups):
+    queue, runs, started, release = backups
+    job, coalesced = queue.submit('scheduled')
+    assert not coalesced
+    assert started.wait(5) and job.status == STATUS_RUNNING
+
+    results = [queue.submit(trigger) for trigger in ('manual', 'pre_update', 'manual')]
+
+    assert results == [(job, True)] * 3
+    assert job.to_dict()['coalesced_triggers'] == 3
+    release.set()
+    assert queue.wait_idle(5)
+    assert runs == [job] and job.status == STATUS_SUCCEEDED
+    assert queue.jobs() == [job]
+
+
+def test_trigger_after_the_run_starts_a_new_job(backups):
+    queue, runs, started, release = backups
+    release.set()
+    first, _ = queue.submit('scheduled')
+    assert queue.wait_idle(5)
+
+    second, coalesced = queue.submit('manual')
+    assert queue.wait_idle(5)
+
+    assert not coalesced and second is not first
+    assert runs == [first, second]
+    assert queue.jobs() == [second, first]
+
+
+def test_failed_run_records_its_phase():
+    def run_backup(job):
+        job.set_phase('uploading', 100)
+        return False
+
+    queue = BackupJobQueue(run_backup)
+    queue.start()
+    job, _ = queue.submit('manual')
+
+    assert queue.wait_idle(5)
+    assert job.status == STATUS_FAILED
+    assert job.error == 'Backup failed during uploading'
+    assert not queue.is_busy()
@@ -0,0 +1,17 @@
+"""The backup list the add-on API serves to the card"""
+import io
+
+import main
+
+
+def test_backup_list_leaves_out_storage_fields(connector):
+    data = b'backup' * 1000
+    connector._upload_source('slug', io.BytesIO(data), len(data), '2025.10.0', 'scheduled')
+
+    response = main.app.test_client().get('/api/backups')
+
+    backup, = response.get_json()['backups']
+    assert backup['status'] == 'completed'
+    assert backup['size_bytes'] == len(data)
+    assert backup['ha_version'] == '2025.10.0'
+    assert 'storage_path' not in backup and 'user_id' not in backup
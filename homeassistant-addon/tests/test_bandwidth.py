@@ -0,0 +1,106 @@
+"""Upload rate limiting: the token bucket, time-of-day windows and the fleet-wide split"""
+import time
+from datetime import datetime
+
+import pytest
+
+import bandwidth
+from bandwidth import MB, BandwidthLimiter, SharedBandwidth, parse_rate_schedule
+
+
+class FakeClock:
+    """
+    Monotonic clock that only moves when the limiter sleeps.
+
+    Rates here are powers of two so every wait is exact in floating point;
+    otherwise a remainder too small to move the clock would repeat forever.
+    """
+
+    def __init__(self):
+        self.start = self.now = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return self.now - self.start
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(bandwidth.time, 'sleep', clock.sleep)
+    return clock
+
+
+def at(hour, minute=0):
+    return lambda: datetime(2025, 10, 1, hour, minute)
+
+
+def send(limiter, total, block=64 * 1024):
+    for _ in range(total // block):
+        limiter.acquire(block)
+
+
+def test_bucket_keeps_to_the_rate(clock):
+    limiter = BandwidthLimiter(2 * MB, clock=clock)
+
+    send(limiter, 10 * MB)
+
+    # The bucket starts empty, so 10 MB at 2 MB/s takes 5 seconds
+    assert clock.elapsed == pytest.approx(5, abs=0.05)
+    assert limiter.throttled_seconds == pytest.approx(clock.elapsed)
+
+
+def test_idle_time_allows_at_most_one_second_of_burst(clock):
+    limiter = BandwidthLimiter(2 * MB, clock=clock)
+    clock.sleep(60)
+
+    send(limiter, 6 * MB)
+
+    # 2 MB from the full bucket, the other 4 MB at the rate
+    assert clock.elapsed - 60 == pytest.approx(2, abs=0.05)
+
+
+def test_unlimited_never_waits(clock):
+    limiter = BandwidthLimiter(0, clock=clock)
+
+    send(limiter, 10 * MB)
+
+    assert not limiter.enabled
+    assert clock.elapsed == 0 and limiter.throttled_seconds == 0
+
+
+def test_time_windows_set_the_rate():
+    windows = parse_rate_schedule('08:00-18:00=1, 23:00-06:00=0, nonsense, 25:00-26:00=3')
+
+    assert windows == [(8 * 60, 18 * 60, 1 * MB), (23 * 60, 6 * 60, 0)]
+    assert BandwidthLimiter(5 * MB, windows, now=at(12)).current_rate() == 1 * MB
+    # A window may wrap past midnight; 0 is unlimited
+    assert BandwidthLimiter(5 * MB, windows, now=at(2, 30)).current_rate() == 0
+    assert BandwidthLimiter(5 * MB, windows, now=at(20)).current_rate() == 5 * MB
+
+
+def test_shared_limit_is_split_between_active_instances(clock):
+    shared = SharedBandwidth(8 * MB)
+    first = shared.share('first')
+    second = shared.share('second')
+    first._clock = second._clock = clock
+    shared.activate('first')
+
+    assert first.current_rate() == 8 * MB
+    # An instance asking for its rate counts itself before it is activated
+    assert second.current_rate() == 4 * MB
+    shared.activate('second')
+    assert first.current_rate() == second.current_rate() == 4 * MB
+
+    send(first, 8 * MB)
+    assert clock.elapsed == pytest.approx(2, abs=0.05)
+
+    # The share grows back when the other upload finishes
+    shared.deactivate('second')
+    assert first.current_rate() == 8 * MB
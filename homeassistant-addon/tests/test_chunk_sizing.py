@@ -0,0 +1,82 @@
+"""Adaptive chunk sizes: growth, back-off, clamping and the replay of an interrupted upload"""
+from types import SimpleNamespace
+
+import pytest
+
+from chunk_sizing import MAX_TIMEOUT, MB, MIN_TIMEOUT, AdaptiveChunkSizer
+
+
+def test_sizes_grow_at_most_twice_per_chunk_up_to_the_maximum():
+    sizer = AdaptiveChunkSizer(1 * MB, 16 * MB)
+
+    sizes = []
+    for number in range(1, 8):
+        sizes.append(sizer.next_size(number))
+        # 10 MB/s: the target is 200 MB, far more than doubling allows
+        sizer.record_success(sizes[-1], sizes[-1] / (10 * MB))
+
+    assert sizes == [size * MB for size in (1, 2, 4, 8, 16, 16, 16)]
+    assert sizer.summary()['max_bytes'] == 16 * MB
+
+
+def test_size_follows_the_target_duration_in_whole_megabytes():
+    sizer = AdaptiveChunkSizer(1 * MB, 64 * MB, plan=[32 * MB])
+
+    # 32 MB in 30 s: 20 s worth is 21.3 MB
+    sizer.record_success(sizer.next_size(1), 30)
+
+    assert sizer.next_size(2) == 21 * MB
+
+
+def test_failures_halve_the_size_down_to_the_minimum():
+    sizer = AdaptiveChunkSizer(4 * MB, 64 * MB, plan=[16 * MB])
+
+    sizes = []
+    for _ in range(3):
+        sizer.record_failure()
+        sizes.append(sizer.next_size(2))
+
+    assert sizes == [8 * MB, 4 * MB, 4 * MB]
+    assert sizer.summary()['failures'] == 3
+
+
+def test_slow_link_never_goes_below_the_minimum():
+    sizer = AdaptiveChunkSizer(8 * MB, 64 * MB)
+
+    sizer.record_success(sizer.next_size(1), 80)
+
+    assert sizer.next_size(2) == 8 * MB
+
+
+def test_timeout_scales_with_the_measured_throughput():
+    sizer = AdaptiveChunkSizer(1 * MB, 64 * MB)
+    assert sizer.timeout(8 * MB) == MAX_TIMEOUT
+
+    sizer.record_success(1 * MB, 1)
+
+    assert sizer.timeout(8 * MB) == MIN_TIMEOUT
+    assert sizer.timeout(100 * MB) == 400
+    assert sizer.timeout(1000 * MB) == MAX_TIMEOUT
+
+
+def test_resumed_upload_replays_the_chunks_already_sent():
+    # Chunks 3 and 4 were never sent; their 12 MB are split evenly
+    journal = SimpleNamespace(sent_spans={
+        1: (0, 4 * MB), 2: (4 * MB, 8 * MB), 5: (24 * MB, 8 * MB)
+    })
+
+    sizer = AdaptiveChunkSizer.from_journal(journal, 1 * MB, 16 * MB)
+
+    assert [sizer.next_size(number) for number in range(1, 7)] == [size * MB for size in (4, 8, 6, 6, 8, 8)]
+
+
+@pytest.mark.parametrize('sent_spans', [
+    {1: (0, 4 * MB), 2: (2 * MB, 4 * MB)},
+    {1: (0, 32 * MB)},
+    {1: (0, 4 * MB), 3: (4 * MB, 4 * MB)},
+], ids=['overlap', 'over maximum', 'gap too small'])
+def test_inconsistent_journal_starts_sizes_over(sent_spans):
+    sizer = AdaptiveChunkSizer.from_journal(SimpleNamespace(sent_spans=sent_spans), 1 * MB, 16 * MB)
+
+    assert sizer.plan == []
+    assert sizer.next_size(1) == 1 * MB
@@ -0,0 +1,118 @@
+"""Content-defined chunking uploads against the stand-in dedup server"""
+import hashlib
+import io
+import mmap
+import random
+
+import pytest
+
+from chunking import CDC_MAX_SIZE, CDC_MIN_SIZE, CHUNKING_CDC, ContentDefinedBoundary
+from upload_pipeline import UploadPipeline
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def connector_options():
+    return {'CHUNKING': CHUNKING_CDC}
+
+
+def snapshot(seed, size=24 * MB):
+    return random.Random(seed).randbytes(size)
+
+
+def text_snapshot(seed, size=24 * MB):
+    """Log-like lines from a small vocabulary: far from random, as configuration and databases are"""
+    rng = random.Random(seed)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9))) for _ in range(3000)]
+    lines = []
+    length = 0
+    while length < size:
+        line = f"2025-10-{rng.randint(1, 31):02d} {rng.randint(0, 10 ** 6)} sensor.{rng.choice(words)} {' '.join(rng.choice(words) for _ in range(rng.randint(3, 12)))}\n"
+        lines.append(line)
+        length += len(line)
+    return ''.join(lines).encode()[:size]
+
+
+def chunk_lengths(source):
+    lengths = []
+    pipeline = UploadPipeline(source, 0, boundary=ContentDefinedBoundary(), digest=hashlib.sha256)
+    assert pipeline.run(lambda chunk: lengths.append((chunk.offset, chunk.length)))
+    return [length for _, length in sorted(lengths)]
+
+
+def upload(connector, data):
+    return connector._upload_source('slug', io.BytesIO(data), len(data), '2025.10.0', 'scheduled')
+
+
+def test_unchanged_archive_uploads_no_chunks(server, connector):
+    data = snapshot(1)
+    first = upload(connector, data)
+    uploaded = server.uploaded_bytes
+
+    second = upload(connector, data)
+
+    assert uploaded == len(data)
+    assert server.uploaded_bytes == uploaded
+    assert server.assemble(second) == data
+    assert server.assemble(first) == data
+
+
+@pytest.mark.parametrize('make_snapshot', [snapshot, text_snapshot])
+def test_edit_uploads_only_nearby_chunks(server, connector, make_snapshot):
+    data = make_snapshot(2)
+    first = upload(connector, data)
+    uploaded = server.uploaded_bytes
+
+    middle = len(data) // 2
+    edited = data[:middle] + b'inserted by the second backup' + data[middle:]
+    second = upload(connector, edited)
+
+    # Boundaries realign after the edit, so only the chunks around it are sent again
+    first_chunks = {entry[0] for entry in server.backups[first]['manifest']}
+    new_chunks = [entry for entry in server.backups[second]['manifest'] if entry[0] not in first_chunks]
+    assert 1 <= len(new_chunks) <= 2
+    assert server.uploaded_bytes - uploaded == sum(length for _, _, length in new_chunks) <= 2 * CDC_MAX_SIZE
+    assert server.uploaded_bytes - uploaded < len(data) // 2
+    assert server.assemble(first) == data
+    assert server.assemble(second) == edited
+
+
+def test_streamed_and_mapped_snapshots_split_alike(tmp_path):
+    data = text_snapshot(6, 40 * MB)
+    path = tmp_path / 'snapshot.tar'
+    path.write_bytes(data)
+
+    streamed = chunk_lengths(io.BytesIO(data))
+    with open(path, 'rb') as snapshot_file:
+        mapped = chunk_lengths(mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    assert streamed == mapped
+    assert sum(streamed) == len(data)
+    # Cut by content, not by the size limit
+    assert len(streamed) > 5
+    assert all(CDC_MIN_SIZE <= length < CDC_MAX_SIZE for length in streamed[:-1])
+
+
+def test_delete_keeps_chunks_of_other_backups(server, connector):
+    data = snapshot(3)
+    first = upload(connector, data)
+    second = upload(connector, data[:len(data) // 2] + snapshot(4, 4 * MB))
+
+    assert server.delete(first) > 0
+    assert server.assemble(second) == data[:len(data) // 2] + snapshot(4, 4 * MB)
+
+    server.delete(second)
+    assert server.chunks == {}
+
+
+def test_chunk_pruned_after_have_is_uploaded_again(server, connector):
+    data = snapshot(5)
+    upload(connector, data)
+    server.drop_after_have.update(server.chunks)
+
+    # complete is refused while chunks are missing, the next attempt sends them
+    assert upload(connector, data) is None
+    retried = upload(connector, data)
+
+    assert server.assemble(retried) == data
@@ -0,0 +1,82 @@
+"""Fleet mode: several instances backing up against mock Supervisors, within the backup slots"""
+import json
+import threading
+
+import pytest
+
+import main
+from mock_supervisor import MockSupervisor, Tracker
+
+INSTANCES = 4
+
+
+@pytest.fixture
+def tracker():
+    return Tracker()
+
+
+@pytest.fixture
+def supervisors(tracker):
+    supervisors = [MockSupervisor(tracker).start() for _ in range(INSTANCES)]
+    yield supervisors
+    for supervisor in supervisors:
+        supervisor.stop()
+
+
+@pytest.fixture
+def fleet(server, supervisors, main_options, tmp_path, monkeypatch):
+    fleet_file = tmp_path / 'fleet.json'
+    fleet_file.write_text(json.dumps({'instances': [
+        {'name': f'Site {position}', 'supervisor_url': supervisor.url, 'supervisor_token': f'token-{position}'}
+        for position, supervisor in enumerate(supervisors, 1)
+    ]}))
+    monkeypatch.setattr(main, 'FLEET_FILE', str(fleet_file))
+    monkeypatch.setattr(main, 'FLEET_DATA_DIR', tmp_path / 'instances')
+    monkeypatch.setattr(main, 'BACKUP_TIERS', '')
+
+    def create(concurrency):
+        monkeypatch.setattr(main, 'FLEET_CONCURRENCY', concurrency)
+        connectors = main.create_connectors()
+        for connector in connectors:
+            connector.api_url = server.url
+        return connectors
+
+    return create
+
+
+def back_up_all(connectors):
+    results = {}
+
+    def run(connector):
+        results[connector.instance_id] = connector.perform_backup('manual')
+
+    threads = [threading.Thread(target=run, args=(connector,)) for connector in connectors]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    return results
+
+
+def test_instances_back_up_concurrently_within_their_slots(server, tracker, supervisors, fleet):
+    connectors = fleet(concurrency=2)
+
+    results = back_up_all(connectors)
+
+    assert results == {connector.instance_id: True for connector in connectors}
+    # Two instances ran side by side, never a third
+    assert tracker.peak == 2
+    assert connectors[0].backup_slots.status() == {'limit': 2, 'running': [], 'waiting': []}
+    assert [backup['status'] for backup in server.backups.values()] == ['completed'] * INSTANCES
+    for supervisor in supervisors:
+        assert len(supervisor.removed) == 1 and supervisor.backups == {}
+
+
+def test_single_slot_backs_up_one_instance_at_a_time(server, tracker, fleet):
+    connectors = fleet(concurrency=1)
+
+    results = back_up_all(connectors)
+
+    assert all(results.values()) and len(results) == INSTANCES
+    assert tracker.peak == 1
+    assert len(server.backups) == INSTANCES
@@ -0,0 +1,66 @@
+"""GitHub YAML sync: when it runs, and what it asks HomeSafe for"""
+import pytest
+from git import Repo
+
+import main
+
+
+@pytest.fixture
+def github_sync(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'GITHUB_SYNC_INDEX_PATH', tmp_path / 'github_sync_index.json')
+    github_sync = main.GitHubSync('test-key')
+    github_sync.api_url = server.url
+    github_sync.ha_config_path = tmp_path / 'config'
+    return github_sync
+
+
+def test_sync_is_skipped_when_the_configuration_is_not_mounted(github_sync):
+    # None: nothing to retry until the configuration changes
+    assert github_sync.sync_yaml_configs() is None
+
+
+def test_sync_is_skipped_while_the_configuration_has_no_yaml(github_sync):
+    github_sync.ha_config_path.mkdir()
+
+    assert github_sync.sync_yaml_configs() is None
+
+
+@pytest.fixture
+def remotes(github_sync, tmp_path, monkeypatch):
+    """Local bare repositories standing in for GitHub, by repository name"""
+    remotes = {}
+    monkeypatch.setattr(main, 'GITHUB_SYNC_DIR', tmp_path / 'github-sync')
+
+    def open_working_copy(settings, git_env):
+        if main.GITHUB_SYNC_DIR.exists():
+            return Repo(main.GITHUB_SYNC_DIR)
+        if settings['repo'] not in remotes:
+            remotes[settings['repo']] = Repo.init(tmp_path / 'remotes' / settings['repo'], bare=True, initial_branch=settings['branch'])
+        return Repo.clone_from(remotes[settings['repo']].working_dir, main.GITHUB_SYNC_DIR)
+
+    github_sync._open_working_copy = open_working_copy
+    return remotes
+
+
+def pushed_files(remote, branch='main'):
+    return sorted(item.path for item in remote.commit(branch).tree.traverse())
+
+
+def test_changed_target_repository_gets_every_file_without_a_change(github_sync, remotes):
+    github_sync.ha_config_path.mkdir()
+    (github_sync.ha_config_path / 'configuration.yaml').write_text('homeassistant:\n  name: Home\n')
+    (github_sync.ha_config_path / 'automations.yaml').write_text('[]\n')
+    settings = {'token': 'token', 'repo': 'home/first', 'branch': 'main'}
+    github_sync.get_user_github_settings = lambda: settings
+
+    assert github_sync.sync_yaml_configs() is True
+    assert pushed_files(remotes['home/first']) == ['automations.yaml', 'configuration.yaml']
+    # Nothing changed: no new commit
+    assert github_sync.sync_yaml_configs() is True
+    assert len(list(remotes['home/first'].iter_commits('main'))) == 1
+
+    settings['repo'] = 'home/second'
+    assert github_sync.sync_yaml_configs() is True
+
+    assert pushed_files(remotes['home/second']) == ['automations.yaml', 'configuration.yaml']
+    assert main.ConfigSyncIndex(main.GITHUB_SYNC_INDEX_PATH).load().repo == 'home/second'
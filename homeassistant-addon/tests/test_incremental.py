@@ -0,0 +1,82 @@
+"""Incremental archives: which members of a snapshot are uploaded again"""
+import gzip
+import io
+import json
+import random
+import tarfile
+
+from incremental import MANIFEST_NAME, TarMemberIndex, build_incremental_archive
+
+DAY = 86400
+HOME_ASSISTANT = random.Random(1).randbytes(300 * 1024)
+SSH_ADDON = random.Random(2).randbytes(200 * 1024)
+
+
+def snapshot(members, mtime):
+    """Supervisor-like snapshot tar; inner archives are gzipped with a timestamp, as on every backup"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name, content in members.items():
+            if name.endswith('.gz'):
+                content = gzip.compress(content, mtime=mtime)
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mtime = mtime
+            tar.addfile(info, io.BytesIO(content))
+    buffer.seek(0)
+    return buffer
+
+
+def build(tmp_path, index, members, mtime, max_reference_age=30 * DAY):
+    return build_incremental_archive(snapshot(members, mtime), tmp_path / 'incremental.tar', index, max_reference_age)
+
+
+def archive_contents(archive):
+    with tarfile.open(archive.path) as tar:
+        return {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+
+
+def test_unchanged_member_is_skipped_and_changed_gzip_member_rehashed(tmp_path):
+    index = TarMemberIndex(tmp_path / 'tar_index.json').load()
+    members = {'backup.json': b'{"slug": "first"}', 'homeassistant.tar.gz': HOME_ASSISTANT, 'ssh.tar.gz': SSH_ADDON}
+    first = build(tmp_path, index, members, mtime=1_700_000_000)
+    assert [member['name'] for member in first.included] == ['backup.json', 'homeassistant.tar.gz', 'ssh.tar.gz']
+    index.update(first, 'backup-1')
+
+    # The add-on is unchanged but gzipped again with another timestamp; Home Assistant changed
+    members = {'backup.json': b'{"slug": "second"}', 'homeassistant.tar.gz': HOME_ASSISTANT + b'new state', 'ssh.tar.gz': SSH_ADDON}
+    second = build(tmp_path, TarMemberIndex(tmp_path / 'tar_index.json').load(), members, mtime=1_700_086_400)
+
+    assert [member['name'] for member in second.included] == ['backup.json', 'homeassistant.tar.gz']
+    assert [(member['name'], member['backup_id']) for member in second.referenced] == [('ssh.tar.gz', 'backup-1')]
+    assert second.base_backup_id == 'backup-1'
+    changed = next(member for member in second.members if member['name'] == 'homeassistant.tar.gz')
+    assert changed['sha256'] != index.members['homeassistant.tar.gz']['sha256']
+    assert index.members['ssh.tar.gz']['sha256'] == second.referenced[0]['sha256']
+
+    contents = archive_contents(second)
+    assert list(contents) == ['backup.json', 'homeassistant.tar.gz', MANIFEST_NAME]
+    assert gzip.decompress(contents['homeassistant.tar.gz']) == HOME_ASSISTANT + b'new state'
+    manifest = json.loads(contents[MANIFEST_NAME])
+    assert manifest['base_backup_id'] == 'backup-1'
+    assert [member['name'] for member in manifest['members']] == ['backup.json', 'homeassistant.tar.gz', 'ssh.tar.gz']
+
+
+def test_references_past_the_maximum_age_are_uploaded_again(tmp_path):
+    index = TarMemberIndex(tmp_path / 'tar_index.json').load()
+    members = {'ssh.tar.gz': SSH_ADDON}
+    index.update(build(tmp_path, index, members, mtime=1_700_000_000), 'backup-1')
+
+    rebuilt = build(tmp_path, index, members, mtime=1_700_086_400, max_reference_age=0)
+
+    assert rebuilt.referenced == []
+    assert gzip.decompress(archive_contents(rebuilt)['ssh.tar.gz']) == SSH_ADDON
+
+
+def test_rebuilt_archive_is_identical(tmp_path):
+    index = TarMemberIndex(tmp_path / 'tar_index.json').load()
+    members = {'backup.json': b'{}', 'homeassistant.tar.gz': HOME_ASSISTANT}
+
+    first = build(tmp_path, index, members, mtime=1_700_000_000).path.read_bytes()
+    # A resumed upload rebuilds the archive and must get the same bytes
+    assert build(tmp_path, index, members, mtime=1_700_000_000).path.read_bytes() == first
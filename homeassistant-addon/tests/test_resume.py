@@ -0,0 +1,124 @@
+"""Interrupted uploads resumed from the upload journal, against the mock Supervisor and the stand-in server"""
+import io
+import random
+
+import pytest
+
+import main
+from mock_supervisor import MockSupervisor, Tracker
+from snapshot_source import DOWNLOAD_MODE_SPOOL
+from upload_journal import UploadJournal
+
+MB = 1024 * 1024
+SIZE = 6 * MB
+
+
+@pytest.fixture
+def connector_options():
+    # 1 MB chunks, one at a time, and a failed chunk fails the attempt
+    return {
+        'ADAPTIVE_CHUNK_SIZE': True,
+        'CHUNK_SIZE_MIN': 1 * MB,
+        'CHUNK_SIZE_MAX': 1 * MB,
+        'UPLOAD_PARALLELISM': 1,
+        'UPLOAD_CHUNK_RETRIES': 0,
+        'DOWNLOAD_MODE': DOWNLOAD_MODE_SPOOL
+    }
+
+
+@pytest.fixture
+def supervisor():
+    supervisor = MockSupervisor(Tracker(), backup_size=SIZE, create_delay=0).start()
+    yield supervisor
+    supervisor.stop()
+
+
+@pytest.fixture
+def connector(connector, supervisor):
+    connector.supervisor_url = supervisor.url
+    return connector
+
+
+def journal_of(connector):
+    return UploadJournal.load(connector.upload_journal_path)
+
+
+def test_resume_skips_acknowledged_chunks_and_reuses_the_spool(server, supervisor, connector):
+    server.fail_chunks[4] = False
+
+    assert connector.perform_backup('manual') is False
+    journal = journal_of(connector)
+    assert sorted(journal.acknowledged) == [1, 2, 3]
+    assert journal.attempts == 0
+    slug = journal.snapshot_slug
+    spool_path = connector.data_dir / f'snapshot-{slug}.tar'
+    assert spool_path.stat().st_size == SIZE
+    # Kept for the resume
+    assert slug in supervisor.backups and supervisor.removed == []
+    uploaded_before = server.uploaded_bytes
+
+    assert connector.perform_backup('scheduled') is True
+
+    # Only the chunks that were not acknowledged are sent, from the spool file
+    assert server.uploaded_bytes - uploaded_before == SIZE - 3 * MB
+    assert supervisor.downloads == [slug]
+    backup = server.backups[journal.backup_id]
+    assert len(server.backups) == 1 and backup['status'] == 'completed'
+    assert server.assemble(journal.backup_id) == supervisor.archive(slug)
+    assert backup['init']['backup_trigger'] == 'manual'
+    # Done: no journal, no spool file, no local snapshot
+    assert journal_of(connector) is None
+    assert not connector.upload_journal_path.exists()
+    assert not spool_path.exists()
+    assert supervisor.removed == [slug]
+
+
+def test_upload_is_abandoned_after_five_resume_attempts(server, supervisor, connector):
+    for attempt in range(1 + main.MAX_UPLOAD_RESUME_ATTEMPTS):
+        server.fail_chunks[2] = False
+        assert connector.perform_backup('manual') is False
+        journal = journal_of(connector)
+        if attempt < main.MAX_UPLOAD_RESUME_ATTEMPTS:
+            assert journal.attempts == attempt
+
+    # The last attempt gives up: the backend is told, the journal and the snapshot are dropped
+    assert journal is None
+    assert [backup['status'] for backup in server.backups.values()] == ['failed']
+    assert supervisor.removed == ['00000001'] and supervisor.backups == {}
+    assert list(connector.data_dir.glob('snapshot-*.tar')) == []
+
+    # The next backup starts from a new snapshot
+    assert connector.perform_backup('manual') is True
+    assert [backup['status'] for backup in server.backups.values()] == ['failed', 'completed']
+
+
+def test_journal_left_at_the_attempt_limit_is_abandoned_before_resuming(server, supervisor, connector):
+    server.fail_chunks[2] = False
+    assert connector.perform_backup('manual') is False
+    journal = journal_of(connector)
+    journal.attempts = main.MAX_UPLOAD_RESUME_ATTEMPTS
+    journal.save()
+
+    assert connector.perform_backup('manual') is True
+
+    assert server.backups[journal.backup_id]['status'] == 'failed'
+    assert journal.snapshot_slug in supervisor.removed
+    assert len(server.backups) == 2 and journal_of(connector) is None
+
+
+@pytest.mark.parametrize('slug, size', [('other-slug', SIZE), ('slug', SIZE + 1)])
+def test_journal_of_another_snapshot_starts_a_new_upload(server, connector, slug, size):
+    data = random.Random(1).randbytes(SIZE)
+    server.fail_chunks[3] = False
+    assert connector._upload_source('slug', io.BytesIO(data), len(data), '2025.10.0', 'manual') is None
+    journal = journal_of(connector)
+    data = random.Random(2).randbytes(size)
+
+    backup_id = connector._upload_source(slug, io.BytesIO(data), len(data), '2025.10.0', 'manual', journal)
+
+    # The stale upload is marked failed rather than mixed with another archive
+    assert backup_id != journal.backup_id
+    assert server.backups[journal.backup_id]['status'] == 'failed'
+    assert server.backups[backup_id]['status'] == 'completed'
+    assert server.assemble(backup_id) == data
+    assert journal_of(connector) is None
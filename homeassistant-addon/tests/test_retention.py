@@ -0,0 +1,16 @@
+"""Which local backups each connector's retention covers"""
+import main
+from backup_tiers import load_tiers
+
+TIERS = '[{"name": "core", "schedule": "hourly", "homeassistant": true}, {"name": "media", "schedule": "weekly", "folders": ["media"]}]'
+
+
+def test_untiered_snapshots_are_retained_by_the_first_tier(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'RETENTION_ALL_LOCAL_BACKUPS', False)
+    core, media = main.create_instance_connectors(load_tiers(TIERS), lambda key: None, instance_id='test-instance', websocket_url=None, data_dir=tmp_path)
+
+    assert core._retains('HomeSafe-20250101-020000')
+    assert not media._retains('HomeSafe-20250101-020000')
+    assert core._retains('HomeSafe-core-20250101-020000') and not core._retains('HomeSafe-media-20250101-020000')
+    assert media._retains('HomeSafe-media-20250101-020000')
+    assert not core._retains('Manual backup')
@@ -0,0 +1,161 @@
+"""Encrypted backup streams: STREAM segments, tampering, resumes and the restore helper"""
+import io
+import os
+import random
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import stream_transforms
+from stream_transforms import ENCRYPTION_AES_GCM, ENCRYPTION_CHACHA20, decrypt_stream, new_encryption_salt, open_encrypted_stream
+from upload_journal import UploadJournal
+
+SEGMENT = stream_transforms._SEGMENT_SIZE
+SEALED_SEGMENT = SEGMENT + stream_transforms._TAG_SIZE
+HEADER_SIZE = stream_transforms._HEADER.size
+PASSPHRASE = 'correct horse battery staple'
+SCRIPT = Path(stream_transforms.__file__)
+
+
+def encrypt(data, scheme=ENCRYPTION_CHACHA20, salt=None):
+    stream = open_encrypted_stream(io.BytesIO(data), scheme, PASSPHRASE, salt or new_encryption_salt())
+    return stream.read()
+
+
+def decrypt(encrypted, passphrase=PASSPHRASE):
+    output = io.BytesIO()
+    decrypt_stream(io.BytesIO(encrypted), output, passphrase)
+    return output.getvalue()
+
+
+def segments(encrypted):
+    body = encrypted[HEADER_SIZE:]
+    return [body[start:start + SEALED_SEGMENT] for start in range(0, len(body), SEALED_SEGMENT)]
+
+
+@pytest.mark.parametrize('scheme', [ENCRYPTION_AES_GCM, ENCRYPTION_CHACHA20])
+def test_round_trip(scheme):
+    data = random.Random(1).randbytes(2 * SEGMENT + 12345)
+
+    encrypted = encrypt(data, scheme)
+
+    assert len(segments(encrypted)) == 3
+    assert data[:4096] not in encrypted
+    assert decrypt(encrypted) == data
+
+
+@pytest.mark.parametrize('size', [0, SEGMENT, 3 * SEGMENT])
+def test_input_of_whole_segments_ends_without_an_empty_segment(size):
+    data = random.Random(size).randbytes(size)
+
+    encrypted = encrypt(data)
+
+    assert len(segments(encrypted)) == max(1, size // SEGMENT)
+    assert decrypt(encrypted) == data
+
+
+def test_reads_of_any_size_give_the_same_stream():
+    data = random.Random(2).randbytes(SEGMENT + 999)
+    salt = new_encryption_salt()
+    stream = open_encrypted_stream(io.BytesIO(data), ENCRYPTION_CHACHA20, PASSPHRASE, salt)
+
+    blocks = []
+    while block := stream.read(7777):
+        blocks.append(block)
+
+    assert b''.join(blocks) == encrypt(data, salt=salt)
+
+
+def test_truncated_stream_is_rejected():
+    encrypted = encrypt(random.Random(3).randbytes(3 * SEGMENT))
+
+    # Whole segments dropped: the new last one was not sealed as final
+    with pytest.raises(ValueError, match='Segment 1 failed authentication'):
+        decrypt(encrypted[:HEADER_SIZE + 2 * SEALED_SEGMENT])
+    with pytest.raises(ValueError, match='Segment 0 failed authentication'):
+        decrypt(encrypted[:HEADER_SIZE + SEALED_SEGMENT])
+    with pytest.raises(ValueError, match='truncated header'):
+        decrypt(encrypted[:HEADER_SIZE - 1])
+
+
+def test_flipped_bit_is_rejected():
+    encrypted = bytearray(encrypt(random.Random(4).randbytes(2 * SEGMENT)))
+    encrypted[HEADER_SIZE + SEALED_SEGMENT + 100] ^= 0x01
+
+    with pytest.raises(ValueError, match='Segment 1 failed authentication'):
+        decrypt(bytes(encrypted))
+
+
+def test_changed_header_is_rejected():
+    data = random.Random(5).randbytes(SEGMENT + 10)
+    encrypted = encrypt(data)
+    other = encrypt(data)
+
+    # The header is the associated data of every segment: segments under another header fail
+    with pytest.raises(ValueError, match='Segment 0 failed authentication'):
+        decrypt(other[:HEADER_SIZE] + encrypted[HEADER_SIZE:])
+    # The algorithm is part of it too
+    header = bytearray(encrypted[:HEADER_SIZE])
+    header[6] = stream_transforms._ALGORITHM_IDS[ENCRYPTION_AES_GCM]
+    with pytest.raises(ValueError, match='Segment 0 failed authentication'):
+        decrypt(bytes(header) + encrypted[HEADER_SIZE:])
+
+
+def test_reordered_segments_are_rejected():
+    encrypted = encrypt(random.Random(6).randbytes(3 * SEGMENT))
+    first, second, third = segments(encrypted)
+
+    with pytest.raises(ValueError, match='Segment 0 failed authentication'):
+        decrypt(encrypted[:HEADER_SIZE] + second + first + third)
+    with pytest.raises(ValueError, match='Segment 1 failed authentication'):
+        decrypt(encrypted[:HEADER_SIZE] + first + third + second)
+
+
+def test_wrong_passphrase_is_rejected():
+    encrypted = encrypt(b'secret configuration')
+
+    with pytest.raises(ValueError, match='wrong key'):
+        decrypt(encrypted, 'another passphrase')
+
+
+def test_resume_rederives_the_same_stream_from_the_journal_salt(tmp_path):
+    data = random.Random(7).randbytes(2 * SEGMENT + 54321)
+    journal = UploadJournal(tmp_path / 'upload_journal.json', 'slug', 'backup-1', len(data), SEGMENT,
+                            encryption=ENCRYPTION_CHACHA20, encryption_salt=new_encryption_salt().hex())
+    journal.save()
+    # The interrupted upload got as far as part of the second segment
+    sent = open_encrypted_stream(io.BytesIO(data), ENCRYPTION_CHACHA20, PASSPHRASE, bytes.fromhex(journal.encryption_salt)).read(SEGMENT + 4096)
+
+    resumed = UploadJournal.load(journal.path)
+    encrypted = open_encrypted_stream(io.BytesIO(data), ENCRYPTION_CHACHA20, PASSPHRASE, bytes.fromhex(resumed.encryption_salt)).read()
+
+    # Same key and nonces: the bytes already uploaded line up with the resumed stream
+    assert encrypted[:len(sent)] == sent
+    assert decrypt(encrypted) == data
+    assert encrypt(data, salt=new_encryption_salt()) != encrypted
+
+
+def test_decrypt_command_restores_the_archive(tmp_path):
+    data = random.Random(8).randbytes(SEGMENT + 1)
+    encrypted_path = tmp_path / 'backup.tar.enc'
+    encrypted_path.write_bytes(encrypt(data, ENCRYPTION_AES_GCM))
+    output_path = tmp_path / 'backup.tar'
+
+    def run(passphrase):
+        return subprocess.run(
+            [sys.executable, str(SCRIPT), 'decrypt', str(encrypted_path), str(output_path)],
+            env={**os.environ, 'ENCRYPTION_KEY': passphrase}, capture_output=True, text=True, timeout=60
+        )
+
+    restored = run(PASSPHRASE)
+    assert restored.returncode == 0, restored.stderr
+    assert output_path.read_bytes() == data
+
+    rejected = run('another passphrase')
+    assert rejected.returncode == 1
+    assert 'Segment 0 failed authentication' in rejected.stderr
+
+    usage = subprocess.run([sys.executable, str(SCRIPT), 'encrypt'], capture_output=True, text=True, timeout=60)
+    assert usage.returncode == 1 and 'Usage' in usage.stderr
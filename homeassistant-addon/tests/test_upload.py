@@ -0,0 +1,71 @@
+"""Parallel fixed-offset chunk uploads against the stand-in server"""
+import io
+import random
+
+import pytest
+
+import main
+from upload_journal import UploadJournal
+from upload_pipeline import UploadPipeline
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def connector_options():
+    return {'UPLOAD_PARALLELISM': 4, 'CHUNK_SIZE_MIN': 1 * MB, 'CHUNK_SIZE_MAX': 2 * MB}
+
+
+def test_parallel_chunks_are_stored_by_offset(server, connector):
+    data = random.Random(1).randbytes(16 * MB + 12345)
+    # The first chunk finishes last
+    server.slow_offsets.add(0)
+
+    backup_id = connector._upload_source('slug', io.BytesIO(data), len(data), '2025.10.0', 'scheduled')
+
+    assert server.backups[backup_id]['status'] == 'completed'
+    assert server.stored_offsets[-1] == 0
+    assert server.assemble(backup_id) == data
+
+
+def test_resume_reuses_the_offsets_of_parts_stored_without_an_answer(server, connector, monkeypatch):
+    monkeypatch.setattr(main, 'ADAPTIVE_CHUNK_SIZE', True)
+    monkeypatch.setattr(main, 'UPLOAD_PARALLELISM', 2)
+    monkeypatch.setattr(main, 'UPLOAD_CHUNK_RETRIES', 0)
+    monkeypatch.setattr(main, 'CHUNK_SIZE_MAX', 8 * MB)
+    data = random.Random(2).randbytes(24 * MB)
+    # Chunk 7 fails, chunk 8 is stored but its answer is lost
+    server.fail_chunks.update({7: False, 8: True})
+
+    assert connector._upload_source('slug', io.BytesIO(data), len(data), '2025.10.0', 'scheduled') is None
+    journal = UploadJournal.load(connector.upload_journal_path)
+    sent = dict(journal.planned)
+    assert 8 in sent and 8 not in journal.acknowledged
+
+    journal.attempts += 1
+    backup_id = connector._upload_source('slug', io.BytesIO(data), len(data), '2025.10.0', 'scheduled', journal)
+
+    # Every chunk of the first attempt is sent again with the same boundaries, so no stale part is left over
+    parts = server.backups[backup_id]['parts']
+    assert all(len(parts[offset]) == length for offset, length in sent.values())
+    assert server.assemble(backup_id) == data
+
+
+def test_stream_ending_before_the_snapshot_size_is_not_completed(server, connector):
+    data = random.Random(3).randbytes(8 * MB)
+    # The download was cut off partway through a chunk
+    truncated = io.BytesIO(data[:5 * MB + 7])
+
+    assert connector._upload_source('slug', truncated, len(data), '2025.10.0', 'scheduled') is None
+
+    backup = next(iter(server.backups.values()))
+    assert backup['status'] == 'uploading'
+    assert UploadJournal.load(connector.upload_journal_path).file_size == len(data)
+
+
+def test_pipeline_fails_a_stream_shorter_than_its_size():
+    pipeline = UploadPipeline(io.BytesIO(bytes(1000)), 256, total_size=2000)
+
+    assert pipeline.run(lambda chunk: None) is False
+
+    assert pipeline.error == 'Snapshot read failed: stream ended after 1000 of 2000 bytes'
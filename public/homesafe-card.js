@@ -11,6 +11,9 @@ class HomeSafeCard extends HTMLElement {
     this._backups = [];
     this._loading = true;
     this._error = null;
+    this._job = null;
+    this._jobTimer = null;
+    this._status = null;
   }
 
   setConfig(config) {
@@ -34,27 +37,23 @@ class HomeSafeCard extends HTMLElement {
     return 'https://iagsshcczgmjdrdweirb.supabase.co/functions/v1/backup-list-api-key';
   }
 
+  getAddonUrl() {
+    return 'http://homeassistant.local:8099';
+  }
+
+  disconnectedCallback() {
+    clearTimeout(this._jobTimer);
+  }
+
   async loadBackups() {
     this._loading = true;
     this._error = null;
     this.render();
 
+    // The add-on serves cached copies with ETags, so open dashboards cost nothing upstream
+    this.loadStatus();
     try {
-      const response = await fetch(this.getApiUrl(), {
-        method: 'GET',
-        headers: {
-          'x-api-key': this._config.api_key,
-          'Content-Type': 'application/json'
-        }
-      });
-      
-      if (!response.ok) {
-        const errorData = await response.json().catch(() => ({}));
-        throw new Error(errorData.error || `HTTP ${response.status}`);
-      }
-      
-      const data = await response.json();
-      this._backups = (data.backups || []).slice(0, 5); // Show only 5 most recent
+      this._backups = (await this.fetchBackups()).slice(0, 5); // Show only 5 most recent
     } catch (error) {
       this._error = error.message || 'Cannot connect to HomeSafe API';
       console.error('Error loading backups:', error);
@@ -64,6 +63,45 @@ class HomeSafeCard extends HTMLElement {
     this.render();
   }
 
+  async fetchBackups() {
+    try {
+      const response = await fetch(`${this.getAddonUrl()}/api/backups`);
+      const data = await response.json();
+      if (data.success) {
+        return data.backups || [];
+      }
+    } catch (error) {
+      console.warn('Add-on backup list unavailable, asking HomeSafe directly:', error);
+    }
+
+    const response = await fetch(this.getApiUrl(), {
+      method: 'GET',
+      headers: {
+        'x-api-key': this._config.api_key,
+        'Content-Type': 'application/json'
+      }
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(errorData.error || `HTTP ${response.status}`);
+    }
+
+    const data = await response.json();
+    return data.backups || [];
+  }
+
+  async loadStatus() {
+    try {
+      const response = await fetch(`${this.getAddonUrl()}/api/status`);
+      const data = await response.json();
+      this._status = data.success ? data.status : null;
+    } catch (error) {
+      this._status = null;
+    }
+    this.render();
+  }
+
   async triggerBackup() {
     if (this._loading) return;
     
@@ -71,15 +109,18 @@ class HomeSafeCard extends HTMLElement {
     this.render();
 
     try {
-      const response = await fetch('http://homeassistant.local:8099/api/backup/trigger', {
+      const response = await fetch(`${this.getAddonUrl()}/api/backup/trigger`, {
         method: 'POST'
       });
       const data = await response.json();
       
       if (data.success) {
-        alert('Backup iniciado com sucesso!');
-        // Reload backups after 5 seconds
-        setTimeout(() => this.loadBackups(), 5000);
+        if (!data.coalesced) {
+          alert('Backup iniciado com sucesso!');
+        }
+        // Follow the job until it finishes, then reload the list once
+        this._job = data.job;
+        this.pollJob(data.job_id);
       } else {
         alert('Erro ao iniciar backup: ' + data.error);
       }
@@ -91,6 +132,93 @@ class HomeSafeCard extends HTMLElement {
     this.render();
   }
 
+  async pollJob(jobId) {
+    clearTimeout(this._jobTimer);
+
+    try {
+      const response = await fetch(`${this.getAddonUrl()}/api/backup/jobs/${jobId}`);
+      const data = await response.json();
+      if (!data.success) {
+        this._job = null;
+        this.render();
+        return;
+      }
+      this._job = data.job;
+    } catch (error) {
+      console.error('Error polling backup job:', error);
+    }
+
+    this.render();
+
+    if (this._job && (this._job.status === 'succeeded' || this._job.status === 'failed')) {
+      this.loadBackups();
+      return;
+    }
+    this._jobTimer = setTimeout(() => this.pollJob(jobId), 3000);
+  }
+
+  getPhaseLabel(phase) {
+    switch (phase) {
+      case 'queued':
+        return 'Em fila';
+      case 'waiting_for_slot':
+        return 'À espera de vez';
+      case 'resuming':
+        return 'A retomar upload';
+      case 'creating_snapshot':
+        return 'A criar snapshot';
+      case 'downloading':
+        return 'A ler snapshot';
+      case 'indexing':
+        return 'A comparar com o backup anterior';
+      case 'uploading':
+        return 'A enviar';
+      case 'finalizing':
+        return 'A finalizar';
+      case 'cleanup':
+        return 'A limpar';
+      case 'github_sync':
+        return 'A sincronizar GitHub';
+      case 'succeeded':
+        return 'Concluido';
+      case 'failed':
+        return 'Falhou';
+      default:
+        return phase;
+    }
+  }
+
+  renderJob() {
+    const job = this._job;
+    if (!job) return '';
+
+    const progress = job.progress !== null ? ` ${job.progress}%` : '';
+    const speed = job.throughput_bytes_per_sec
+      ? ` &middot; ${(job.throughput_bytes_per_sec / (1024 * 1024)).toFixed(1)} MB/s`
+      : '';
+
+    return `
+      <div class="job-status ${job.status}">
+        <div>${this.getPhaseLabel(job.phase)}${progress}${speed}</div>
+        ${job.progress !== null ? `<div class="job-bar"><div style="width: ${job.progress}%"></div></div>` : ''}
+        ${job.error ? `<div class="job-error">${job.error}</div>` : ''}
+      </div>
+    `;
+  }
+
+  renderStatus() {
+    const status = this._status;
+    if (!status) return '';
+
+    const lastRun = status.last_run;
+    return `
+      <div class="status-line">
+        ${status.next_backup ? `<span>&#9200; Próximo: ${this.formatDate(status.next_backup)}</span>` : ''}
+        ${lastRun ? `<span>${lastRun.status === 'succeeded' ? '&#9989;' : '&#10060;'} Último: ${this.formatDate(lastRun.finished_at)}</span>` : ''}
+      </div>
+    `;
+  }
+
   formatDate(dateString) {
     const date = new Date(dateString);
     return date.toLocaleString('pt-PT', {
@@ -220,6 +348,37 @@ class HomeSafeCard extends HTMLElement {
           font-size: 0.75rem;
           font-weight: 500;
         }
+        .job-status {
+          padding: 12px;
+          margin-bottom: 16px;
+          background: var(--secondary-background-color);
+          border-radius: 8px;
+          color: var(--primary-text-color);
+          font-size: 0.9rem;
+        }
+        .job-bar {
+          height: 6px;
+          margin-top: 8px;
+          background: var(--divider-color);
+          border-radius: 3px;
+          overflow: hidden;
+        }
+        .job-bar div {
+          height: 100%;
+          background: var(--primary-color);
+        }
+        .job-error {
+          margin-top: 4px;
+          color: var(--error-color, #e74c3c);
+        }
+        .status-line {
+          display: flex;
+          gap: 12px;
+          flex-wrap: wrap;
+          margin-bottom: 12px;
+          font-size: 0.85rem;
+          color: var(--secondary-text-color);
+        }
         .empty-state {
           text-align: center;
           padding: 40px 20px;
@@ -243,6 +402,10 @@ class HomeSafeCard extends HTMLElement {
           </button>
         </div>
 
+        ${this.renderStatus()}
+
+        ${this.renderJob()}
+
         ${this._loading ? `
           <div class="loading">
             <div>&#8987; A carregar backups...</div>
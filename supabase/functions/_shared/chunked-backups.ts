@@ -0,0 +1,193 @@
+// Backups are not always stored as one object. Content-defined chunks live
+// once per user under their content hash, and other uploads keep each chunk
+// as a part named after its offset. Either way the backup is the ordered
+// object list in `${storage_path}.manifest.json`.
+
+// Rows per PostgREST filter and objects per storage list or remove call
+const BATCH_SIZE = 500;
+
+export interface BackupObject {
+  path: string;
+  length: number;
+}
+
+export function chunkPath(userId: string, chunkHash: string): string {
+  return `${userId}/chunks/${chunkHash}`;
+}
+
+export function partsFolder(storagePath: string): string {
+  return `${storagePath}.parts`;
+}
+
+export function partPath(storagePath: string, offset: number): string {
+  return `${partsFolder(storagePath)}/${String(offset).padStart(16, '0')}`;
+}
+
+export function manifestPath(storagePath: string): string {
+  return `${storagePath}.manifest.json`;
+}
+
+function batches<T>(items: T[]): T[][] {
+  const result: T[][] = [];
+  for (let start = 0; start < items.length; start += BATCH_SIZE) {
+    result.push(items.slice(start, start + BATCH_SIZE));
+  }
+  return result;
+}
+
+// Ordered objects of a backup stored in pieces, or null for a single-object backup
+export async function readManifest(supabase: any, backup: { user_id: string, storage_path: string }): Promise<BackupObject[] | null> {
+  const { data, error } = await supabase.storage
+    .from('backups')
+    .download(manifestPath(backup.storage_path));
+
+  if (error || !data) return null;
+  const manifest = JSON.parse(await data.text());
+  if (Array.isArray(manifest.chunks)) {
+    return manifest.chunks.map(([chunkHash, , length]: [string, number, number]) => ({ path: chunkPath(backup.user_id, chunkHash), length }));
+  }
+  if (Array.isArray(manifest.parts)) {
+    return manifest.parts.map(([offset, length]: [number, number]) => ({ path: partPath(backup.storage_path, offset), length }));
+  }
+  return null;
+}
+
+// Storage objects that make up a backup, in order
+export async function backupObjectPaths(supabase: any, backup: { user_id: string, storage_path: string }): Promise<string[]> {
+  const objects = await readManifest(supabase, backup);
+  if (!objects) return [backup.storage_path];
+  return objects.map((object) => object.path);
+}
+
+// Uploaded parts of a backup as [offset, length], ordered by offset
+export async function listParts(supabase: any, storagePath: string): Promise<[number, number][]> {
+  const parts: [number, number][] = [];
+  for (let offset = 0; ; offset += BATCH_SIZE) {
+    const { data, error } = await supabase.storage
+      .from('backups')
+      .list(partsFolder(storagePath), { limit: BATCH_SIZE, offset, sortBy: { column: 'name', order: 'asc' } });
+    if (error) throw new Error(`Failed to list parts: ${error.message}`);
+    for (const object of data || []) {
+      parts.push([Number(object.name), object.metadata?.size ?? 0]);
+    }
+    if (!data || data.length < BATCH_SIZE) break;
+  }
+  return parts.sort((a, b) => a[0] - b[0]);
+}
+
+// Remove every uploaded part of a backup (a failed upload or a deleted backup)
+export async function removeParts(supabase: any, storagePath: string): Promise<void> {
+  const parts = await listParts(supabase, storagePath);
+  for (const batch of batches(parts)) {
+    const { error } = await supabase.storage
+      .from('backups')
+      .remove(batch.map(([offset]) => partPath(storagePath, offset)));
+    if (error) console.error('Failed to delete parts:', error);
+  }
+}
+
+// The backup's bytes, fetched one object at a time as the reader pulls them
+export function streamObjects(supabase: any, paths: string[]): ReadableStream<Uint8Array> {
+  let index = 0;
+  return new ReadableStream({
+    async pull(controller) {
+      if (index >= paths.length) {
+        controller.close();
+        return;
+      }
+      const path = paths[index++];
+      const { data, error } = await supabase.storage
+        .from('backups')
+        .download(path);
+
+      if (error || !data) {
+        controller.error(new Error(`Failed to read ${path}: ${error?.message || 'not found'}`));
+        return;
+      }
+      controller.enqueue(new Uint8Array(await data.arrayBuffer()));
+    }
+  });
+}
+
+// The whole backup as one Blob (the parts are not copied again)
+export async function downloadBackup(supabase: any, backup: { user_id: string, storage_path: string }): Promise<Blob | null> {
+  const parts: Blob[] = [];
+  for (const path of await backupObjectPaths(supabase, backup)) {
+    const { data, error } = await supabase.storage
+      .from('backups')
+      .download(path);
+
+    if (error || !data) {
+      console.error(`Failed to download ${path}:`, error);
+      return null;
+    }
+    parts.push(data);
+  }
+  return new Blob(parts);
+}
+
+// Record the chunks of a completed deduplicated backup; returns the hashes that are no longer stored
+export async function addChunkRefs(supabase: any, userId: string, backupId: string, chunkHashes: string[]): Promise<string[]> {
+  const unique = [...new Set(chunkHashes)];
+
+  for (const batch of batches(unique)) {
+    const { error } = await supabase
+      .from('backup_chunk_refs')
+      .upsert(
+        batch.map((chunkHash) => ({ backup_id: backupId, user_id: userId, chunk_hash: chunkHash })),
+        { onConflict: 'backup_id,chunk_hash', ignoreDuplicates: true }
+      );
+    if (error) throw new Error(`Failed to record chunk references: ${error.message}`);
+  }
+
+  // A chunk reported by action=have may have been pruned before this reference existed
+  const stored = new Set<string>();
+  for (const batch of batches(unique)) {
+    const { data, error } = await supabase
+      .from('backup_chunks')
+      .select('chunk_hash')
+      .eq('user_id', userId)
+      .in('chunk_hash', batch);
+    if (error) throw new Error(`Failed to look up chunks: ${error.message}`);
+    for (const chunk of data || []) stored.add(chunk.chunk_hash);
+  }
+  return unique.filter((chunkHash) => !stored.has(chunkHash));
+}
+
+// Remove the storage objects of backups that are being deleted, including
+// every chunk no remaining backup references; returns the number of chunks removed
+export async function removeBackupObjects(supabase: any, userId: string, backups: { id: string, storage_path: string }[]): Promise<number> {
+  if (backups.length === 0) return 0;
+
+  const paths = backups.flatMap((backup) => [backup.storage_path, manifestPath(backup.storage_path)]);
+  for (const batch of batches(paths)) {
+    const { error } = await supabase.storage.from('backups').remove(batch);
+    if (error) console.error('Failed to delete backup objects:', error);
+  }
+  for (const backup of backups) {
+    try {
+      await removeParts(supabase, backup.storage_path);
+    } catch (partsError) {
+      console.error('Failed to delete parts:', partsError);
+    }
+  }
+
+  // Chunks are unindexed by the database first, so action=have never reports one being removed
+  const { data: released, error } = await supabase.rpc('release_backup_chunks', {
+    _user_id: userId,
+    _backup_ids: backups.map((backup) => backup.id)
+  });
+  if (error) {
+    console.error('Failed to release chunk references:', error);
+    return 0;
+  }
+
+  const chunkHashes: string[] = released || [];
+  for (const batch of batches(chunkHashes)) {
+    const { error: storageError } = await supabase.storage
+      .from('backups')
+      .remove(batch.map((chunkHash) => chunkPath(userId, chunkHash)));
+    if (storageError) console.error('Failed to delete chunks:', storageError);
+  }
+  return chunkHashes.length;
+}
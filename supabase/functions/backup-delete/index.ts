@@ -1,5 +1,6 @@
 import { serve } from "https://deno.land/std@0.168.0/http/server.ts";
 import { createClient } from "https://esm.sh/@supabase/supabase-js@2";
+import { removeBackupObjects } from "../_shared/chunked-backups.ts";
 
 const corsHeaders = {
   'Access-Control-Allow-Origin': '*',
@@ -78,15 +79,11 @@ serve(async (req) => {
 
     // Delete from storage (only if backup was successfully uploaded)
     if (backup.status === 'completed') {
+      // Deduplicated chunks still referenced by other backups are kept;
+      // storage failures are logged and the backup is still marked as deleted
       console.log('[backup-delete] Deleting from storage:', backup.storage_path);
-      const { error: storageError } = await supabase.storage
-        .from('backups')
-        .remove([backup.storage_path]);
-
-      if (storageError) {
-        console.error('[backup-delete] Failed to delete from storage:', storageError);
-        // Continue anyway - we still want to mark as deleted in DB
-      }
+      const chunksRemoved = await removeBackupObjects(supabase, user.id, [backup]);
+      console.log('[backup-delete] Unreferenced chunks removed:', chunksRemoved);
     } else {
       console.log('[backup-delete] Skipping storage deletion for failed/incomplete backup');
     }
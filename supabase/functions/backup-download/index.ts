@@ -1,11 +1,75 @@
 import { serve } from "https://deno.land/std@0.168.0/http/server.ts";
 import { createClient } from "https://esm.sh/@supabase/supabase-js@2.58.0";
+import { readManifest, streamObjects } from "../_shared/chunked-backups.ts";
 
 const corsHeaders = {
   'Access-Control-Allow-Origin': '*',
   'Access-Control-Allow-Headers': 'authorization, x-client-info, apikey, content-type',
 };
 
+// Lifetime of download links, as for signed storage URLs
+const LINK_TTL_SECONDS = 3600;
+
+// HMAC-SHA256 of a download link, keyed with the service role key
+async function signLink(backupId: string, expires: number): Promise<string> {
+  const encoder = new TextEncoder();
+  const key = await crypto.subtle.importKey(
+    'raw',
+    encoder.encode(Deno.env.get('SUPABASE_SERVICE_ROLE_KEY')!),
+    { name: 'HMAC', hash: 'SHA-256' },
+    false,
+    ['sign']
+  );
+  const signature = await crypto.subtle.sign('HMAC', key, encoder.encode(`${backupId}:${expires}`));
+  return Array.from(new Uint8Array(signature)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Backups stored in pieces have no single storage object: the signed link streams the pieces in order
+async function streamSignedDownload(supabase: any, url: URL) {
+  const backupId = url.searchParams.get('backup_id') || '';
+  const expires = Number(url.searchParams.get('expires'));
+  const signature = url.searchParams.get('signature') || '';
+
+  if (!backupId || !expires || expires < Date.now() / 1000 || signature !== await signLink(backupId, expires)) {
+    return new Response(
+      JSON.stringify({ error: 'Invalid or expired download link' }),
+      { status: 403, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  const { data: backup, error: backupError } = await supabase
+    .from('backups')
+    .select('user_id, storage_path, filename, status')
+    .eq('id', backupId)
+    .single();
+
+  if (backupError || !backup || backup.status !== 'completed') {
+    return new Response(
+      JSON.stringify({ error: 'Backup not found' }),
+      { status: 404, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  const objects = await readManifest(supabase, backup);
+  if (!objects) {
+    return new Response(
+      JSON.stringify({ error: 'Backup manifest not found' }),
+      { status: 404, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  const size = objects.reduce((sum, object) => sum + object.length, 0);
+  return new Response(streamObjects(supabase, objects.map((object) => object.path)), {
+    status: 200,
+    headers: {
+      ...corsHeaders,
+      'Content-Type': 'application/octet-stream',
+      'Content-Length': String(size),
+      'Content-Disposition': `attachment; filename="${backup.filename}"`
+    }
+  });
+}
+
 serve(async (req) => {
   if (req.method === 'OPTIONS') {
     return new Response(null, { headers: corsHeaders });
@@ -16,6 +80,11 @@ serve(async (req) => {
     const supabaseServiceKey = Deno.env.get('SUPABASE_SERVICE_ROLE_KEY')!;
     const supabase = createClient(supabaseUrl, supabaseServiceKey);
 
+    // Signed links are opened by the browser without an Authorization header
+    if (req.method === 'GET') {
+      return await streamSignedDownload(supabase, new URL(req.url));
+    }
+
     // Get authenticated user
     const authHeader = req.headers.get('Authorization');
     if (!authHeader) {
@@ -48,7 +117,7 @@ serve(async (req) => {
     // Get backup details
     const { data: backup, error: backupError } = await supabase
       .from('backups')
-      .select('storage_path, filename, status')
+      .select('user_id, storage_path, filename, status')
       .eq('id', backupId)
       .eq('user_id', user.id)
       .single();
@@ -67,21 +136,32 @@ serve(async (req) => {
       );
     }
 
-    // Generate signed download URL from Supabase Storage (valid for 1 hour)
-    const { data: signedData, error: signedError } = await supabase.storage
-      .from('backups')
-      .createSignedUrl(backup.storage_path, 3600);
-
-    if (signedError || !signedData) {
-      console.error('Failed to create signed URL:', signedError);
-      return new Response(
-        JSON.stringify({ error: 'Failed to generate download URL' }),
-        { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
-      );
+    let downloadUrl: string;
+    if (!await readManifest(supabase, backup)) {
+      // Generate signed download URL from Supabase Storage (valid for 1 hour)
+      const { data: signedData, error: signedError } = await supabase.storage
+        .from('backups')
+        .createSignedUrl(backup.storage_path, LINK_TTL_SECONDS);
+
+      if (signedError || !signedData) {
+        console.error('Failed to create signed URL:', signedError);
+        return new Response(
+          JSON.stringify({ error: 'Failed to generate download URL' }),
+          { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+        );
+      }
+
+      downloadUrl = signedData.signedUrl;
+    } else {
+      // Reassembled from its chunks or parts by this function (valid for 1 hour)
+      const expires = Math.floor(Date.now() / 1000) + LINK_TTL_SECONDS;
+      const link = new URL(`${supabaseUrl}/functions/v1/backup-download`);
+      link.searchParams.set('backup_id', backupId);
+      link.searchParams.set('expires', String(expires));
+      link.searchParams.set('signature', await signLink(backupId, expires));
+      downloadUrl = link.toString();
     }
 
-    const downloadUrl = signedData.signedUrl;
-
     // Log download using secure function
     await supabase.rpc('insert_backup_log', {
       _user_id: user.id,
@@ -3,9 +3,17 @@ import { createClient } from "https://esm.sh/@supabase/supabase-js@2";
 
 const corsHeaders = {
   'Access-Control-Allow-Origin': '*',
-  'Access-Control-Allow-Headers': 'authorization, x-client-info, apikey, content-type, x-api-key',
+  'Access-Control-Allow-Headers': 'authorization, x-client-info, apikey, content-type, x-api-key, if-none-match',
+  'Access-Control-Expose-Headers': 'etag',
 };
 
+// Weak ETag over the response body so pollers can revalidate with If-None-Match
+async function bodyEtag(body: string): Promise<string> {
+  const hashBuffer = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(body));
+  const hashHex = Array.from(new Uint8Array(hashBuffer)).map(b => b.toString(16).padStart(2, '0')).join('');
+  return `W/"${hashHex.substring(0, 32)}"`;
+}
+
 serve(async (req) => {
   if (req.method === 'OPTIONS') {
     return new Response(null, { headers: corsHeaders });
@@ -97,14 +105,18 @@ serve(async (req) => {
       .update({ last_used_at: new Date().toISOString() })
       .eq('id', matchedKey.id);
 
+    // ?latest=1 returns only the newest completed backup (used by the add-on's version check)
+    const latestOnly = new URL(req.url).searchParams.get('latest') === '1';
+
     // Get user's backups
-    const { data: backups, error: backupsError } = await supabase
+    let query = supabase
       .from('backups')
-      .select('*')
-      .eq('user_id', matchedKey.user_id)
-      .neq('status', 'deleted')
+      .select(latestOnly ? 'id, ha_version, created_at, completed_at, status' : '*')
+      .eq('user_id', matchedKey.user_id);
+    query = latestOnly ? query.eq('status', 'completed') : query.neq('status', 'deleted');
+    const { data: backups, error: backupsError } = await query
       .order('created_at', { ascending: false })
-      .limit(10);
+      .limit(latestOnly ? 1 : 10);
 
     if (backupsError) {
       console.error('Failed to fetch backups:', backupsError);
@@ -116,9 +128,15 @@ serve(async (req) => {
 
     console.log(`Returning ${backups?.length || 0} backups for user ${matchedKey.user_id}`);
 
+    const body = JSON.stringify({ backups: backups || [] });
+    const etag = await bodyEtag(body);
+    if (req.headers.get('if-none-match') === etag) {
+      return new Response(null, { status: 304, headers: { ...corsHeaders, 'ETag': etag } });
+    }
+
     return new Response(
-      JSON.stringify({ backups: backups || [] }),
-      { status: 200, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      body,
+      { status: 200, headers: { ...corsHeaders, 'Content-Type': 'application/json', 'ETag': etag } }
     );
 
   } catch (error) {
@@ -1,6 +1,7 @@
 import { serve } from "https://deno.land/std@0.168.0/http/server.ts";
 import { createClient } from "https://esm.sh/@supabase/supabase-js@2";
 import { S3Client, PutObjectCommand } from "https://esm.sh/@aws-sdk/client-s3@3";
+import { downloadBackup } from "../_shared/chunked-backups.ts";
 
 const corsHeaders = {
   'Access-Control-Allow-Origin': '*',
@@ -65,14 +66,11 @@ serve(async (req) => {
       );
     }
 
-    // Download backup file from Supabase Storage
-    const { data: fileData, error: downloadError } = await supabase
-      .storage
-      .from('backups')
-      .download(backup.storage_path);
+    // Download backup file from Supabase Storage (deduplicated backups are reassembled from their chunks)
+    const fileData = await downloadBackup(supabase, backup);
 
-    if (downloadError || !fileData) {
-      console.error('Failed to download backup:', downloadError);
+    if (!fileData) {
+      console.error('Failed to download backup:', backup.storage_path);
       return new Response(
         JSON.stringify({ error: 'Failed to download backup file' }),
         { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
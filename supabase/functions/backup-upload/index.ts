@@ -1,5 +1,6 @@
 import { serve } from "https://deno.land/std@0.168.0/http/server.ts";
 import { createClient } from "https://esm.sh/@supabase/supabase-js@2";
+import { addChunkRefs, chunkPath, listParts, manifestPath, partPath, removeBackupObjects, removeParts } from "../_shared/chunked-backups.ts";
 
 const corsHeaders = {
   'Access-Control-Allow-Origin': '*',
@@ -16,6 +17,12 @@ async function hashApiKey(apiKey: string): Promise<string> {
   return hashHex;
 }
 
+// Hex SHA-256 of raw bytes, used to verify uploaded chunks
+async function sha256Hex(data: Uint8Array): Promise<string> {
+  const hashBuffer = await crypto.subtle.digest('SHA-256', data);
+  return Array.from(new Uint8Array(hashBuffer)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
 serve(async (req) => {
   console.log('[backup-upload] Request received:', req.method, req.url);
   
@@ -80,6 +87,12 @@ serve(async (req) => {
     } else if (action === 'fail') {
       // Mark upload as failed
       return await handleFail(supabase, userId, req);
+    } else if (action === 'have') {
+      // Report which deduplicated chunks are already stored
+      return await handleHave(supabase, userId, req);
+    } else if (action === 'prune') {
+      // Delete an instance's backups that fall outside its retention policy
+      return await handlePrune(supabase, userId, req);
     } else {
       return new Response(
         JSON.stringify({ error: 'Invalid action' }),
@@ -102,7 +115,7 @@ async function handleInit(supabase: any, userId: string, req: Request) {
   console.log('[backup-upload] Handling init...');
   
   const body = await req.json();
-  const { file_size, ha_version, backup_trigger, instance_name, instance_id } = body;
+  const { file_size, ha_version, backup_trigger, instance_name, instance_id, codec, encryption, backup_type, base_backup_id, backup_tier } = body;
   
   if (!file_size) {
     return new Response(
@@ -192,8 +205,13 @@ async function handleInit(supabase: any, userId: string, req: Request) {
     }
   }
 
-  // Create backup record
-  const filename = `backup-${Date.now()}.tar`;
+  // Create backup record (codec marks archives recompressed by the add-on)
+  const extension = codec === 'zstd' ? 'tar.zst' : 'tar';
+  // Archives encrypted by the add-on are opaque here; the suffix tells restores to decrypt first
+  const encrypted = !!encryption && encryption !== 'none';
+  // Incremental archives hold only changed members plus homesafe-manifest.json
+  const incremental = backup_type === 'incremental';
+  const filename = `backup-${incremental ? 'incremental-' : ''}${Date.now()}.${extension}${encrypted ? '.enc' : ''}`;
   const storagePath = `${userId}/${Date.now()}-${filename}`;
 
   const { data: backup, error: backupError } = await supabase
@@ -207,7 +225,11 @@ async function handleInit(supabase: any, userId: string, req: Request) {
       backup_trigger: backup_trigger || 'manual',
       status: 'uploading',
       instance_name: instance_name || null,
-      instance_id: instance_id || null
+      instance_id: instance_id || null,
+      backup_type: incremental ? 'incremental' : 'full',
+      base_backup_id: incremental ? base_backup_id || null : null,
+      backup_tier: backup_tier || null,
+      encryption: encrypted ? encryption : 'none'
     })
     .select()
     .single();
@@ -238,6 +260,8 @@ async function handleChunk(supabase: any, userId: string, req: Request) {
   const backupId = url.searchParams.get('backup_id');
   const chunkNumber = url.searchParams.get('chunk_number');
   const offset = url.searchParams.get('offset');
+  const chunkHash = url.searchParams.get('chunk_hash');
+  const expectedSha256 = url.searchParams.get('sha256') || chunkHash;
 
   if (!backupId || !chunkNumber || !offset) {
     return new Response(
@@ -268,11 +292,29 @@ async function handleChunk(supabase: any, userId: string, req: Request) {
   
   console.log(`[backup-upload] Received chunk ${chunkNumber} of ${chunkBytes.length} bytes at offset ${offset}`);
 
-  // Upload chunk to storage using upsert to append to existing file
+  // Reject chunks damaged in transit before they overwrite anything; the add-on retries them
+  if (expectedSha256) {
+    const actualSha256 = await sha256Hex(chunkBytes);
+    if (actualSha256 !== expectedSha256.toLowerCase()) {
+      console.error(`[backup-upload] Chunk ${chunkNumber} hash mismatch: expected ${expectedSha256}, got ${actualSha256}`);
+      return new Response(
+        JSON.stringify({ error: 'Chunk hash mismatch', expected: expectedSha256, actual: actualSha256 }),
+        { status: 422, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
+  }
+
+  // Deduplicated chunks are stored once per user under their content hash,
+  // the backup itself is described by the manifest sent with action=complete.
+  // Other chunks are parts named after their offset, so chunks uploaded in
+  // parallel or retried never overwrite each other; complete lists them in order.
+  const objectPath = chunkHash ? chunkPath(userId, chunkHash) : partPath(backup.storage_path, Number(offset));
+
+  // Upload chunk to storage (upsert replaces an earlier attempt of the same chunk)
   const { error: uploadError } = await supabase.storage
     .from('backups')
-    .upload(backup.storage_path, chunkBytes, {
-      contentType: 'application/x-tar',
+    .upload(objectPath, chunkBytes, {
+      contentType: chunkHash ? 'application/octet-stream' : 'application/x-tar',
       cacheControl: '3600',
       upsert: true
     });
@@ -285,6 +327,25 @@ async function handleChunk(supabase: any, userId: string, req: Request) {
     );
   }
 
+  if (chunkHash) {
+    const { error: indexError } = await supabase
+      .from('backup_chunks')
+      .upsert({
+        user_id: userId,
+        chunk_hash: chunkHash,
+        size_bytes: chunkBytes.length,
+        storage_path: objectPath
+      }, { onConflict: 'user_id,chunk_hash' });
+
+    if (indexError) {
+      console.error('[backup-upload] Failed to index chunk:', indexError);
+      return new Response(
+        JSON.stringify({ error: 'Failed to index chunk', details: indexError.message }),
+        { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
+  }
+
   console.log(`[backup-upload] Chunk ${chunkNumber} uploaded successfully`);
   return new Response(
     JSON.stringify({ success: true }),
@@ -296,7 +357,7 @@ async function handleComplete(supabase: any, userId: string, req: Request) {
   console.log('[backup-upload] Handling complete...');
   
   const body = await req.json();
-  const { backup_id } = body;
+  const { backup_id, file_size, manifest, sha256 } = body;
 
   if (!backup_id) {
     return new Response(
@@ -320,12 +381,122 @@ async function handleComplete(supabase: any, userId: string, req: Request) {
     );
   }
 
-  // Update backup status to completed
+  // The size recorded as completed: the final size when the add-on
+  // recompressed the archive (init only knew the uncompressed size)
+  const completedSize = file_size || backup.size_bytes;
+
+  // Archives sent as they are keep the size announced at init; any other size
+  // means the add-on's read of the snapshot was cut short
+  const transformed = backup.filename.includes('.tar.zst') || (!!backup.encryption && backup.encryption !== 'none');
+  if (!transformed && Number(completedSize) !== Number(backup.size_bytes)) {
+    console.error(`[backup-upload] ${backup_id} completed with ${completedSize} bytes, init announced ${backup.size_bytes}`);
+    return new Response(
+      JSON.stringify({ error: 'Size mismatch', received_bytes: completedSize, expected_bytes: backup.size_bytes }),
+      { status: 409, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  // Deduplicated uploads: reference every chunk, then store the ordered chunk list next to the backup
+  if (Array.isArray(manifest)) {
+    // The ordered chunks must cover the archive without gaps or overlaps
+    let manifestEnd = 0;
+    for (const [, offset, length] of manifest) {
+      if (offset !== manifestEnd) break;
+      manifestEnd += length;
+    }
+    if (manifestEnd !== completedSize) {
+      console.error(`[backup-upload] Manifest of ${backup_id} covers ${manifestEnd} of ${completedSize} bytes`);
+      return new Response(
+        JSON.stringify({ error: 'Upload incomplete', received_bytes: manifestEnd, expected_bytes: completedSize }),
+        { status: 409, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
+
+    let missing: string[];
+    try {
+      missing = await addChunkRefs(supabase, userId, backup_id, manifest.map((entry: any) => entry[0]));
+    } catch (refError) {
+      console.error('[backup-upload] Failed to reference chunks:', refError);
+      return new Response(
+        JSON.stringify({ error: 'Failed to reference chunks', details: (refError as Error).message }),
+        { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
+
+    // Chunks pruned after action=have reported them; the add-on uploads them again on its next attempt
+    if (missing.length > 0) {
+      console.error(`[backup-upload] ${missing.length} chunks of ${backup_id} are no longer stored`);
+      return new Response(
+        JSON.stringify({ error: 'Chunks no longer stored', missing }),
+        { status: 409, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
+
+    const { error: manifestError } = await supabase.storage
+      .from('backups')
+      .upload(manifestPath(backup.storage_path), JSON.stringify({ chunks: manifest }), {
+        contentType: 'application/json',
+        upsert: true
+      });
+
+    if (manifestError) {
+      console.error('[backup-upload] Failed to store manifest:', manifestError);
+      return new Response(
+        JSON.stringify({ error: 'Failed to store manifest', details: manifestError.message }),
+        { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
+  }
+
+  // Other uploads: the parts must cover the archive without gaps or overlaps
+  if (!Array.isArray(manifest)) {
+    let parts: [number, number][];
+    try {
+      parts = await listParts(supabase, backup.storage_path);
+    } catch (partsError) {
+      console.error('[backup-upload] Failed to list parts:', partsError);
+      return new Response(
+        JSON.stringify({ error: 'Failed to list parts', details: (partsError as Error).message }),
+        { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
+
+    let expectedOffset = 0;
+    for (const [offset, length] of parts) {
+      if (offset !== expectedOffset) break;
+      expectedOffset += length;
+    }
+    if (parts.length === 0 || expectedOffset !== completedSize) {
+      console.error(`[backup-upload] Parts of ${backup_id} cover ${expectedOffset} of ${completedSize} bytes`);
+      return new Response(
+        JSON.stringify({ error: 'Upload incomplete', received_bytes: expectedOffset, expected_bytes: completedSize }),
+        { status: 409, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
+
+    const { error: manifestError } = await supabase.storage
+      .from('backups')
+      .upload(manifestPath(backup.storage_path), JSON.stringify({ parts }), {
+        contentType: 'application/json',
+        upsert: true
+      });
+
+    if (manifestError) {
+      console.error('[backup-upload] Failed to store manifest:', manifestError);
+      return new Response(
+        JSON.stringify({ error: 'Failed to store manifest', details: manifestError.message }),
+        { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+      );
+    }
+  }
+
   await supabase
     .from('backups')
     .update({ 
       status: 'completed', 
-      completed_at: new Date().toISOString() 
+      completed_at: new Date().toISOString(),
+      size_bytes: completedSize,
+      ...(sha256 ? { sha256 } : {})
     })
     .eq('id', backup_id);
 
@@ -337,8 +508,9 @@ async function handleComplete(supabase: any, userId: string, req: Request) {
     _message: `Backup uploaded successfully: ${backup.filename}`,
     _backup_id: backup_id,
     _metadata: {
-      size_bytes: backup.size_bytes,
-      ha_version: backup.ha_version
+      size_bytes: completedSize,
+      ha_version: backup.ha_version,
+      sha256: sha256 || null
     }
   });
 
@@ -384,14 +556,25 @@ async function handleFail(supabase: any, userId: string, req: Request) {
   }
 
   // Update backup status to failed
-  await supabase
+  const { data: failed } = await supabase
     .from('backups')
     .update({ 
       status: 'failed', 
       error_message: error_message || 'Upload failed'
     })
     .eq('id', backup_id)
-    .eq('user_id', userId);
+    .eq('user_id', userId)
+    .select('storage_path')
+    .maybeSingle();
+
+  // Parts of an abandoned upload are never assembled
+  if (failed?.storage_path) {
+    try {
+      await removeParts(supabase, failed.storage_path);
+    } catch (partsError) {
+      console.error('[backup-upload] Failed to delete parts:', partsError);
+    }
+  }
 
   // Log failure using secure function
   await supabase.rpc('insert_backup_log', {
@@ -410,3 +593,159 @@ async function handleFail(supabase: any, userId: string, req: Request) {
     { status: 200, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
   );
 }
+
+async function handleHave(supabase: any, userId: string, req: Request) {
+  console.log('[backup-upload] Handling have...');
+
+  const body = await req.json();
+  const { hashes } = body;
+
+  if (!Array.isArray(hashes)) {
+    return new Response(
+      JSON.stringify({ error: 'Missing hashes' }),
+      { status: 400, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  if (hashes.length > 1000) {
+    return new Response(
+      JSON.stringify({ error: 'Too many hashes (max 1000 per request)' }),
+      { status: 400, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  const { data: stored, error } = await supabase
+    .from('backup_chunks')
+    .select('chunk_hash')
+    .eq('user_id', userId)
+    .in('chunk_hash', hashes);
+
+  if (error) {
+    console.error('[backup-upload] Failed to look up chunks:', error);
+    return new Response(
+      JSON.stringify({ error: 'Failed to look up chunks' }),
+      { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  return new Response(
+    JSON.stringify({
+      success: true,
+      have: (stored || []).map((chunk: any) => chunk.chunk_hash)
+    }),
+    { status: 200, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+  );
+}
+
+async function handlePrune(supabase: any, userId: string, req: Request) {
+  console.log('[backup-upload] Handling prune...');
+
+  const body = await req.json();
+  const { instance_id, backup_tier, max_age_days, max_count, max_size_bytes } = body;
+
+  if (!instance_id) {
+    return new Response(
+      JSON.stringify({ error: 'Missing instance_id' }),
+      { status: 400, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  // Backups never outlive the plan's retention, whatever the add-on asks for
+  const { data: subscription } = await supabase
+    .from('subscriptions')
+    .select('retention_days')
+    .eq('user_id', userId)
+    .single();
+
+  const planDays = subscription?.retention_days || 0;
+  const maxAgeDays = max_age_days > 0 && planDays > 0 ? Math.min(max_age_days, planDays) : (max_age_days || planDays);
+
+  // Each backup tier has its own policy; without a tier every backup of the instance is covered
+  let query = supabase
+    .from('backups')
+    .select('id, filename, storage_path, size_bytes, created_at, backup_type, base_backup_id')
+    .eq('user_id', userId)
+    .eq('instance_id', instance_id)
+    .eq('status', 'completed');
+  if (backup_tier) query = query.eq('backup_tier', backup_tier);
+  const { data: backups, error } = await query.order('created_at', { ascending: false });
+
+  if (error) {
+    console.error('[backup-upload] Failed to list backups for prune:', error);
+    return new Response(
+      JSON.stringify({ error: 'Failed to list backups' }),
+      { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  // Newest first while every limit holds; the newest backup is always kept
+  const now = Date.now();
+  const kept = new Set<string>();
+  let keptSize = 0;
+  for (const [position, backup] of (backups || []).entries()) {
+    keptSize += backup.size_bytes || 0;
+    const ageDays = (now - new Date(backup.created_at).getTime()) / 86400000;
+    const fits = (!maxAgeDays || ageDays <= maxAgeDays)
+      && (!max_count || position < max_count)
+      && (!max_size_bytes || keptSize <= max_size_bytes);
+    if (!fits && position > 0) break;
+    kept.add(backup.id);
+  }
+
+  // Incremental backups cannot be restored without the backups they build on
+  const byId = new Map((backups || []).map((backup: any) => [backup.id, backup]));
+  for (const id of [...kept]) {
+    let base = byId.get(id)?.base_backup_id;
+    while (base && !kept.has(base) && byId.has(base)) {
+      kept.add(base);
+      base = byId.get(base).base_backup_id;
+    }
+  }
+
+  const expired = (backups || []).filter((backup: any) => !kept.has(backup.id));
+  if (expired.length === 0) {
+    return new Response(
+      JSON.stringify({ success: true, deleted: 0, freed_bytes: 0 }),
+      { status: 200, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  // Deduplicated chunks are only removed once no kept backup references them
+  // (storage failures are logged; the backups are still marked as deleted below)
+  const chunksRemoved = await removeBackupObjects(supabase, userId, expired);
+
+  const expiredIds = expired.map((backup: any) => backup.id);
+  const { error: deleteError } = await supabase
+    .from('backups')
+    .update({ status: 'deleted' })
+    .in('id', expiredIds);
+
+  if (deleteError) {
+    console.error('[backup-upload] Failed to mark expired backups as deleted:', deleteError);
+    return new Response(
+      JSON.stringify({ error: 'Failed to delete expired backups' }),
+      { status: 500, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+    );
+  }
+
+  const freedBytes = expired.reduce((sum: number, backup: any) => sum + (backup.size_bytes || 0), 0);
+  await supabase.rpc('insert_backup_log', {
+    _user_id: userId,
+    _action: 'delete',
+    _status: 'success',
+    _message: `Retention deleted ${expired.length} backups of ${instance_id}${backup_tier ? ` (${backup_tier})` : ''}`,
+    _metadata: {
+      instance_id,
+      backup_tier: backup_tier || null,
+      backup_ids: expiredIds,
+      freed_bytes: freedBytes,
+      chunks_removed: chunksRemoved
+    }
+  });
+
+  console.log(`[backup-upload] Pruned ${expired.length} backups of ${instance_id}`);
+  return new Response(
+    JSON.stringify({ success: true, deleted: expired.length, freed_bytes: freedBytes }),
+    { status: 200, headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
+  );
+}
@@ -0,0 +1,18 @@
+-- Content-addressed chunk store for deduplicated add-on uploads
+CREATE TABLE IF NOT EXISTS public.backup_chunks (
+  user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  chunk_hash TEXT NOT NULL,
+  size_bytes BIGINT NOT NULL,
+  storage_path TEXT NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (user_id, chunk_hash)
+);
+
+-- Enable RLS
+ALTER TABLE public.backup_chunks ENABLE ROW LEVEL SECURITY;
+
+-- RLS Policies (writes happen through the backup-upload edge function)
+CREATE POLICY "Users can view their own backup chunks"
+  ON public.backup_chunks
+  FOR SELECT
+  USING (auth.uid() = user_id);
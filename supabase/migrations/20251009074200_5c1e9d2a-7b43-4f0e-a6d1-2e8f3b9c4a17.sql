@@ -0,0 +1,3 @@
+-- Incremental backups only contain changed inner archives and reference the rest
+ALTER TABLE public.backups ADD COLUMN backup_type TEXT NOT NULL DEFAULT 'full';
+ALTER TABLE public.backups ADD COLUMN base_backup_id UUID REFERENCES public.backups(id) ON DELETE SET NULL;
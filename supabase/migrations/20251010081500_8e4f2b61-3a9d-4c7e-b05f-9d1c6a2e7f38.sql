@@ -0,0 +1,2 @@
+-- SHA-256 of the uploaded archive stream, sent by the add-on with action=complete
+ALTER TABLE public.backups ADD COLUMN sha256 TEXT;
@@ -0,0 +1,2 @@
+-- AEAD scheme of archives encrypted by the add-on before upload ('none' for plain archives)
+ALTER TABLE public.backups ADD COLUMN encryption TEXT NOT NULL DEFAULT 'none';
@@ -0,0 +1,3 @@
+-- Backup tier of partial backups made by the add-on (NULL for full backups without tiers)
+ALTER TABLE public.backups ADD COLUMN backup_tier TEXT;
+CREATE INDEX idx_backups_instance_tier ON public.backups(user_id, instance_id, backup_tier, created_at DESC);
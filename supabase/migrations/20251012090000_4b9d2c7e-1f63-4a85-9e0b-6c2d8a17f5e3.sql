@@ -0,0 +1,58 @@
+-- Deduplicated chunks each backup is assembled from; a chunk is deleted once no backup references it
+CREATE TABLE IF NOT EXISTS public.backup_chunk_refs (
+  backup_id UUID NOT NULL REFERENCES public.backups(id) ON DELETE CASCADE,
+  user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  chunk_hash TEXT NOT NULL,
+  PRIMARY KEY (backup_id, chunk_hash)
+);
+CREATE INDEX idx_backup_chunk_refs_user_hash ON public.backup_chunk_refs(user_id, chunk_hash);
+
+-- Enable RLS
+ALTER TABLE public.backup_chunk_refs ENABLE ROW LEVEL SECURITY;
+
+-- RLS Policies (writes happen through the backup edge functions)
+CREATE POLICY "Users can view their own backup chunk references"
+  ON public.backup_chunk_refs
+  FOR SELECT
+  USING (auth.uid() = user_id);
+
+-- Drop the chunk references of deleted backups and unindex the chunks no other
+-- backup references; returns those chunk hashes so their objects can be removed
+CREATE OR REPLACE FUNCTION public.release_backup_chunks(
+  _user_id uuid,
+  _backup_ids uuid[]
+)
+RETURNS text[]
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  _released text[];
+BEGIN
+  WITH released AS (
+    DELETE FROM public.backup_chunk_refs
+    WHERE user_id = _user_id
+      AND backup_id = ANY(_backup_ids)
+    RETURNING chunk_hash
+  ), removed AS (
+    DELETE FROM public.backup_chunks chunk
+    WHERE chunk.user_id = _user_id
+      AND chunk.chunk_hash IN (SELECT chunk_hash FROM released)
+      -- The statement still sees the references deleted above, so they are excluded here
+      AND NOT EXISTS (
+        SELECT 1 FROM public.backup_chunk_refs ref
+        WHERE ref.user_id = _user_id
+          AND ref.chunk_hash = chunk.chunk_hash
+          AND NOT ref.backup_id = ANY(_backup_ids)
+      )
+    RETURNING chunk.chunk_hash
+  )
+  SELECT COALESCE(array_agg(chunk_hash), '{}') INTO _released FROM removed;
+
+  RETURN _released;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.release_backup_chunks FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.release_backup_chunks TO service_role;